@@ -1,6 +1,6 @@
 from django.contrib import admin
-from django.utils import timezone
-from .models import CodeSnippet, Report, Notification, UserStats
+from . import notify
+from .models import CodeSnippet, Report, Notification, UserStats, ContributorStats, Job, Blob
 
 
 @admin.register(CodeSnippet)
@@ -11,26 +11,38 @@ class CodeSnippetAdmin(admin.ModelAdmin):
     actions = ['mark_deleted', 'restore_snippet']
 
     def mark_deleted(self, request, queryset):
-        for s in queryset:
-            Notification.objects.create(
-                user=s.author,
-                message=f"Your snippet '{s.title}' was removed by admin."
-            )
-            s.is_deleted = True
-            s.deleted_at = timezone.now()
-            s.save()
+        removed = []
+        for s in queryset.filter(is_deleted=False):
+            s.soft_delete()
+            removed.append((s.author_id, f"Your snippet '{s.title}' was removed by admin."))
+        notify.send_each(removed)
     mark_deleted.short_description = "Mark selected snippets as deleted (notify author)"
 
     def restore_snippet(self, request, queryset):
-        queryset.update(is_deleted=False, deleted_at=None)
+        for s in queryset.filter(is_deleted=True):
+            s.restore()
     restore_snippet.short_description = "Restore selected snippets"
 
+    # Ticking/unticking is_deleted goes through soft_delete()/restore() so
+    # UserStats follows it, same as the actions above
+    def save_model(self, request, obj, form, change):
+        if not (change and 'is_deleted' in form.changed_data):
+            return super().save_model(request, obj, form, change)
+        deleting = obj.is_deleted
+        obj.is_deleted = not deleting
+        super().save_model(request, obj, form, change)
+        if deleting:
+            obj.soft_delete()
+        else:
+            obj.restore()
+
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
     list_display = ('snippet', 'reported_by', 'reason', 'resolved', 'created_at')
     list_filter = ('resolved', 'created_at')
     search_fields = ('snippet__title', 'reported_by__username', 'reason')
+    ordering = ('resolved', '-created_at')
 
 
 @admin.register(Notification)
@@ -39,8 +51,46 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ('is_read', 'created_at')
     search_fields = ('user__username', 'message')
 
+    # Keep UserStats.unread_count in step with edits made here
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'is_read' in form.changed_data:
+            notify.adjust_unread({obj.user_id: -1 if obj.is_read else 1})
+        elif not change and not obj.is_read:
+            notify.adjust_unread({obj.user_id: 1})
+
+    def delete_model(self, request, obj):
+        notify.forget([obj])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        notify.forget(queryset.only('user_id', 'is_read'))
+        super().delete_queryset(request, queryset)
+
 
 @admin.register(UserStats)
 class UserStatsAdmin(admin.ModelAdmin):
-    list_display = ('user', 'deleted_count')
+    list_display = ('user', 'deleted_count', 'unread_count')
     search_fields = ('user__username',)
+
+
+@admin.register(ContributorStats)
+class ContributorStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'snippet_count', 'download_count', 'report_count', 'deleted_count')
+    ordering = ('-snippet_count', '-download_count')
+    search_fields = ('user__username',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'label', 'status', 'attempts', 'created_by', 'created_at')
+    list_filter = ('status', 'task')
+    search_fields = ('label', 'created_by__username')
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'refcount', 'created_at', 'updated_at')
+    list_filter = ('refcount',)
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'size', 'refcount', 'created_at', 'updated_at')
@@ -0,0 +1,31 @@
+# Everything derived from a snippet's code, in one pass
+#
+# What saving a snippet computes across refresh_fingerprint() and the
+# lsh/search/codesearch index signals, as plain data. Pure Python with no
+# Django imports, so bulk imports can run it in worker processes.
+
+from .similarity import normalize_code, fingerprint, content_hash
+from .minhash import minhash_signature, band_hashes
+from .tokenizer import normalize_search_text, code_tokens, trigrams
+
+
+def analyze(source, language):
+    """
+    Fingerprint fields, MinHash signature and buckets, full-text body and
+    code search text/trigrams for `source` (the code as stored).
+    """
+    raw = source.strip()
+    fp = fingerprint(normalize_code(raw))
+    signature = minhash_signature(fp['tokens'])
+    search_text = normalize_search_text(raw, language)
+    return {
+        'content_hash': content_hash(source) if source else '',
+        'normalized_hash': fp['normalized_hash'],
+        'token_digest': fp['token_digest'],
+        'token_count': fp['token_count'],
+        'minhash': signature,
+        'buckets': list(band_hashes(signature)),
+        'search_body': " ".join(code_tokens(raw, language)),
+        'search_text': search_text,
+        'trigrams': sorted(trigrams(search_text)),
+    }
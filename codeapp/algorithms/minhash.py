@@ -0,0 +1,74 @@
+# MinHash + Locality Sensitive Hashing for near-duplicate detection
+#
+# A MinHash signature approximates the Jaccard similarity of two token
+# sets: the fraction of equal positions in two signatures estimates
+# |A & B| / |A | B|. Signatures are split into bands; snippets that share
+# at least one band hash land in the same bucket and become candidates.
+#
+# A pair at similarity s becomes a candidate with probability
+# 1 - (1 - s**ROWS)**BANDS, an S-curve rising around (1/BANDS)**(1/ROWS).
+# With 20 bands of 6 rows that midpoint is ~0.61, just under the 70%
+# duplicate threshold: candidates at 80% 99.8%, 70% 92%, 60% 62%,
+# 50% 27%, 40% 8%, 30% 1.4%. Banding uses the first BANDS * ROWS
+# values; similarity estimates use the whole signature.
+
+import hashlib
+import random
+
+NUM_PERM = 128
+BANDS = 20
+ROWS = 6
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = random.Random(20251123)
+PERMUTATIONS = [
+    (_rng.randint(1, _PRIME - 1), _rng.randint(0, _PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+
+
+def token_hash(token):
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def minhash_signature(tokens):
+    """
+    Returns a list of NUM_PERM ints for the given token set.
+    Empty input gives an empty signature (never a duplicate).
+    """
+    hashes = [token_hash(t) for t in set(tokens)]
+    if not hashes:
+        return []
+
+    signature = []
+    for a, b in PERMUTATIONS:
+        signature.append(min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes))
+    return signature
+
+
+def band_hashes(signature):
+    """
+    Yields (band_number, bucket_key) for every band of a signature.
+    """
+    if len(signature) != NUM_PERM:
+        return
+
+    for band in range(BANDS):  # BANDS * ROWS <= NUM_PERM
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        raw = ",".join(str(v) for v in rows).encode("ascii")
+        yield band, hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def estimate_similarity(sig1, sig2):
+    """
+    Estimated Jaccard similarity in percent of the two token sets.
+    """
+    if not sig1 or not sig2 or len(sig1) != len(sig2):
+        return 0
+
+    matches = sum(1 for x, y in zip(sig1, sig2) if x == y)
+    return (matches / len(sig1)) * 100
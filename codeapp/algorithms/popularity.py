@@ -1,17 +1,25 @@
-def calculate_popularity(snippet):
-    
-    # Popularity score based on views, downloads, and reports.
-    # Reports have a reduced penalty for local demo use.
-    
+# Popularity score based on views, downloads, and reports.
+# Reports have a reduced penalty for local demo use.
+
+VIEW_WEIGHT = 1
+DOWNLOAD_WEIGHT = 5
+REPORT_WEIGHT = -2  # penality for reports
+
+# Trending windows: (window length, half-life) in hours.
+# Engagement loses half its weight every half-life, so old activity fades
+# out instead of keeping a snippet on top forever.
+TRENDING_WINDOWS = {
+    'day': (24, 6),
+    'week': (24 * 7, 36),
+}
 
-    VIEW_WEIGHT = 1
-    DOWNLOAD_WEIGHT = 5
-    REPORT_WEIGHT = -2  # penality for reports
 
-    score = 0
-    score += snippet.views * VIEW_WEIGHT
-    score += snippet.downloads * DOWNLOAD_WEIGHT
-    score += snippet.reports_count * REPORT_WEIGHT
+def engagement_points(views, downloads, reports):
+    return views * VIEW_WEIGHT + downloads * DOWNLOAD_WEIGHT + reports * REPORT_WEIGHT
+
+
+def calculate_popularity(snippet):
+    score = engagement_points(snippet.views, snippet.downloads, snippet.reports_count)
 
     if score < 0:
         score = 0
@@ -19,16 +27,34 @@ def calculate_popularity(snippet):
     return score
 
 
+def decay(score, elapsed_hours, half_life):
+    """
+    Exponential time decay. Decaying in steps gives the same result as
+    decaying once: decay(decay(s, a), b) == decay(s, a + b), which is what
+    lets trending scores be updated incrementally. That only holds for
+    negative `elapsed_hours` too (points timed after the reference, such as
+    the current hour's bucket midpoint), so those are not clamped.
+    """
+    return score * 0.5 ** (elapsed_hours / half_life)
+
+
+def popularity_expression():
+    """
+    calculate_popularity as a database expression, so the score can be
+    stored, indexed and ordered on without loading rows into Python.
+    """
+    from django.db.models import F, Value, IntegerField
+    from django.db.models.functions import Greatest
+
+    return Greatest(
+        F('views') * VIEW_WEIGHT
+        + F('downloads') * DOWNLOAD_WEIGHT
+        + F('reports_count') * REPORT_WEIGHT,
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
 def rank_snippets(snippets):
-    scored = []
-    for s in snippets:
-        score = calculate_popularity(s)
-        scored.append((score, s))
-
-    # Manual sort (descending)
-    for i in range(len(scored)):
-        for j in range(i + 1, len(scored)):
-            if scored[j][0] > scored[i][0]:
-                scored[i], scored[j] = scored[j], scored[i]
-
-    return [s for _, s in scored]
+    # Stable sort, highest score first
+    return sorted(snippets, key=calculate_popularity, reverse=True)
@@ -1,18 +1,29 @@
 # Hardcoded Code Similarity Algorithm
 
-def extract_code(snippet):
+import hashlib
+
+# Bump when extract_code/normalize_code change so stored fingerprints get rebuilt
+FINGERPRINT_VERSION = 3
+
+def read_source(snippet):
+    """
+    The code exactly as stored (what a download serves), not stripped.
+    """
     if snippet.code:
-        return snippet.code.strip()
+        return snippet.code
 
     if snippet.file:
         try:
             content = snippet.file.read().decode("utf-8")
             snippet.file.seek(0)
-            return content.strip()
+            return content
         except:
             return ""
     return ""
 
+def extract_code(snippet):
+    return read_source(snippet).strip()
+
 def normalize_code(code):
     cleaned = []
     multi = False
@@ -38,38 +49,23 @@ def normalize_code(code):
     return " ".join(cleaned)
 
 
-def simple_similarity(code1, code2):
-    set1 = set(code1.split())
-    set2 = set(code2.split())
-
-    if not set1 or not set2:
-        return 0
-
-    intersection = len(set1 & set2)
-    union = len(set1 | set2)
-
-    return (intersection / union) * 100
-
-
-def is_duplicate(snippet, all_snippets, threshold=70):
+def content_hash(raw):
     """
-    Returns True if duplicate found.
-    Checks against all snippets except itself.
+    Identifies one exact version of the code (render cache keys, ETags).
     """
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-    new_code = extract_code(snippet)
-    new_code = normalize_code(new_code)
-
-    for other in all_snippets:
-        if other.id == snippet.id:
-            continue
-        
-        old_code = extract_code(other)
-        old_code = normalize_code(old_code)
 
-        score = simple_similarity(new_code, old_code)
-
-        if score >= threshold:
-            return True, score, other
-
-    return False, 0, None
+def fingerprint(normalized):
+    """
+    Derived, comparable summary of normalized code.
+    Two snippets with the same token_digest have 100% similarity.
+    """
+    tokens = normalized.split()
+    token_set = sorted(set(tokens))
+    return {
+        'normalized_hash': hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+        'token_digest': hashlib.sha256("\n".join(token_set).encode("utf-8")).hexdigest(),
+        'token_count': len(tokens),
+        'tokens': token_set,
+    }
@@ -0,0 +1,191 @@
+# Language-aware code normalization and tokenization for search
+#
+# Same pipeline as similarity.normalize_code (strip lines, drop comments,
+# drop blank lines) but the comment syntax depends on the language and
+# string literals are left alone, so "#" inside a Python string or "//"
+# inside a JavaScript URL does not cut the line.
+
+import re
+
+_STRING = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+_C_COMMENTS = r'//[^\n]*|/\*.*?\*/'
+
+COMMENT_PATTERNS = {
+    'python': r'#[^\n]*',
+    'java': _C_COMMENTS,
+    'cpp': _C_COMMENTS,
+    'c': _C_COMMENTS,
+    'javascript': _C_COMMENTS,
+    'dart': _C_COMMENTS,
+    'css': r'/\*.*?\*/',
+    'html': r'<!--.*?-->',
+}
+
+_COMMENT_RES = {
+    language: re.compile(f'({_STRING})|{pattern}', re.S)
+    for language, pattern in COMMENT_PATTERNS.items()
+}
+
+_WHITESPACE = re.compile(r'[ \t\f\v]+')
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+')
+_CAMEL_PART = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+
+def strip_comments(code, language):
+    pattern = _COMMENT_RES.get(language)
+    if pattern is None:
+        return code
+    # Keep string literals (group 1), drop comments
+    return pattern.sub(lambda m: m.group(1) or '', code)
+
+
+def normalize_search_text(code, language):
+    """
+    Comment-free code with one statement line per line and runs of
+    spaces collapsed, so substring queries match regardless of indentation.
+    """
+    lines = []
+    for line in strip_comments(code, language).split('\n'):
+        line = _WHITESPACE.sub(' ', line.strip())
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def normalize_query(query):
+    return _WHITESPACE.sub(' ', query.strip())
+
+
+def code_tokens(code, language):
+    """
+    Identifier-aware tokens: each identifier plus its snake_case and
+    camelCase parts, so "read_csv" is findable as "read csv" and
+    "parseJsonBody" as "json".
+    """
+    tokens = []
+    for ident in _IDENTIFIER.findall(strip_comments(code, language)):
+        tokens.append(ident)
+        parts = [p for chunk in ident.split('_') for p in _CAMEL_PART.findall(chunk)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def trigrams(text):
+    """
+    Lower-cased 3-character substrings of text (newlines included).
+    """
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# ------------------------ REGEX LITERALS -------------------------
+_META = set('.^$[]()|')
+_QUANTIFIERS = set('*?{')
+
+
+def required_literals(pattern):
+    """
+    Literal runs that every match of `pattern` must contain.
+    Conservative: patterns with alternation give no literals (scan needed).
+    """
+    if '|' in pattern:
+        return []
+
+    literals, current = [], []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        nxt = pattern[i + 1] if i + 1 < len(pattern) else ''
+
+        if ch == '\\' and nxt:
+            if nxt.isalnum():      # \w, \d, \b ... are classes, not literals
+                literals.append(''.join(current))
+                current = []
+            else:
+                current.append(nxt)
+            i += 2
+        elif ch in _QUANTIFIERS:
+            # Previous char is optional/repeated: it can't be relied on
+            if current:
+                current.pop()
+            literals.append(''.join(current))
+            current = []
+            if ch == '{':
+                close = pattern.find('}', i)
+                i = close + 1 if close != -1 else len(pattern)
+            else:
+                i += 1
+        elif ch == '+':
+            literals.append(''.join(current))
+            current = []
+            i += 1
+        elif ch in _META:
+            literals.append(''.join(current))
+            current = []
+            if ch == '[':
+                close = pattern.find(']', i + 2)
+                i = close + 1 if close != -1 else len(pattern)
+            elif ch == '(' and _optional_group(pattern, i):
+                i = _group_end(pattern, i) + 1
+                if pattern[i] == '{':
+                    i = pattern.find('}', i) if '}' in pattern[i:] else len(pattern)
+                i += 1
+            elif ch == '(' and nxt == '?':
+                i = _extension_end(pattern, i)
+                if i is None:
+                    return []
+            else:
+                i += 1
+        else:
+            current.append(ch)
+            i += 1
+
+    literals.append(''.join(current))
+    return [lit for lit in literals if len(lit) >= 3]
+
+
+def _group_end(pattern, start):
+    depth, i = 0, start
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i += 2
+            continue
+        if pattern[i] == '(':
+            depth += 1
+        elif pattern[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(pattern)
+
+
+def _extension_end(pattern, start):
+    """
+    Index just past the "(?..." prefix of the extension group at `start`,
+    so its body is read like any group's. Flags, comments and named
+    backreferences have no body worth reading and are skipped whole.
+    None for lookarounds and conditionals: what they test isn't part of
+    the match, so they can't be turned into required literals.
+    """
+    rest = pattern[start + 2:]
+    if rest.startswith(('=', '!', '<=', '<!', '(')):
+        return None
+    if rest.startswith((':', '>')):        # non-capturing, atomic
+        return start + 3
+    if rest.startswith('P<'):              # named group: skip the name
+        close = pattern.find('>', start)
+        return close + 1 if close != -1 else len(pattern)
+    # (?P=name), (?#...), (?i) up to ")"; scoped flags (?i:...) up to ":"
+    for i in range(start + 2, len(pattern)):
+        if pattern[i] == ')':
+            return i + 1
+        if pattern[i] == ':' and not rest.startswith(('#', 'P=')):
+            return i + 1
+    return len(pattern)
+
+
+def _optional_group(pattern, start):
+    end = _group_end(pattern, start)
+    return end + 1 < len(pattern) and pattern[end + 1] in _QUANTIFIERS
@@ -6,3 +6,4 @@ class CodeappConfig(AppConfig):
 
     def ready(self):
         import codeapp.signals
+        import codeapp.tasks
@@ -0,0 +1,135 @@
+import base64
+import gzip
+import io
+import itertools
+import json
+import os
+import tarfile
+import time
+from contextlib import contextmanager
+
+# Snippet archives read by import_snippets and written by export_snippets.
+# Both formats are streamed one snippet at a time, in constant memory.
+#
+# JSON lines (.jsonl, .jsonl.gz): one object per snippet with the METADATA
+#   fields; pasted code in "code", an uploaded file as "filename" plus its
+#   bytes base64-encoded in "file_data".
+# tar (.tar, .tar.gz, .tgz): per snippet a "<n>.json" member with the
+#   METADATA (and "filename" for files), followed by a "<n>/<name>" member
+#   holding the raw code or file.
+#
+# A record in memory is a dict of the METADATA plus 'filename' ('' for
+# pasted code) and 'content' (bytes). Records being written may also carry
+# 'extension', used to name pasted code's member in a tar.
+METADATA = ('title', 'description', 'language', 'author', 'created_at')
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def is_tar(path):
+    return path.endswith(TAR_SUFFIXES)
+
+
+def open_text(path, mode):
+    opener = gzip.open if path.endswith('.gz') else open
+    return opener(path, mode + 't', encoding='utf-8')
+
+
+# ------------------------ READING -------------------------
+def read(path):
+    """
+    Yields the records of a JSON lines or tar archive, in file order.
+    """
+    try:
+        if is_tar(path):
+            yield from _read_tar(path)
+        else:
+            yield from _read_jsonl(path)
+    except (ValueError, EOFError, OSError, tarfile.TarError) as e:
+        raise ArchiveError(f"{path}: {e}") from e
+
+
+def _read_jsonl(path):
+    with open_text(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                if data.get('filename'):
+                    yield _record(data, data['filename'], base64.b64decode(data.get('file_data') or ''))
+                else:
+                    yield _record(data, '', (data.get('code') or '').encode('utf-8'))
+            except (ValueError, AttributeError) as e:
+                raise ValueError(f"line {number}: {e}") from None
+
+
+def _read_tar(path):
+    # "r|*": a forward-only stream, so members must come as json, content
+    with tarfile.open(path, 'r|*') as tar:
+        meta = None
+        for member in tar:
+            if not member.isfile():
+                continue
+            f = tar.extractfile(member)
+            if meta is None:
+                if not member.name.endswith('.json'):
+                    raise ValueError(f"{member.name}: expected a snippet's .json metadata")
+                meta = json.load(f)
+            else:
+                yield _record(meta, meta.get('filename') or '', f.read())
+                meta = None
+        if meta is not None:
+            raise ValueError("archive ends before the last snippet's content")
+
+
+def _record(data, filename, content):
+    record = {field: data.get(field) for field in METADATA}
+    record['filename'] = os.path.basename(filename)
+    record['content'] = content
+    return record
+
+
+# ------------------------ WRITING -------------------------
+@contextmanager
+def writer(path):
+    """
+    Context manager giving a write(record) function for the archive at `path`.
+    """
+    if is_tar(path):
+        with tarfile.open(path, 'w|gz' if path.endswith('gz') else 'w|') as tar:
+            numbers = itertools.count(1)
+            yield lambda record: _write_tar(tar, next(numbers), record)
+    else:
+        with open_text(path, 'w') as f:
+            yield lambda record: f.write(json.dumps(_jsonl(record), ensure_ascii=False) + '\n')
+
+
+def _jsonl(record):
+    data = {field: record.get(field) for field in METADATA}
+    if record['filename']:
+        data['filename'] = record['filename']
+        data['file_data'] = base64.b64encode(record['content']).decode('ascii')
+    else:
+        data['code'] = record['content'].decode('utf-8')
+    return data
+
+
+def _write_tar(tar, number, record):
+    meta = {field: record.get(field) for field in METADATA}
+    name = f'code.{record.get("extension") or "txt"}'
+    if record['filename']:
+        meta['filename'] = name = record['filename']
+    _add(tar, f'{number:08d}.json', json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+    _add(tar, f'{number:08d}/{name}', record['content'])
+
+
+def _add(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
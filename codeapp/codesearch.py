@@ -0,0 +1,140 @@
+import re
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import SnippetSearchText, CodeTrigram
+from .algorithms.similarity import extract_code
+from .algorithms.tokenizer import normalize_search_text, normalize_query, trigrams, required_literals
+
+# Queries without usable trigrams (short, or regex alternation) fall back
+# to verifying documents directly, newest first, up to this many.
+MAX_UNINDEXED_SCAN = 2000
+
+# Python's re has no timeout, so regex queries are bounded up front: the
+# pattern length, the shapes that backtrack exponentially (see
+# nested_repetition), and how many documents one query may verify.
+MAX_REGEX_LENGTH = 200
+MAX_REGEX_CANDIDATES = 2000
+
+VERIFY_BATCH = 200
+
+
+# ------------------------ INDEX MAINTENANCE -------------------------
+# Soft-deleted snippets stay indexed (queries filter them out), so a
+# restore needs no reindex; hard deletes cascade.
+def index_snippet(snippet, raw=None):
+    if raw is None:
+        raw = extract_code(snippet)
+    text = normalize_search_text(raw, snippet.language)
+
+    with transaction.atomic():
+        SnippetSearchText.objects.update_or_create(snippet=snippet, defaults={'text': text})
+        CodeTrigram.objects.filter(snippet=snippet).delete()
+        CodeTrigram.objects.bulk_create(
+            [CodeTrigram(trigram=t, snippet=snippet) for t in trigrams(text)],
+            batch_size=500,
+        )
+
+
+# ------------------------ QUERY -------------------------
+def compile_query(query, regex=False):
+    """
+    Returns (matcher, literals): a compiled pattern that verifies a
+    document, and the literal strings every match must contain.
+    Smart case: the search is case-sensitive only if the query has capitals.
+    """
+    flags = 0 if any(ch.isupper() for ch in query) else re.IGNORECASE
+    if regex:
+        if len(query) > MAX_REGEX_LENGTH:
+            raise re.error(f"pattern is longer than {MAX_REGEX_LENGTH} characters")
+        if nested_repetition(query):
+            raise re.error("repeated groups can't contain repetition or alternation, e.g. (a+)+")
+        return re.compile(query, flags | re.MULTILINE), required_literals(query)
+
+    literal = normalize_query(query)
+    return re.compile(re.escape(literal), flags), [literal] if len(literal) >= 3 else []
+
+
+def nested_repetition(pattern):
+    """
+    Whether a group repeated with *, + or {} contains a repetition or an
+    alternation itself, like (a+)+ or (a|aa)*: what backtracks
+    exponentially on a near miss.
+    """
+    open_groups = []   # per open group: does it repeat or branch inside?
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '[':
+            close = pattern.find(']', i + 2)
+            i = close + 1 if close != -1 else len(pattern)
+            continue
+
+        if ch == '(':
+            open_groups.append(False)
+        elif ch == ')' and open_groups:
+            inner = open_groups.pop()
+            if inner and pattern[i + 1:i + 2] in ('*', '+', '{'):
+                return True
+            if inner and open_groups:
+                open_groups[-1] = True
+        elif ch in '*+{|':
+            open_groups = [True] * len(open_groups)
+        i += 1
+    return False
+
+
+def candidate_ids(literals):
+    """
+    Snippets whose trigram set contains every trigram of every literal,
+    or None when the literals give no trigrams (everything is a candidate).
+    """
+    wanted = set()
+    for literal in literals:
+        wanted |= trigrams(literal)
+    if not wanted:
+        return None
+
+    return (
+        CodeTrigram.objects.filter(trigram__in=wanted)
+        .values('snippet_id')
+        .annotate(hits=Count('trigram'))
+        .filter(hits=len(wanted))
+        .values_list('snippet_id', flat=True)
+    )
+
+
+def search_code(query, regex=False, languages=None, limit=200):
+    """
+    Substring (or regex) search over normalized snippet code.
+    Raises re.error for invalid regular expressions and ones compile_query
+    turns down. Returns ids, newest first.
+    """
+    matcher, literals = compile_query(query, regex)
+    if not literals and not regex:
+        return []
+
+    docs = SnippetSearchText.objects.filter(snippet__is_deleted=False)
+    if languages:
+        docs = docs.filter(snippet__language__in=languages)
+
+    candidates = candidate_ids(literals)
+    if candidates is not None:
+        docs = docs.filter(snippet_id__in=candidates)
+    docs = docs.order_by('-snippet_id')
+    if candidates is None:
+        docs = docs[:MAX_UNINDEXED_SCAN]
+    elif regex:
+        docs = docs[:MAX_REGEX_CANDIDATES]
+
+    matches = []
+    for doc in docs.iterator(chunk_size=VERIFY_BATCH):
+        if matcher.search(doc.text):
+            matches.append(doc.snippet_id)
+            if len(matches) >= limit:
+                break
+    return matches
@@ -0,0 +1,160 @@
+# Opt-in compression of stored code (SNIPPET_COMPRESSION)
+#
+# Pasted code is zlib-compressed into CodeSnippet.code_z with a preset
+# dictionary trained per language (CompressionDictionary): snippets are
+# small, and most of what they share with each other (keywords, imports,
+# boilerplate lines) is exactly what a preset dictionary supplies.
+# Uploaded files are compressed in the blob store without a dictionary.
+# Both use the same self-describing payload, decompressed on first access.
+
+import struct
+import time
+import zlib
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+MAGIC = b'CSZ1'
+HEADER = struct.Struct('>4sIQ')   # magic, dictionary id (0 = none), raw size
+LEVEL = 9
+
+DICTIONARY_SIZE = 32 * 1024       # zlib only looks back 32 KB
+DICTIONARY_TTL = 300              # seconds before re-checking for a newer dictionary
+
+
+def enabled():
+    return getattr(settings, 'SNIPPET_COMPRESSION', False)
+
+
+# ------------------------ DICTIONARIES -------------------------
+_by_id = {}
+_active = {}
+
+
+def dictionary(dict_id):
+    if dict_id not in _by_id:
+        model = apps.get_model('codeapp', 'CompressionDictionary')
+        _by_id[dict_id] = bytes(model.objects.values_list('data', flat=True).get(pk=dict_id))
+    return _by_id[dict_id]
+
+
+def active_dictionary(language):
+    """
+    (id, data) of the newest dictionary for the language, or (0, b'').
+    """
+    cached = _active.get(language)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    model = apps.get_model('codeapp', 'CompressionDictionary')
+    row = model.objects.filter(language=language).order_by('-pk').values_list('pk', 'data').first()
+    entry = (row[0], bytes(row[1])) if row else (0, b'')
+    _active[language] = (time.monotonic() + DICTIONARY_TTL, entry)
+    if row:
+        _by_id[row[0]] = entry[1]
+    return entry
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """
+    zlib has no trainer, so build the preset dictionary from the lines
+    shared by most samples (indentation stripped), up to `size` bytes.
+    The most common go last: zlib encodes nearer matches more cheaply.
+    """
+    counts = Counter()
+    for text in samples:
+        counts.update({line.strip() for line in text.splitlines() if len(line.strip()) >= 4})
+
+    picked, total = [], 0
+    for line, seen in counts.most_common():
+        if seen < 2:
+            break
+        piece = (line + '\n').encode('utf-8')
+        if total + len(piece) <= size:
+            picked.append(piece)
+            total += len(piece)
+    return b''.join(reversed(picked))
+
+
+# ------------------------ PAYLOADS -------------------------
+def is_compressed(head):
+    return bytes(head[:len(MAGIC)]) == MAGIC
+
+
+def compressor(zdict=b''):
+    if zdict:
+        return zlib.compressobj(LEVEL, zdict=zdict)
+    return zlib.compressobj(LEVEL)
+
+
+def decompressor(dict_id):
+    if dict_id:
+        return zlib.decompressobj(zdict=dictionary(dict_id))
+    return zlib.decompressobj()
+
+
+def compress(data, language=None):
+    dict_id, zdict = active_dictionary(language) if language else (0, b'')
+    c = compressor(zdict)
+    return HEADER.pack(MAGIC, dict_id, len(data)) + c.compress(data) + c.flush()
+
+
+def decompress(payload):
+    payload = bytes(payload)
+    _, dict_id, _ = HEADER.unpack_from(payload)
+    d = decompressor(dict_id)
+    return d.decompress(payload[HEADER.size:]) + d.flush()
+
+
+# ------------------------ MODEL FIELD -------------------------
+class CompressedTextDescriptor(DeferredAttribute):
+    """
+    Reads fall back to the compressed column, decompressing on first access.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value is None:
+            payload = getattr(instance, self.field.compressed_field)
+            if payload:
+                value = decompress(payload).decode('utf-8')
+                instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so __get__ runs
+        # even though the NULL column value sits in the instance __dict__
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField that, with SNIPPET_COMPRESSION on, saves its value compressed
+    into `compressed_field` (a BinaryField declared after it) and stores
+    NULL itself. The instance keeps the plain text either way.
+    """
+    descriptor_class = CompressedTextDescriptor
+
+    def __init__(self, *args, compressed_field=None, **kwargs):
+        self.compressed_field = compressed_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['compressed_field'] = self.compressed_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = super().pre_save(model_instance, add)
+        payload = None
+        if value and enabled():
+            raw = value.encode('utf-8')
+            payload = compress(raw, getattr(model_instance, 'language', None))
+            if len(payload) >= len(raw):
+                payload = None   # not worth it for tiny snippets
+        setattr(model_instance, self.compressed_field, payload)
+        return None if payload else value
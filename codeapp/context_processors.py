@@ -1,24 +1,29 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import notify
 from .forms import CodeSnippetForm
-from .models import Notification
 
 def upload_form(request):
     """
     Makes the CodeSnippetForm available globally (e.g. in base.html upload modal).
+    Built only if a template actually uses it.
     """
-    return {'form': CodeSnippetForm()}
+    return {'form': SimpleLazyObject(CodeSnippetForm)}
 
 
 def notifications(request):
     """
-    Provides unread notifications count and list for the logged-in user.
+    Provides unread notifications count and the newest unread ones for the
+    logged-in user. Nothing is looked up until a template touches either;
+    both then come from one per-user cache entry (see notify.unread).
     """
-    if request.user.is_authenticated:
-        notes = Notification.objects.filter(user=request.user, is_read=False)
-        return {
-            'notifications_count': notes.count(),
-            'notes': notes
-        }
+    def summary():
+        if request.user.is_authenticated:
+            return notify.unread(request.user.pk)
+        return {'count': 0, 'notes': []}
+
+    unread = SimpleLazyObject(summary)
     return {
-        'notifications_count': 0,
-        'notes': []
+        'notifications_count': SimpleLazyObject(lambda: unread['count']),
+        'unread_notes': SimpleLazyObject(lambda: unread['notes']),
     }
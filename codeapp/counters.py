@@ -0,0 +1,161 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import F
+from django.dispatch import Signal
+
+from .models import CodeSnippet
+from .trending import record_engagement
+
+logger = logging.getLogger(__name__)
+
+# Buffered CodeSnippet counter columns
+FIELDS = ('views', 'downloads')
+
+# Sent after a flush with batch={snippet_id: Counter(views=.., downloads=..)}
+counters_flushed = Signal()
+
+_lock = threading.Lock()
+_pending = defaultdict(Counter)
+_last_flush = time.monotonic()
+
+# Background flusher, started by the web entry points (start_flusher)
+_flusher = None
+_stop = threading.Event()
+
+
+def flush_interval():
+    return getattr(settings, 'COUNTER_FLUSH_INTERVAL', 10)
+
+
+def flush_threshold():
+    return getattr(settings, 'COUNTER_FLUSH_THRESHOLD', 500)
+
+
+# ------------------------ BUFFER -------------------------
+def incr(snippet_id, field, amount=1):
+    """
+    Buffers a counter increment in memory; written by the next flush.
+    """
+    if _buffer(snippet_id, field, amount):
+        flush()
+
+
+async def aincr(snippet_id, field, amount=1):
+    """
+    incr() for async views: the buffer lock is only held for the in-memory
+    update, and a due flush runs in a worker thread.
+    """
+    if _buffer(snippet_id, field, amount):
+        await sync_to_async(flush)()
+
+
+def _buffer(snippet_id, field, amount):
+    """
+    Adds the increment and returns whether a flush is due.
+    """
+    if field not in FIELDS:
+        raise ValueError(f"'{field}' is not a buffered counter")
+
+    if _flusher is not None and not _flusher.is_alive() and not _stop.is_set():
+        # Started before a fork (e.g. a preloaded app): threads don't survive it
+        start_flusher()
+
+    with _lock:
+        _pending[snippet_id][field] += amount
+        return (
+            time.monotonic() - _last_flush >= flush_interval()
+            or len(_pending) >= flush_threshold()
+        )
+
+
+def pending(snippet_id, field):
+    """
+    Increments for a snippet that are not in the database yet.
+    """
+    with _lock:
+        counts = _pending.get(snippet_id)
+        return counts[field] if counts else 0
+
+
+# ------------------------ FLUSH -------------------------
+def flush():
+    """
+    Writes buffered increments as atomic F() updates, one UPDATE per
+    distinct (views, downloads) increment. Returns the number of snippets.
+    """
+    global _pending, _last_flush
+    with _lock:
+        batch, _pending = _pending, defaultdict(Counter)
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+
+    groups = defaultdict(list)
+    for snippet_id, counts in batch.items():
+        groups[tuple(counts[f] for f in FIELDS)].append(snippet_id)
+
+    try:
+        with transaction.atomic():
+            for increments, snippet_ids in groups.items():
+                CodeSnippet.objects.filter(pk__in=snippet_ids).update(**{
+                    field: F(field) + amount
+                    for field, amount in zip(FIELDS, increments) if amount
+                })
+            for snippet_id, counts in batch.items():
+                record_engagement(snippet_id, views=counts['views'], downloads=counts['downloads'])
+    except Exception:
+        # Put the increments back so the next flush retries them
+        with _lock:
+            for snippet_id, counts in batch.items():
+                _pending[snippet_id].update(counts)
+        logger.exception("Counter flush failed; %d snippets kept in buffer", len(batch))
+        return 0
+
+    counters_flushed.send(sender=CodeSnippet, batch=batch)
+    return len(batch)
+
+
+# ------------------------ PERIODIC FLUSH -------------------------
+def start_flusher():
+    """
+    Starts a daemon thread that flushes every COUNTER_FLUSH_INTERVAL
+    seconds, so increments for a snippet that gets no more traffic aren't
+    held in memory until the next hit or exit. Called from the WSGI/ASGI
+    entry points; management commands and tests flush explicitly.
+    """
+    global _flusher
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _stop.clear()
+            _flusher = threading.Thread(target=_flush_periodically, name='counter-flush', daemon=True)
+            _flusher.start()
+        return _flusher
+
+
+def stop_flusher():
+    global _flusher
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join()
+        _flusher = None
+
+
+def _flush_periodically():
+    while not _stop.wait(flush_interval()):
+        try:
+            flush()
+        except Exception:
+            logger.exception("Periodic counter flush failed")
+        finally:
+            # This thread's connection follows CONN_MAX_AGE like a request's
+            close_old_connections()
+
+
+atexit.register(flush)
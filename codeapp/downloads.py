@@ -0,0 +1,267 @@
+import asyncio
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def offload_mode():
+    """
+    None (Python streams the file), 'x-sendfile' (Apache/lighttpd) or
+    'x-accel' (nginx, files served from DOWNLOAD_ACCEL_PREFIX).
+    """
+    return getattr(settings, 'DOWNLOAD_OFFLOAD', None)
+
+
+# ------------------------ VALIDATORS -------------------------
+def etag_for(snippet):
+    """
+    Strong ETag: content_hash is the sha256 of the exact bytes served.
+    """
+    if snippet.content_hash and not snippet.fingerprint_is_stale:
+        return f'"{snippet.content_hash}"'
+    return None
+
+
+def code_body(snippet):
+    """
+    Pasted code as the bytes to serve, or None to serve the file. Code wins
+    when a snippet has both, as in read_source(), so the ETag (its
+    content_hash) always describes the bytes actually sent.
+    """
+    if snippet.file and not snippet.code:
+        return None
+    return (snippet.code or '').encode('utf-8')
+
+
+def last_modified_for(snippet):
+    if snippet.file:
+        try:
+            return int(os.path.getmtime(snippet.file.path))
+        except OSError:
+            pass
+    return int(snippet.created_at.timestamp())
+
+
+# ------------------------ RANGES -------------------------
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single satisfiable byte range, None to
+    serve the whole body (no/unsupported header), or False if unsatisfiable.
+    Multi-range requests get the whole body, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def range_applies(request, etag):
+    """
+    If-Range: only honour Range while the client's copy is still current.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    return etag is not None and etag in parse_etags(if_range)
+
+
+def iter_file(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+async def aiter_file(f, start, length):
+    """
+    iter_file() with each seek/read/close in a worker thread.
+    """
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            block = await asyncio.to_thread(f.read, min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+# ------------------------ RESPONSES -------------------------
+def serve(request, snippet, filename):
+    """
+    Download response for the snippet's file or pasted code, with
+    ETag/Last-Modified validators, 304/412 handling and byte ranges.
+    Returns (response, counted): counted is False for 304s and range
+    requests that resume past the first byte, so those aren't downloads.
+    """
+    etag = etag_for(snippet)
+    last_modified = last_modified_for(snippet)
+
+    early = precondition_response(request, snippet, filename, etag, last_modified)
+    if early is not None:
+        return early
+
+    body = code_body(snippet)
+    size = snippet.file.size if body is None else len(body)
+
+    byte_range = requested_range(request, etag, size)
+    if byte_range is False:
+        return unsatisfiable(size), False
+
+    if byte_range is not None:
+        start, end = byte_range
+        if body is None:
+            response = StreamingHttpResponse(iter_file(snippet.file.open('rb'), start, end - start + 1))
+        else:
+            response = HttpResponse(body[start:end + 1])
+        partial(response, byte_range, size)
+    elif body is None:
+        # FileResponse lets the WSGI server use sendfile() where it can
+        response = FileResponse(snippet.file.open('rb'))
+    else:
+        response = HttpResponse(body)
+
+    counted = byte_range is None or byte_range[0] == 0
+    return finish(response, filename, etag, last_modified, text=body is not None), counted
+
+
+async def aserve(request, snippet, filename):
+    """
+    serve() for async views. Under ASGI files are read in worker threads
+    a block at a time, so a slow client holds a coroutine, not a thread.
+    Under WSGI this is serve() itself: the server would have to buffer an
+    async body whole, and FileResponse keeps wsgi.file_wrapper/sendfile().
+    """
+    if not isinstance(request, ASGIRequest):
+        return await sync_to_async(serve)(request, snippet, filename)
+
+    etag = etag_for(snippet)
+    last_modified = await asyncio.to_thread(last_modified_for, snippet)
+
+    # The offload check may decompress the code or peek at the file's header
+    early = await sync_to_async(precondition_response)(request, snippet, filename, etag, last_modified)
+    if early is not None:
+        return early
+
+    # May decompress (and look up a compression dictionary)
+    body = await sync_to_async(code_body)(snippet)
+    if body is None:
+        size = await asyncio.to_thread(lambda: snippet.file.size)
+    else:
+        size = len(body)
+
+    byte_range = requested_range(request, etag, size)
+    if byte_range is False:
+        return unsatisfiable(size), False
+
+    start, end = byte_range or (0, size - 1)
+    if body is not None:
+        response = HttpResponse(body[start:end + 1])
+    else:
+        f = await asyncio.to_thread(snippet.file.open, 'rb')
+        response = StreamingHttpResponse(aiter_file(f, start, end - start + 1))
+        response['Content-Length'] = end - start + 1
+    if byte_range is not None:
+        partial(response, byte_range, size)
+
+    counted = byte_range is None or byte_range[0] == 0
+    return finish(response, filename, etag, last_modified, text=body is not None), counted
+
+
+def precondition_response(request, snippet, filename, etag, last_modified):
+    """
+    (response, counted) when the request is answered without reading the
+    content: 304/412 from the validators, or a web-server offload.
+    """
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        if etag:
+            not_modified['ETag'] = etag
+        return not_modified, False
+
+    if offload_mode() and code_body(snippet) is None and not snippet.file.storage.is_compressed(snippet.file.name):
+        # The web server sends the file and handles Range itself
+        # (compressed blobs have to be inflated here instead)
+        response = offloaded(snippet)
+        return finish(response, filename, etag, last_modified, text=False), True
+    return None
+
+
+def requested_range(request, etag, size):
+    if 'Range' in request.headers and range_applies(request, etag):
+        return parse_range(request.headers['Range'], size)
+    return None
+
+
+def unsatisfiable(size):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+
+def partial(response, byte_range, size):
+    start, end = byte_range
+    response.status_code = 206
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+
+
+def finish(response, filename, etag, last_modified, text):
+    if text:
+        response['Content-Type'] = 'text/plain; charset=utf-8'
+    else:
+        response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response['ETag'] = etag
+    # Browsers may keep a copy but must revalidate (a cheap 304)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def offloaded(snippet):
+    """
+    Empty response telling the front-end server to send the file itself
+    (it then handles ranges too).
+    """
+    response = HttpResponse()
+    if offload_mode() == 'x-accel':
+        prefix = getattr(settings, 'DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + snippet.file.name
+    else:
+        response['X-Sendfile'] = snippet.file.path
+    return response
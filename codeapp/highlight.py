@@ -0,0 +1,98 @@
+import io
+from functools import lru_cache
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+
+try:
+    from pygments import highlight as pygments_highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+except ImportError:  # Optional: without Pygments code is shown escaped, unhighlighted
+    pygments_highlight = None
+
+# Bump when the rendered HTML changes so cached chunks are not reused
+RENDER_VERSION = 1
+
+STYLE = 'monokai'
+
+
+def chunk_lines():
+    return getattr(settings, 'DETAIL_CHUNK_LINES', 400)
+
+
+def cache_timeout():
+    return getattr(settings, 'HIGHLIGHT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+# ------------------------ READING -------------------------
+def read_lines(snippet, start, count):
+    """
+    Lines [start, start + count) of the snippet, plus whether more follow.
+    Files are streamed line by line, never read into memory whole.
+    """
+    if snippet.code:
+        lines = snippet.code.splitlines()
+        return lines[start:start + count], len(lines) > start + count
+
+    if not snippet.file:
+        return [], False
+
+    with snippet.file.open('rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+        window = list(islice(text, start, start + count + 1))
+    lines = [line.rstrip('\r\n') for line in window]
+    return lines[:count], len(lines) > count
+
+
+# ------------------------ RENDERING -------------------------
+def to_html(code, language):
+    if pygments_highlight is None:
+        return escape(code)
+    try:
+        lexer = get_lexer_by_name(language, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return escape(code)
+    return pygments_highlight(code, lexer, HtmlFormatter(nowrap=True))
+
+
+def render_chunk(snippet, index):
+    """
+    Highlighted HTML for chunk `index` of the snippet's code:
+    {'html', 'first_line', 'has_more', 'next'}. Cached per content hash,
+    so each version of a snippet is highlighted once.
+    """
+    size = chunk_lines()
+    key = f'highlight:{RENDER_VERSION}:{snippet.content_hash}:{snippet.language}:{size}:{index}'
+    if snippet.content_hash:
+        chunk = cache.get(key)
+        if chunk is not None:
+            return chunk
+
+    try:
+        lines, has_more = read_lines(snippet, index * size, size)
+    except OSError as e:
+        lines, has_more = [f"Error reading file: {e}"], False
+
+    chunk = {
+        'html': to_html('\n'.join(lines), snippet.language) if lines else '',
+        'first_line': index * size + 1,
+        'has_more': has_more,
+        'next': index + 1 if has_more else None,
+    }
+    if snippet.content_hash:
+        cache.set(key, chunk, cache_timeout())
+    return chunk
+
+
+@lru_cache(maxsize=1)
+def style_css():
+    """
+    CSS for the highlight classes, scoped to .highlight.
+    """
+    if pygments_highlight is None:
+        return ''
+    return HtmlFormatter(style=STYLE).get_style_defs('.highlight')
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+# {% cache %} fragment names used in codeapp/home.html
+FEATURED = 'home_featured'
+TRENDING = 'home_trending'
+CONTRIBUTORS = 'home_contributors'
+FRAGMENTS = (FEATURED, TRENDING, CONTRIBUTORS)
+
+
+def timeout():
+    return getattr(settings, 'HOME_CACHE_TIMEOUT', 300)
+
+
+def invalidate(*fragments):
+    """
+    Drops cached home page sections (all of them by default); the next
+    render rebuilds them from the database.
+    """
+    cache.delete_many([make_template_fragment_key(name) for name in fragments or FRAGMENTS])
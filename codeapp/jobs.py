@@ -0,0 +1,137 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# task name → callable(**payload), filled by @task (see codeapp/tasks.py)
+TASKS = {}
+
+
+def task(name):
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+# ------------------------ ENQUEUE -------------------------
+def enqueue(name, payload=None, user=None, label='', max_attempts=3):
+    """
+    Stores a job for the worker (manage.py run_jobs).
+    With JOBS_EAGER the job runs right after the surrounding transaction commits.
+    """
+    job = Job.objects.create(
+        task=name,
+        payload=payload or {},
+        created_by=user,
+        label=label,
+        max_attempts=max_attempts,
+    )
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job_id(job.pk))
+    return job
+
+
+def enqueue_many(name, payloads, label='', max_attempts=3):
+    """
+    enqueue() for many jobs of one task, stored with a single INSERT.
+    """
+    jobs = Job.objects.bulk_create(
+        Job(task=name, payload=payload, label=label, max_attempts=max_attempts)
+        for payload in payloads
+    )
+    if getattr(settings, 'JOBS_EAGER', False):
+        for job in jobs:
+            transaction.on_commit(lambda pk=job.pk: run_job_id(pk))
+    return jobs
+
+
+# ------------------------ WORKER -------------------------
+def claim_jobs(limit=10):
+    """
+    Moves up to `limit` due jobs to running. The conditional UPDATE means two
+    workers never claim the same job.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(
+        status=Job.STATUS_PENDING, run_after__lte=now,
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:limit]
+
+    claimed = []
+    for pk in list(due):
+        updated = Job.objects.filter(pk=pk, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if updated:
+            claimed.append(Job.objects.get(pk=pk))
+    return claimed
+
+
+def run_job(job):
+    handler = TASKS.get(job.task)
+    try:
+        if handler is None:
+            raise LookupError(f"Unknown task '{job.task}'")
+        with transaction.atomic():
+            result = handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.STATUS_FAILED
+            logger.error("Job %s (%s) failed: %s", job.pk, job.task, job.last_error)
+        else:
+            # Exponential backoff: 2s, 4s, 8s...
+            job.status = Job.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+        job.save(update_fields=['status', 'last_error', 'run_after', 'updated_at'])
+        return False
+
+    job.status = Job.STATUS_DONE
+    job.result = result
+    job.save(update_fields=['status', 'result', 'updated_at'])
+    return True
+
+
+def run_job_id(pk):
+    # update() skips auto_now: set updated_at so requeue_stale() sees a fresh claim
+    updated = Job.objects.filter(pk=pk, status=Job.STATUS_PENDING).update(
+        status=Job.STATUS_RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now(),
+    )
+    if updated:
+        run_job(Job.objects.get(pk=pk))
+
+
+def run_pending(limit=10):
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def requeue_stale(older_than):
+    """
+    Puts jobs left running by a crashed worker back in the queue, or fails
+    them when that was their last attempt. Returns how many were handled.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, updated_at__lt=now - older_than)
+    # update() skips auto_now, hence the explicit updated_at
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED,
+        last_error="Worker stopped while running the last attempt.",
+        updated_at=now,
+    )
+    if failed:
+        logger.error("%d stale jobs failed on their last attempt", failed)
+    requeued = stale.update(status=Job.STATUS_PENDING, updated_at=now)
+    return failed + requeued
@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .models import CodeSnippet, SnippetSignature, LSHBucket
+from .algorithms.minhash import minhash_signature, band_hashes, estimate_similarity
+
+
+# ------------------------ INDEX MAINTENANCE -------------------------
+def index_snippet(snippet, tokens=None):
+    """
+    Stores the MinHash signature and band buckets for a snippet.
+    Replaces whatever was indexed for it before.
+    """
+    if tokens is None:
+        tokens = snippet.refresh_fingerprint()['tokens']
+    signature = minhash_signature(tokens)
+
+    with transaction.atomic():
+        LSHBucket.objects.filter(snippet=snippet).delete()
+        SnippetSignature.objects.update_or_create(snippet=snippet, defaults={'minhash': signature})
+        LSHBucket.objects.bulk_create([
+            LSHBucket(snippet=snippet, band=band, bucket=bucket)
+            for band, bucket in band_hashes(signature)
+        ])
+    return signature
+
+
+def drop_snippet(snippet):
+    """
+    Removes a snippet from the bucket index (used for soft delete).
+    The signature row is kept so a restore can re-bucket it cheaply.
+    """
+    LSHBucket.objects.filter(snippet=snippet).delete()
+
+
+def ensure_indexed(snippet):
+    if not LSHBucket.objects.filter(snippet=snippet).exists():
+        restore_snippet(snippet)
+
+
+def restore_snippet(snippet):
+    signature = SnippetSignature.objects.filter(snippet=snippet).values_list('minhash', flat=True).first()
+    if signature is None:
+        return index_snippet(snippet)
+
+    LSHBucket.objects.bulk_create([
+        LSHBucket(snippet=snippet, band=band, bucket=bucket)
+        for band, bucket in band_hashes(signature)
+    ])
+    return signature
+
+
+# ------------------------ LOOKUP -------------------------
+def find_duplicate(snippet, threshold=70):
+    """
+    Returns (duplicate, score, other) for the most similar snippet at or
+    above `threshold` percent. Only snippets sharing an LSH bucket are
+    compared, using stored signatures.
+    """
+    signature = SnippetSignature.objects.filter(snippet=snippet).values_list('minhash', flat=True).first()
+    if signature is None:
+        signature = index_snippet(snippet)
+    if not signature:
+        return False, 0, None
+
+    # Byte-identical code (same content hash, same blob for files) or the
+    # same token set both mean 100%; the stored hashes make that a lookup
+    if snippet.content_hash:
+        exact = CodeSnippet.objects.filter(
+            content_hash=snippet.content_hash, is_deleted=False,
+        ).exclude(pk=snippet.pk).first()
+        if exact:
+            return True, 100.0, exact
+    if snippet.token_digest:
+        exact = CodeSnippet.objects.filter(
+            token_digest=snippet.token_digest, is_deleted=False,
+        ).exclude(pk=snippet.pk).first()
+        if exact:
+            return True, 100.0, exact
+
+    matches = Q()
+    for band, bucket in band_hashes(signature):
+        matches |= Q(band=band, bucket=bucket)
+    # A subquery, so a popular bucket doesn't become thousands of parameters
+    candidate_ids = (
+        LSHBucket.objects.filter(matches)
+        .exclude(snippet_id=snippet.id)
+        .values('snippet_id')
+    )
+
+    best_score, best_id = 0, None
+    candidates = SnippetSignature.objects.filter(
+        snippet_id__in=candidate_ids,
+        snippet__is_deleted=False,
+    ).values_list('snippet_id', 'minhash')
+    for other_id, other_signature in candidates:
+        score = estimate_similarity(signature, other_signature)
+        if score > best_score:
+            best_score, best_id = score, other_id
+
+    if best_score >= threshold:
+        return True, best_score, CodeSnippet.objects.get(pk=best_id)
+    return False, 0, None
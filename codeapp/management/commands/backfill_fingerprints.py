@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from codeapp.algorithms.similarity import FINGERPRINT_VERSION
+from codeapp.models import CodeSnippet, FINGERPRINT_FIELDS
+from codeapp import codesearch, lsh, search
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes missing or outdated snippet fingerprints and reindexes them "
+        "(similarity, full-text and code search), as saving them would."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        stale = CodeSnippet.objects.exclude(fingerprint_version=FINGERPRINT_VERSION).order_by('pk')
+
+        updated = 0
+        for snippet in stale.iterator(chunk_size=options['batch_size']):
+            fp = snippet.refresh_fingerprint()
+            CodeSnippet.objects.filter(pk=snippet.pk).update(
+                **{field: getattr(snippet, field) for field in FINGERPRINT_FIELDS}
+            )
+            if not snippet.is_deleted:
+                lsh.index_snippet(snippet, fp['tokens'])
+                codesearch.index_snippet(snippet, fp['raw'])
+                search.index_snippet(snippet, fp['raw'])
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Fingerprinted {updated} snippets."))
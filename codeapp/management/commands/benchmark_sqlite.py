@@ -0,0 +1,128 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from codeapp import sqlite
+
+# What Django gets out of the box: rollback journal, full fsync, deferred
+# transactions, and Python's default 5 s busy handler.
+STOCK = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'mmap_size': 0,
+    'busy_timeout': 5000,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures concurrent read/write throughput on a scratch SQLite database with "
+        "stock settings and with the tuned profile (codeapp/sqlite.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each run.")
+        parser.add_argument('--rows', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        profiles = [
+            ('stock', STOCK, 'BEGIN'),
+            ('tuned', sqlite.pragmas(), 'BEGIN IMMEDIATE'),
+        ]
+        results = {}
+        for name, pragmas, begin in profiles:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.setup(path, pragmas, options['rows'])
+                results[name] = self.run(path, pragmas, begin, options)
+            r = results[name]
+            self.stdout.write(
+                f"{name:>6}: {r['reads'] / r['seconds']:10.0f} reads/s "
+                f"{r['writes'] / r['seconds']:8.0f} writes/s  {r['errors']} lock errors"
+            )
+
+        stock, tuned = results['stock'], results['tuned']
+        for kind in ('reads', 'writes'):
+            if stock[kind]:
+                gain = (tuned[kind] / tuned['seconds']) / (stock[kind] / stock['seconds'])
+                self.stdout.write(self.style.SUCCESS(f"{kind}: {gain:.1f}x"))
+
+    def connect(self, path, pragmas):
+        conn = sqlite3.connect(path, timeout=pragmas.get('busy_timeout', 5000) / 1000,
+                               isolation_level=None, check_same_thread=False)
+        sqlite.configure(conn.cursor(), pragmas)
+        return conn
+
+    def setup(self, path, pragmas, rows):
+        conn = self.connect(path, pragmas)
+        conn.execute(
+            'CREATE TABLE snippet (id INTEGER PRIMARY KEY, title TEXT, code TEXT, '
+            'views INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO snippet (id, title, code) VALUES (?, ?, ?)',
+            ((i, f'Snippet {i}', 'print("hello")\n' * 20) for i in range(1, rows + 1)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def run(self, path, pragmas, begin, options):
+        rows = options['rows']
+        stop = threading.Event()
+        totals = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def reader():
+            conn, done = self.connect(path, pragmas), 0
+            while not stop.is_set():
+                try:
+                    conn.execute('SELECT title, code, views FROM snippet WHERE id = ?',
+                                 (random.randint(1, rows),)).fetchone()
+                    done += 1
+                except sqlite3.OperationalError:
+                    with lock:
+                        totals['errors'] += 1
+            conn.close()
+            with lock:
+                totals['reads'] += done
+
+        def writer():
+            conn, done = self.connect(path, pragmas), 0
+            while not stop.is_set():
+                try:
+                    # Like a counter flush: a few increments per transaction
+                    conn.execute(begin)
+                    for _ in range(5):
+                        conn.execute('UPDATE snippet SET views = views + 1 WHERE id = ?',
+                                     (random.randint(1, rows),))
+                    conn.execute('COMMIT')
+                    done += 1
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    with lock:
+                        totals['errors'] += 1
+            conn.close()
+            with lock:
+                totals['writes'] += done
+
+        threads = (
+            [threading.Thread(target=reader) for _ in range(options['readers'])]
+            + [threading.Thread(target=writer) for _ in range(options['writers'])]
+        )
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for t in threads:
+            t.join()
+        return {**totals, 'seconds': time.perf_counter() - started}
@@ -0,0 +1,99 @@
+import gzip
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from codeapp.models import Notification
+
+FIELDS = ('id', 'user_id', 'message', 'created_at')
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes old read notifications in batches: those past the retention period, "
+        "and each user's read ones beyond the newest --keep. Unread notifications are never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90),
+                            help="Read notifications older than this are removed.")
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'NOTIFICATION_KEEP_READ', 500),
+                            help="Read notifications kept per user, newest first.")
+        parser.add_argument('--archive', metavar='PATH',
+                            help="Append removed rows to this JSON lines file (gzipped if it ends in .gz).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.archive = None
+        if options['archive'] and not self.dry_run:
+            opener = gzip.open if options['archive'].endswith('.gz') else open
+            self.archive = opener(options['archive'], 'at', encoding='utf-8')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        try:
+            expired = self.expire(cutoff)
+            capped = self.cap(options['keep'], cutoff)
+        finally:
+            if self.archive:
+                self.archive.close()
+
+        verb = 'Would remove' if self.dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {expired} expired and {capped} over-limit read notifications."
+        ))
+
+    def expire(self, cutoff):
+        old = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+        if self.dry_run:
+            return old.count()
+
+        removed = 0
+        while True:
+            batch = list(old.order_by('pk').values(*FIELDS)[:self.batch_size])
+            if not batch:
+                return removed
+            removed += self.remove(batch)
+
+    def cap(self, keep, cutoff):
+        # Within the retention period (what expire() leaves, even on a dry run)
+        recent = Notification.objects.filter(is_read=True, created_at__gte=cutoff)
+        over = (
+            recent.values('user_id').annotate(n=Count('pk')).filter(n__gt=keep)
+            .values_list('user_id', 'n')
+        )
+        removed = 0
+        for user_id, count in list(over):
+            if self.dry_run:
+                removed += count - keep
+                continue
+            newest_first = recent.filter(user_id=user_id).order_by('-created_at', '-pk')
+            while True:
+                # Everything past the newest `keep` goes, a batch at a time
+                batch = list(newest_first.values(*FIELDS)[keep:keep + self.batch_size])
+                if not batch:
+                    break
+                removed += self.remove(batch)
+        return removed
+
+    def remove(self, rows):
+        with transaction.atomic():
+            # Re-checked so a row flipped back to unread meanwhile survives
+            still_read = Notification.objects.select_for_update().filter(pk__in=[row['id'] for row in rows], is_read=True)
+            ids = set(still_read.values_list('pk', flat=True))
+            deleted, _ = Notification.objects.filter(pk__in=ids).delete()
+            if self.archive:
+                # Only what was deleted; written before the commit so a failed
+                # write rolls the delete back instead of losing rows
+                for row in rows:
+                    if row['id'] in ids:
+                        self.archive.write(json.dumps(row, default=str) + '\n')
+                self.archive.flush()
+        return deleted
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from codeapp import compression
+from codeapp.models import CodeSnippet, CompressionDictionary, Blob, LANGUAGE_CHOICES
+from codeapp.storage import blob_name, snippet_storage
+
+
+class Command(BaseCommand):
+    help = "Compresses (or with --decompress, restores) stored snippet code and files in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--train', action='store_true',
+                            help="Train a new dictionary per language from existing snippets first.")
+        parser.add_argument('--samples', type=int, default=500,
+                            help="Snippets sampled per language when training.")
+        parser.add_argument('--decompress', action='store_true',
+                            help="Store everything uncompressed again (turning the feature off).")
+        parser.add_argument('--skip-files', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Stop after this many rows/files (for running in slices).")
+
+    def handle(self, *args, **options):
+        if options['train']:
+            self.train(options['samples'])
+
+        compress = not options['decompress']
+        rows = self.convert_rows(compress, options['batch_size'], options['limit'])
+        self.stdout.write(f"{'Compressed' if compress else 'Decompressed'} code of {rows} snippets.")
+
+        if not options['skip_files']:
+            files = self.convert_files(compress, options['batch_size'], options['limit'])
+            self.stdout.write(f"{'Compressed' if compress else 'Decompressed'} {files} stored files.")
+
+    def train(self, samples):
+        for language, _ in LANGUAGE_CHOICES:
+            recent = (
+                CodeSnippet.objects.filter(language=language)
+                .exclude(code__isnull=True, code_z__isnull=True)
+                .order_by('-pk')[:samples]
+            )
+            texts = [s.code for s in recent if s.code]
+            if len(texts) < 2:
+                continue
+            data = compression.train_dictionary(texts)
+            if data:
+                CompressionDictionary.objects.create(language=language, data=data, sample_count=len(texts))
+                self.stdout.write(f"Trained {language} dictionary: {len(data)} bytes from {len(texts)} snippets.")
+        compression._active.clear()
+
+    def convert_rows(self, compress, batch_size, limit):
+        if compress:
+            todo = CodeSnippet.objects.filter(code__isnull=False).exclude(code='')
+        else:
+            todo = CodeSnippet.objects.filter(code_z__isnull=False)
+        todo = todo.order_by('pk').only('pk', 'language', 'code', 'code_z')
+
+        # Rows leave the filter once converted, so each pass takes the next batch
+        done, last_pk = 0, 0
+        while limit is None or done < limit:
+            size = batch_size if limit is None else min(batch_size, limit - done)
+            batch = list(todo.filter(pk__gt=last_pk)[:size])
+            if not batch:
+                break
+            with transaction.atomic():
+                for snippet in batch:
+                    text = snippet.code
+                    payload = None
+                    if compress:
+                        payload = compression.compress(text.encode('utf-8'), snippet.language)
+                        if len(payload) >= len(text.encode('utf-8')):
+                            payload = None
+                    CodeSnippet.objects.filter(pk=snippet.pk).update(
+                        code=None if payload else text,
+                        code_z=payload,
+                    )
+            done += len(batch)
+            last_pk = batch[-1].pk
+        return done
+
+    def convert_files(self, compress, batch_size, limit):
+        storage = snippet_storage()
+        done = 0
+        for digest in Blob.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+            if limit is not None and done >= limit:
+                break
+            name = blob_name(digest)
+            if not storage.exists(name) or storage.is_compressed(name) == compress:
+                continue
+            storage.rewrite(name, compressed=compress)
+            done += 1
+        return done
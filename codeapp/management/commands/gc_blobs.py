@@ -0,0 +1,102 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.base import File
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from codeapp.models import CodeSnippet, Blob
+from codeapp.storage import BLOB_PREFIX, blob_name, digest_of, snippet_storage
+
+
+class Command(BaseCommand):
+    help = "Deletes stored snippet files no snippet references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true',
+                            help="First move uploads stored under their upload name into the blob store.")
+        parser.add_argument('--recount', action='store_true',
+                            help="Recompute reference counts from the snippet table before collecting.")
+        parser.add_argument('--grace', type=int, default=60,
+                            help="Minutes a blob must have been unused before it is deleted.")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = snippet_storage()
+        if options['adopt']:
+            self.adopt(storage, options['batch_size'], options['dry_run'])
+        if options['recount']:
+            self.recount(storage, options['dry_run'])
+        self.collect(storage, options['grace'], options['dry_run'])
+
+    def adopt(self, storage, batch_size, dry_run):
+        legacy = (
+            CodeSnippet.objects.exclude(file='').exclude(file__isnull=True)
+            .exclude(file__startswith=f'{BLOB_PREFIX}/').order_by('pk')
+        )
+        moved = 0
+        for snippet in legacy.iterator(chunk_size=batch_size):
+            old_name = snippet.file.name
+            if not storage.exists(old_name):
+                self.stderr.write(f"Snippet {snippet.pk}: {old_name} is missing, skipped.")
+                continue
+            if dry_run:
+                moved += 1
+                continue
+
+            with storage.open(old_name, 'rb') as f:
+                new_name = storage.save(old_name, File(f))
+            CodeSnippet.objects.filter(pk=snippet.pk).update(
+                file=new_name,
+                original_filename=snippet.original_filename or os.path.basename(old_name),
+            )
+            Blob.acquire(new_name, storage.size(new_name))
+            if not CodeSnippet.objects.filter(file=old_name).exists():
+                storage.delete(old_name)
+            moved += 1
+
+        self.stdout.write(f"{'Would adopt' if dry_run else 'Adopted'} {moved} legacy uploads.")
+
+    def recount(self, storage, dry_run):
+        names = CodeSnippet.objects.filter(file__startswith=f'{BLOB_PREFIX}/').values_list('file', flat=True)
+        counts = Counter(digest_of(name) for name in names.iterator())
+        counts.pop(None, None)
+
+        fixed = 0
+        for blob in Blob.objects.iterator():
+            actual = counts.pop(blob.pk, 0)
+            if blob.refcount != actual:
+                fixed += 1
+                if not dry_run:
+                    Blob.objects.filter(pk=blob.pk).update(refcount=actual, updated_at=timezone.now())
+        for digest, actual in counts.items():
+            fixed += 1
+            if not dry_run:
+                name = blob_name(digest)
+                size = storage.size(name) if storage.exists(name) else 0
+                Blob.objects.create(sha256=digest, size=size, refcount=actual)
+
+        self.stdout.write(f"{'Would fix' if dry_run else 'Fixed'} {fixed} reference counts.")
+
+    def collect(self, storage, grace, dry_run):
+        cutoff = timezone.now() - timedelta(minutes=grace)
+        unused = Blob.objects.filter(refcount=0, updated_at__lt=cutoff)
+
+        deleted = freed = 0
+        for blob in unused.iterator():
+            name = blob_name(blob.pk)
+            if CodeSnippet.objects.filter(file=name).exists():
+                continue  # count drifted; --recount repairs it
+            if dry_run:
+                deleted, freed = deleted + 1, freed + blob.size
+                continue
+            # Only if nobody acquired it since we looked
+            removed, _ = Blob.objects.filter(pk=blob.pk, refcount=0).delete()
+            if removed:
+                storage.delete(name)
+                deleted, freed = deleted + 1, freed + blob.size
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} unused blobs ({freed} bytes)."))
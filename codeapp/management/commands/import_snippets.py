@@ -0,0 +1,250 @@
+import hashlib
+import itertools
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from codeapp import archive, home_cache, search
+from codeapp.algorithms.analysis import analyze
+from codeapp.algorithms.similarity import FINGERPRINT_VERSION
+from codeapp.jobs import enqueue_many
+from codeapp.models import (
+    CodeSnippet, UserStats, Blob, SnippetSignature, LSHBucket, SnippetSearchText, CodeTrigram,
+    LANGUAGE_CHOICES, LANGUAGE_EXTENSIONS, FINGERPRINT_FIELDS,
+)
+from codeapp.storage import snippet_storage
+from codeapp.tasks import CHECK_DUPLICATE
+
+LANGUAGES = {code for code, _ in LANGUAGE_CHOICES}
+
+
+def analyze_record(args):
+    # Runs in the worker processes
+    return analyze(*args)
+
+
+def source_of(record):
+    """
+    The code as read_source() will see it once stored: files that aren't
+    UTF-8 read as empty, pasted code is stored decoded.
+    """
+    if not record['filename']:
+        return record['content'].decode('utf-8', errors='replace')
+    try:
+        return record['content'].decode('utf-8')
+    except UnicodeDecodeError:
+        return ''
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports snippets from a JSON lines or tar archive (see codeapp/archive.py), streamed in "
+        "batches: fingerprints and index data are computed in a process pool, rows are inserted with "
+        "bulk_create and the similarity/search indexes and contributor stats are filled in per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archive: .jsonl, .jsonl.gz, .tar, .tar.gz or .tgz.")
+        parser.add_argument('--author', metavar='USERNAME',
+                            help="Owner for snippets whose author has no account here (otherwise they are skipped).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes fingerprinting snippets; 1 runs everything in this process.")
+        parser.add_argument('--skip-duplicates', action='store_true',
+                            help="Skip snippets with the same tokens as a live snippet (a 100%% similarity match).")
+        parser.add_argument('--check-similarity', action='store_true',
+                            help="Queue the usual near-duplicate check (manage.py run_jobs) for every imported snippet.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError(f"{options['path']} does not exist.")
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        self.verbosity = options['verbosity']
+        self.skip_duplicates = options['skip_duplicates']
+        self.check_similarity = options['check_similarity']
+        self.authors = {}
+        self.default_author = None
+        if options['author']:
+            self.default_author = User.objects.filter(username=options['author']).values_list('pk', flat=True).first()
+            if self.default_author is None:
+                raise CommandError(f"No user named '{options['author']}'.")
+
+        self.counts = Counter()
+        started = time.perf_counter()
+        batches = self.batches(archive.read(options['path']))
+        try:
+            if self.workers > 1:
+                with Pool(self.workers) as pool:
+                    self.pipeline(batches, pool)
+            else:
+                for batch in batches:
+                    self.write(batch, map(analyze_record, self.analysis_args(batch)))
+        except archive.ArchiveError as e:
+            raise CommandError(f"Malformed archive: {e}")
+        finally:
+            if self.counts['imported']:
+                home_cache.invalidate()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.counts['imported']} snippets in {elapsed:.1f}s "
+            f"({self.counts['no_author']} skipped without an author, {self.counts['language']} skipped with an "
+            f"unknown language, {self.counts['duplicate']} duplicates skipped)."
+        ))
+
+    def batches(self, records):
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def analysis_args(self, batch):
+        return [(source_of(record), record['language'] or '') for record in batch]
+
+    def pipeline(self, batches, pool):
+        # The pool analyses the next batch while this process writes the
+        # current one; at most two batches are held in memory.
+        pending = None
+        for batch in batches:
+            chunksize = max(1, len(batch) // (4 * self.workers))
+            result = pool.map_async(analyze_record, self.analysis_args(batch), chunksize)
+            if pending:
+                self.write(pending[0], pending[1].get())
+            pending = (batch, result)
+        if pending:
+            self.write(pending[0], pending[1].get())
+
+    # ------------------------ WRITING -------------------------
+    def author_ids(self, batch):
+        missing = {record['author'] for record in batch if record['author'] and record['author'] not in self.authors}
+        if missing:
+            found = dict(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+            for username in missing:
+                self.authors[username] = found.get(username, self.default_author)
+        return [self.authors.get(record['author'], self.default_author) for record in batch]
+
+    def existing_digests(self, analyses):
+        digests = {info['token_digest'] for info in analyses if info['token_count']}
+        return set(
+            CodeSnippet.objects.filter(token_digest__in=digests, is_deleted=False)
+            .values_list('token_digest', flat=True)
+        )
+
+    def write(self, batch, analyses):
+        analyses = list(analyses)
+        seen = self.existing_digests(analyses) if self.skip_duplicates else set()
+
+        accepted = []
+        for record, author_id, info in zip(batch, self.author_ids(batch), analyses):
+            if author_id is None:
+                self.counts['no_author'] += 1
+                continue
+            if record['language'] not in LANGUAGES:
+                self.counts['language'] += 1
+                continue
+            if self.skip_duplicates and info['token_count']:
+                if info['token_digest'] in seen:
+                    self.counts['duplicate'] += 1
+                    continue
+                seen.add(info['token_digest'])
+            accepted.append((record, author_id, info))
+        if not accepted:
+            return
+
+        # Files are stored before the transaction below. Their Blob rows go
+        # in first, unreferenced, so a batch that rolls back leaves blobs
+        # gc_blobs collects instead of files nothing tracks.
+        self.register_blobs(record for record, _, _ in accepted)
+        rows = [(self.build(record, author_id, info), record, info) for record, author_id, info in accepted]
+
+        with transaction.atomic():
+            snippets = CodeSnippet.objects.bulk_create([snippet for snippet, _, _ in rows])
+            self.restore_dates(rows)
+            self.index(rows)
+
+            for snippet, record, _ in rows:
+                if snippet.file:
+                    Blob.acquire(snippet.file.name, len(record['content']))
+            for author_id, count in Counter(snippet.author_id for snippet in snippets).items():
+                UserStats.adjust(author_id, snippet_count=count)
+            if self.check_similarity:
+                enqueue_many(CHECK_DUPLICATE, ({'snippet_id': snippet.pk} for snippet in snippets),
+                             label="Similarity check (import)")
+
+        self.counts['imported'] += len(snippets)
+        if self.verbosity > 1:
+            self.stdout.write(f"{self.counts['imported']} imported...")
+
+    def register_blobs(self, records):
+        blobs = {}
+        for record in records:
+            if record['filename']:
+                digest = hashlib.sha256(record['content']).hexdigest()
+                blobs[digest] = Blob(sha256=digest, size=len(record['content']), refcount=0)
+        # Existing blobs only get updated_at bumped, restarting gc_blobs' grace period
+        Blob.objects.bulk_create(
+            blobs.values(), update_conflicts=True, unique_fields=['sha256'], update_fields=['updated_at'],
+        )
+
+    def build(self, record, author_id, info):
+        snippet = CodeSnippet(
+            title=(record['title'] or record['filename'] or 'Untitled')[:200],
+            description=record['description'] or '',
+            language=record['language'],
+            author_id=author_id,
+            fingerprint_version=FINGERPRINT_VERSION,
+            **{field: info[field] for field in FINGERPRINT_FIELDS if field != 'fingerprint_version'},
+        )
+        if record['filename']:
+            # Content addressed: re-importing the same file stores nothing new
+            snippet.file.name = snippet_storage().save(record['filename'], ContentFile(record['content']))
+            snippet.original_filename = record['filename']
+        else:
+            snippet.code = record['content'].decode('utf-8', errors='replace')
+            snippet.generated_filename = f"{snippet.title}.{LANGUAGE_EXTENSIONS.get(snippet.language, 'txt')}"
+        return snippet
+
+    def restore_dates(self, rows):
+        # created_at is auto_now_add, which bulk_create fills with now()
+        dated = []
+        for snippet, record, _ in rows:
+            created_at = parse_datetime(record['created_at'] or '')
+            if created_at is not None:
+                snippet.created_at = created_at
+                dated.append(snippet)
+        if dated:
+            CodeSnippet.objects.bulk_update(dated, ['created_at'])
+
+    def index(self, rows):
+        """
+        What the post_save index signals do per snippet, in bulk. Buckets and
+        trigrams (a few hundred rows per snippet) skip model instances and
+        go in with executemany.
+        """
+        SnippetSignature.objects.bulk_create(
+            SnippetSignature(snippet_id=snippet.pk, minhash=info['minhash']) for snippet, _, info in rows
+        )
+        SnippetSearchText.objects.bulk_create(
+            SnippetSearchText(snippet_id=snippet.pk, text=info['search_text']) for snippet, _, info in rows
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {LSHBucket._meta.db_table} (snippet_id, band, bucket) VALUES (%s, %s, %s)",
+                [(snippet.pk, band, bucket) for snippet, _, info in rows for band, bucket in info['buckets']],
+            )
+            cursor.executemany(
+                f"INSERT INTO {CodeTrigram._meta.db_table} (snippet_id, trigram) VALUES (%s, %s)",
+                [(snippet.pk, trigram) for snippet, _, info in rows for trigram in info['trigrams']],
+            )
+        backend = search.get_backend()
+        for snippet, _, info in rows:
+            backend.index(snippet, info['search_body'])
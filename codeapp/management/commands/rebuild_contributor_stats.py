@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum, Q, OuterRef, Subquery
+
+from codeapp.models import UserStats, Notification
+
+
+class Command(BaseCommand):
+    help = "Recomputes the contributor leaderboard and unread notification columns of UserStats from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        live = Q(codesnippets__is_deleted=False)
+        # A subquery, not a second join, so it doesn't multiply the snippet aggregates
+        unread = (
+            Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+            .values('user').annotate(n=Count('pk')).values('n')
+        )
+        users = User.objects.annotate(
+            live_snippets=Count('codesnippets', filter=live),
+            deleted_snippets=Count('codesnippets', filter=Q(codesnippets__is_deleted=True)),
+            downloads=Sum('codesnippets__downloads', filter=live),
+            reports=Sum('codesnippets__reports_count', filter=live),
+            unread=Subquery(unread),
+        ).order_by('pk')
+
+        batch, updated = [], 0
+        for user in users.iterator(chunk_size=options['batch_size']):
+            batch.append(UserStats(
+                user=user,
+                snippet_count=user.live_snippets,
+                deleted_count=user.deleted_snippets,
+                download_count=user.downloads or 0,
+                report_count=user.reports or 0,
+                unread_count=user.unread or 0,
+            ))
+            if len(batch) >= options['batch_size']:
+                updated += self.save(batch)
+                batch = []
+        updated += self.save(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {updated} users."))
+
+    def save(self, batch):
+        with transaction.atomic():
+            UserStats.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['snippet_count', 'deleted_count', 'download_count', 'report_count', 'unread_count'],
+            )
+        return len(batch)
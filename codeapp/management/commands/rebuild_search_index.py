@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from codeapp.algorithms.similarity import extract_code
+from codeapp.models import CodeSnippet
+from codeapp import search, codesearch
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text and code (trigram) search indexes for all snippets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        backend.clear()
+
+        indexed = 0
+        snippets = CodeSnippet.objects.filter(is_deleted=False).order_by('pk')
+        for snippet in snippets.iterator(chunk_size=options['batch_size']):
+            raw = extract_code(snippet)
+            search.index_snippet(snippet, raw)
+            codesearch.index_snippet(snippet, raw)
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} snippets with {type(backend).__name__}."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from codeapp.models import CodeSnippet, LSHBucket
+from codeapp import lsh
+
+
+class Command(BaseCommand):
+    help = "Rebuilds MinHash signatures and LSH buckets for all snippets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        LSHBucket.objects.all().delete()
+
+        indexed = 0
+        snippets = CodeSnippet.objects.filter(is_deleted=False).order_by('pk')
+        for snippet in snippets.iterator(chunk_size=options['batch_size']):
+            lsh.index_snippet(snippet)
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} snippets."))
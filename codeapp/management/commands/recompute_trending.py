@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from codeapp import trending
+
+
+class Command(BaseCommand):
+    help = "Folds new engagement into trending scores (run every few minutes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help="Also delete applied buckets older than the week window.")
+
+    def handle(self, *args, **options):
+        updated = trending.recompute_trending()
+        self.stdout.write(self.style.SUCCESS(f"Rescored {updated} snippets."))
+
+        if options['prune']:
+            pruned = trending.prune_buckets()
+            self.stdout.write(f"Pruned {pruned} old buckets.")
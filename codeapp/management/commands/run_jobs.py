@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from codeapp import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (duplicate checks, notifications)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--batch', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when idle.")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Requeue jobs left running longer than this many seconds.")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        total = 0
+
+        while True:
+            jobs.requeue_stale(stale_after)
+            ran = jobs.run_pending(options['batch'])
+            total += ran
+
+            if ran:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {total} jobs."))
@@ -0,0 +1,23 @@
+import sqlite3
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = "Copies the SQLite primary into the stand-in replica file(s), like replication catching up."
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("Only the local SQLite setup has stand-in replicas; real ones replicate themselves.")
+
+        aliases = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+        with closing(sqlite3.connect(primary['NAME'])) as source:
+            for alias in aliases:
+                # The backup API copies a consistent snapshot, even mid-write
+                with closing(sqlite3.connect(settings.DATABASES[alias]['NAME'])) as target:
+                    source.backup(target)
+                self.stdout.write(f"{alias}: synced from {primary['NAME']}")
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0010_remove_userstats_uploads_count_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minhash', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('snippet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='signature', to='codeapp.codesnippet')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.CharField(max_length=16)),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='codeapp.codesnippet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='codeapp_lsh_band_bucket_idx')],
+            },
+        ),
+    ]
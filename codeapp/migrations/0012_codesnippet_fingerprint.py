@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0011_snippet_similarity_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesnippet',
+            name='fingerprint_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='codesnippet',
+            name='normalized_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='codesnippet',
+            name='token_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='codesnippet',
+            name='token_digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:59
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0013_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesnippet',
+            name='popularity_score',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Greatest(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('views'), '*', models.Value(1)), '+', django.db.models.expressions.CombinedExpression(models.F('downloads'), '*', models.Value(5))), '+', django.db.models.expressions.CombinedExpression(models.F('reports_count'), '*', models.Value(-2))), models.Value(0), output_field=models.IntegerField()), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='codesnippet',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-popularity_score', '-created_at'], name='codeapp_snippet_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0014_codesnippet_popularity_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_score', models.FloatField(default=0)),
+                ('week_score', models.FloatField(default=0)),
+                ('scored_at', models.DateTimeField()),
+                ('last_engaged_at', models.DateTimeField(db_index=True)),
+                ('snippet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='codeapp.codesnippet')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EngagementBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('downloads', models.PositiveIntegerField(default=0)),
+                ('reports', models.PositiveIntegerField(default=0)),
+                ('applied_points', models.IntegerField(default=0)),
+                ('is_dirty', models.BooleanField(default=True)),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement', to='codeapp.codesnippet')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_dirty', True)), fields=['snippet'], name='codeapp_engagement_dirty_idx')],
+                'constraints': [models.UniqueConstraint(fields=('snippet', 'hour'), name='codeapp_engagement_snippet_hour_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, OperationalError
+
+FTS_TABLE = 'codeapp_snippet_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    # Only SQLite builds with FTS5 get the table; other setups use the
+    # LIKE-based fallback backend in codeapp.search.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, description, language, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0015_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
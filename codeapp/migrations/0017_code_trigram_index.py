@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0016_snippet_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetSearchText',
+            fields=[
+                ('snippet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_text', serialize=False, to='codeapp.codesnippet')),
+                ('text', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CodeTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='codeapp.codesnippet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'snippet'), name='codeapp_trigram_snippet_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_contributor_stats(apps, schema_editor):
+    # Same aggregation as `manage.py rebuild_contributor_stats`
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('codeapp', 'UserStats')
+    live = models.Q(codesnippets__is_deleted=False)
+    users = User.objects.annotate(
+        live_snippets=models.Count('codesnippets', filter=live),
+        deleted_snippets=models.Count('codesnippets', filter=models.Q(codesnippets__is_deleted=True)),
+        downloads=models.Sum('codesnippets__downloads', filter=live),
+        reports=models.Sum('codesnippets__reports_count', filter=live),
+    )
+    for user in users.iterator():
+        UserStats.objects.update_or_create(user_id=user.pk, defaults={
+            'snippet_count': user.live_snippets,
+            'deleted_count': user.deleted_snippets,
+            'download_count': user.downloads or 0,
+            'report_count': user.reports or 0,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0017_code_trigram_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContributorStats',
+            fields=[
+            ],
+            options={
+                'verbose_name_plural': 'contributor stats',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('codeapp.userstats',),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='report_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='snippet_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['-snippet_count', '-download_count'], name='codeapp_userstats_top_idx'),
+        ),
+        migrations.RunPython(populate_contributor_stats, migrations.RunPython.noop),
+    ]
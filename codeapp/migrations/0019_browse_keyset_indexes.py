@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0018_contributor_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='codesnippet',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='codeapp_snippet_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codesnippet',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['language', '-created_at', '-id'], name='codeapp_snippet_lang_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codesnippet',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-views', '-id'], name='codeapp_snippet_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codesnippet',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['language', '-views', '-id'], name='codeapp_snippet_lang_view_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0019_browse_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesnippet',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
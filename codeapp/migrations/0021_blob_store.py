@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+import codeapp.storage
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_original_filenames(apps, schema_editor):
+    # Existing uploads keep their upload name until `gc_blobs --adopt` moves them
+    CodeSnippet = apps.get_model('codeapp', 'CodeSnippet')
+    uploads = CodeSnippet.objects.exclude(file='').exclude(file__isnull=True).only('pk', 'file')
+    for snippet in uploads.iterator():
+        CodeSnippet.objects.filter(pk=snippet.pk).update(original_filename=snippet.file.name.split('/')[-1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0020_codesnippet_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesnippet',
+            name='original_filename',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='codesnippet',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=codeapp.storage.snippet_storage, upload_to='snippets/'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount', 0)), fields=['updated_at'], name='codeapp_blob_unused_idx')],
+            },
+        ),
+        migrations.RunPython(fill_original_filenames, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+import codeapp.compression
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0021_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesnippet',
+            name='code_z',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='codesnippet',
+            name='code',
+            field=codeapp.compression.CompressedTextField(blank=True, compressed_field='code_z', null=True),
+        ),
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(choices=[('python', 'Python'), ('java', 'Java'), ('cpp', 'C++'), ('javascript', 'JavaScript'), ('c', 'C'), ('html', 'HTML'), ('css', 'CSS'), ('dart', 'Dart')], max_length=50)),
+                ('data', models.BinaryField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'compression dictionaries',
+                'indexes': [models.Index(fields=['language', '-id'], name='codeapp_zdict_lang_idx')],
+            },
+        ),
+    ]
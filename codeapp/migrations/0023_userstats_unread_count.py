@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_unread(apps, schema_editor):
+    Notification = apps.get_model('codeapp', 'Notification')
+    UserStats = apps.get_model('codeapp', 'UserStats')
+    unread = (
+        Notification.objects.filter(user=OuterRef('user'), is_read=False)
+        .values('user').annotate(n=Count('pk')).values('n')
+    )
+    recipients = Notification.objects.filter(is_read=False).values('user')
+    UserStats.objects.filter(user__in=recipients).update(unread_count=Subquery(unread))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0022_snippet_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
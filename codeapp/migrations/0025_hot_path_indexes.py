@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0024_notification_inbox_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='codeapp_notif_inbox_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='codeapp_notif_user_new_idx',
+        ),
+        migrations.AddIndex(
+            model_name='codesnippet',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['author', '-created_at'], name='codeapp_snippet_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['created_by', 'task', '-created_at'], name='codeapp_job_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at', '-id'], name='codeapp_notif_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='codeapp_notif_user_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['resolved', '-created_at', '-id'], name='codeapp_report_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+from codeapp.algorithms.minhash import band_hashes
+
+
+def rebucket(apps, schema_editor):
+    # Banding changed from 32x4 to 20x6. Stored signatures are still
+    # valid; only the buckets are re-derived (soft-deleted snippets have
+    # none and get theirs on restore).
+    SnippetSignature = apps.get_model('codeapp', 'SnippetSignature')
+    LSHBucket = apps.get_model('codeapp', 'LSHBucket')
+
+    LSHBucket.objects.all().delete()
+    live = SnippetSignature.objects.filter(snippet__is_deleted=False).values_list('snippet_id', 'minhash')
+    batch = []
+    for snippet_id, signature in live.iterator(chunk_size=500):
+        batch.extend(
+            LSHBucket(snippet_id=snippet_id, band=band, bucket=bucket)
+            for band, bucket in band_hashes(signature)
+        )
+        if len(batch) >= 5000:
+            LSHBucket.objects.bulk_create(batch)
+            batch = []
+    LSHBucket.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codeapp', '0025_hot_path_indexes'),
+    ]
+
+    operations = [
+        # Reversing leaves the new buckets; run rebuild_similarity_index
+        # with the old code instead.
+        migrations.RunPython(rebucket, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,16 @@
+import os
+
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .algorithms.similarity import FINGERPRINT_VERSION, read_source, normalize_code, fingerprint, content_hash
+from .algorithms.popularity import popularity_expression
+from .storage import snippet_storage, digest_of
+from .compression import CompressedTextField, decompress
+
 # ------------------------
 # Language Choices
 # ------------------------
@@ -27,6 +37,14 @@ LANGUAGE_EXTENSIONS = {
     'dart': 'dart',
 }
 
+# Columns the fingerprint is derived from / written by refresh_fingerprint()
+CONTENT_FIELDS = {'code', 'file'}
+# Saving a change to any of these refingerprints, so the index signals get
+# fresh tokens and text (code search text also depends on the language)
+REINDEX_FIELDS = CONTENT_FIELDS | {'language'}
+COMPRESSED_FIELDS = {'code': 'code_z'}
+FINGERPRINT_FIELDS = ['fingerprint_version', 'content_hash', 'normalized_hash', 'token_digest', 'token_count']
+
 # ------------------------
 # CodeSnippet Model
 # ------------------------
@@ -35,8 +53,13 @@ class CodeSnippet(models.Model):
     description = models.TextField(blank=True)
     language = models.CharField(max_length=50, choices=LANGUAGE_CHOICES)
 
-    code = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to="snippets/", blank=True, null=True)
+    # With SNIPPET_COMPRESSION on, code is stored compressed in code_z
+    # (column `code` is then NULL) and decompressed on first access.
+    code = CompressedTextField(blank=True, null=True, compressed_field='code_z')
+    code_z = models.BinaryField(blank=True, null=True, editable=False)
+    # Content-addressed: identical uploads share one blob (see Blob below)
+    file = models.FileField(upload_to="snippets/", storage=snippet_storage, blank=True, null=True)
+    original_filename = models.CharField(max_length=255, blank=True)
 
     # Stores filename for pasted code (.py, .java, etc.)
     generated_filename = models.CharField(max_length=255, blank=True, null=True)
@@ -54,9 +77,178 @@ class CodeSnippet(models.Model):
     reports_count = models.PositiveIntegerField(default=0)
     likes = models.PositiveIntegerField(default=0)
 
+    # calculate_popularity(), kept up to date by the database on every counter change
+    popularity_score = models.GeneratedField(
+        expression=popularity_expression(),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+
+    # Derived fingerprint of the normalized code (see algorithms.similarity)
+    fingerprint_version = models.PositiveSmallIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    normalized_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    token_digest = models.CharField(max_length=64, blank=True, db_index=True)
+    token_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Partial: public queries always filter is_deleted=False
+            models.Index(
+                fields=['-popularity_score', '-created_at'],
+                condition=models.Q(is_deleted=False),
+                name='codeapp_snippet_popular_idx',
+            ),
+            # Keyset pagination on /browse/: seek on (sort key, id)
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_deleted=False),
+                name='codeapp_snippet_newest_idx',
+            ),
+            models.Index(
+                fields=['language', '-created_at', '-id'],
+                condition=models.Q(is_deleted=False),
+                name='codeapp_snippet_lang_new_idx',
+            ),
+            models.Index(
+                fields=['-views', '-id'],
+                condition=models.Q(is_deleted=False),
+                name='codeapp_snippet_views_idx',
+            ),
+            models.Index(
+                fields=['language', '-views', '-id'],
+                condition=models.Q(is_deleted=False),
+                name='codeapp_snippet_lang_view_idx',
+            ),
+            # Profile and dashboard: a user's live snippets, newest first
+            models.Index(
+                fields=['author', '-created_at'],
+                condition=models.Q(is_deleted=False),
+                name='codeapp_snippet_author_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.language})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so save() can tell whether the content
+        # changed, and move the blob reference
+        loaded = dict(zip(field_names, values))
+        if 'file' in loaded:
+            instance._stored_file = loaded['file'] or ''
+        instance._stored_content = {f: loaded[f] for f in ('code', 'code_z', 'language') if f in loaded}
+        return instance
+
+    @property
+    def fingerprint_is_stale(self):
+        return self.fingerprint_version != FINGERPRINT_VERSION
+
+    def refresh_fingerprint(self):
+        """
+        Recomputes the stored fingerprint from the code or file (does not save).
+        Returns the full fingerprint (incl. token set and raw code) so callers
+        can reuse it instead of re-reading and re-tokenizing.
+        """
+        source = read_source(self)
+        raw = source.strip()
+        fp = fingerprint(normalize_code(raw))
+        fp['raw'] = raw
+        self.content_hash = content_hash(source) if source else ''
+        self.normalized_hash = fp['normalized_hash']
+        self.token_digest = fp['token_digest']
+        self.token_count = fp['token_count']
+        self.fingerprint_version = FINGERPRINT_VERSION
+        return fp
+
+    def content_changed(self):
+        """
+        Whether code, file or language differ from what was loaded (always
+        true for rows not loaded from the database). Deferred fields that
+        were never set count as unchanged.
+        """
+        stored = getattr(self, '_stored_content', None)
+        if stored is None:
+            return True
+        if 'file' in self.__dict__ and (self.file.name or '') != getattr(self, '_stored_file', ''):
+            return True
+        if 'language' in stored and self.language != stored['language']:
+            return True
+        if 'code' in self.__dict__ and 'code' in stored and self.__dict__['code'] != stored['code']:
+            payload = stored.get('code_z')
+            if stored['code'] is not None or not payload:
+                return True
+            # Stored compressed: the text in __dict__ may just be the decompressed column
+            return self.__dict__['code'] != decompress(payload).decode('utf-8')
+        return False
+
+    def save(self, *args, **kwargs):
+        # Fingerprint once, when the content is new or changed. The result is
+        # kept on the instance for the index signals to reuse.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            changed = self.fingerprint_is_stale or self.content_changed()
+        else:
+            changed = bool(REINDEX_FIELDS.intersection(update_fields))
+
+        if changed:
+            self._fingerprint = self.refresh_fingerprint()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(FINGERPRINT_FIELDS)
+
+        if update_fields is not None:
+            extra = {COMPRESSED_FIELDS[f] for f in update_fields if f in COMPRESSED_FIELDS}
+            if extra:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | extra
+
+        if self.file and not self.file._committed:
+            # The blob is named by its hash; keep the name the user gave it
+            self.original_filename = os.path.basename(self.file.name)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'original_filename'}
+
+        super().save(*args, **kwargs)
+        self._stored_content = {f: self.__dict__[f] for f in ('code', 'code_z', 'language') if f in self.__dict__}
+
+        stored = getattr(self, '_stored_file', '')
+        current = self.file.name or ''
+        if current != stored:
+            if current:
+                Blob.acquire(current, self.file.size)
+            if stored:
+                Blob.release(stored)
+            self._stored_file = current
+
+    def soft_delete(self):
+        if self.is_deleted:
+            return
+        self.is_deleted = True
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['is_deleted', 'deleted_at'])
+        UserStats.adjust(
+            self.author_id,
+            snippet_count=-1,
+            download_count=-self.downloads,
+            report_count=-self.reports_count,
+            deleted_count=1,
+        )
+
+    def restore(self):
+        if not self.is_deleted:
+            return
+        self.is_deleted = False
+        self.deleted_at = None
+        self.save(update_fields=['is_deleted', 'deleted_at'])
+        UserStats.adjust(
+            self.author_id,
+            snippet_count=1,
+            download_count=self.downloads,
+            report_count=self.reports_count,
+            deleted_count=-1,
+        )
+
     @property
     def extension(self):
         """Returns the correct file extension based on language."""
@@ -73,6 +265,12 @@ class Report(models.Model):
     resolved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Admin review queue (ReportAdmin.ordering), filtered by resolved
+            models.Index(fields=['resolved', '-created_at', '-id'], name='codeapp_report_queue_idx'),
+        ]
+
     def __str__(self):
         return f"Report on {self.snippet.title} by {self.reported_by.username}"
 
@@ -86,6 +284,20 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Inbox pages (all / unread) and the navbar dropdown, newest
+            # first; -id matches the keyset tie-breaker so nothing is sorted.
+            # Unread is partial: SQLite can't seek on a boolean column
+            # (is_read=False compiles to NOT is_read).
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                condition=models.Q(is_read=False),
+                name='codeapp_notif_inbox_idx',
+            ),
+            models.Index(fields=['user', '-created_at', '-id'], name='codeapp_notif_user_new_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message[:30]}"
 
@@ -97,5 +309,244 @@ class UserStats(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     deleted_count = models.PositiveIntegerField(default=0)
 
+    # Contributor leaderboard, over non-deleted snippets only. Maintained
+    # incrementally; `manage.py rebuild_contributor_stats` recomputes it.
+    snippet_count = models.PositiveIntegerField(default=0)
+    download_count = models.PositiveIntegerField(default=0)
+    report_count = models.PositiveIntegerField(default=0)
+
+    # Unread notifications, kept in step by codeapp.notify
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-snippet_count', '-download_count'], name='codeapp_userstats_top_idx'),
+        ]
+
     def __str__(self):
         return f"Stats for {self.user.username}"
+
+    @classmethod
+    def adjust(cls, user_id, **deltas):
+        """
+        Atomically adds deltas, e.g. adjust(user_id, snippet_count=1).
+        """
+        deltas = {field: amount for field, amount in deltas.items() if amount}
+        if not deltas:
+            return
+        changes = {
+            field: Greatest(F(field) + amount, 0, output_field=models.IntegerField())
+            for field, amount in deltas.items()
+        }
+        if not cls.objects.filter(user_id=user_id).update(**changes):
+            cls.objects.get_or_create(user_id=user_id)
+            cls.objects.filter(user_id=user_id).update(**changes)
+
+
+class ContributorStatsManager(models.Manager):
+    def top(self, limit=6):
+        return self.select_related('user').order_by('-snippet_count', '-download_count')[:limit]
+
+
+class ContributorStats(UserStats):
+    """
+    Leaderboard view of UserStats (same table).
+    """
+    objects = ContributorStatsManager()
+
+    class Meta:
+        proxy = True
+        verbose_name_plural = 'contributor stats'
+
+
+# ------------------------
+# Blob Model
+# ------------------------
+class Blob(models.Model):
+    """
+    One stored file in the content-addressed snippet storage. refcount is
+    the number of snippet rows using it, soft-deleted ones included (they
+    can be restored); `manage.py gc_blobs` removes blobs nobody uses.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], condition=models.Q(refcount=0), name='codeapp_blob_unused_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.refcount} refs)"
+
+    @classmethod
+    def acquire(cls, name, size=0):
+        digest = digest_of(name)
+        if digest is None:
+            return  # legacy upload outside the blob store
+        _, created = cls.objects.get_or_create(sha256=digest, defaults={'size': size, 'refcount': 1})
+        if not created:
+            cls.objects.filter(pk=digest).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+
+    @classmethod
+    def release(cls, name):
+        digest = digest_of(name)
+        if digest is None:
+            return
+        cls.objects.filter(pk=digest).update(
+            refcount=Greatest(F('refcount') - 1, 0, output_field=models.IntegerField()),
+            updated_at=timezone.now(),
+        )
+
+
+# ------------------------
+# Compression Dictionary Model
+# ------------------------
+class CompressionDictionary(models.Model):
+    """
+    Preset zlib dictionary for one language (see codeapp.compression).
+    The newest per language compresses new code; older ones stay for
+    decompressing rows that still reference them.
+    """
+    language = models.CharField(max_length=50, choices=LANGUAGE_CHOICES)
+    data = models.BinaryField()
+    sample_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'compression dictionaries'
+        indexes = [
+            models.Index(fields=['language', '-id'], name='codeapp_zdict_lang_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.language} dictionary #{self.pk} ({len(self.data)} bytes)"
+
+
+# ------------------------
+# Similarity Index Models
+# ------------------------
+class SnippetSignature(models.Model):
+    snippet = models.OneToOneField(CodeSnippet, on_delete=models.CASCADE, related_name='signature')
+    minhash = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Signature for {self.snippet_id}"
+
+
+class LSHBucket(models.Model):
+    snippet = models.ForeignKey(CodeSnippet, on_delete=models.CASCADE, related_name='lsh_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.CharField(max_length=16)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='codeapp_lsh_band_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Band {self.band} bucket {self.bucket} → {self.snippet_id}"
+
+
+# ------------------------
+# Background Job Model
+# ------------------------
+class Job(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    label = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='codeapp_job_status_run_idx'),
+            # Dashboard: a user's recent similarity checks
+            models.Index(fields=['created_by', 'task', '-created_at'], name='codeapp_job_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} [{self.status}]"
+
+
+# ------------------------
+# Trending Models
+# ------------------------
+class EngagementBucket(models.Model):
+    snippet = models.ForeignKey(CodeSnippet, on_delete=models.CASCADE, related_name='engagement')
+    hour = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+    downloads = models.PositiveIntegerField(default=0)
+    reports = models.PositiveIntegerField(default=0)
+
+    # Points already folded into TrendingScore; the rest is still to apply
+    applied_points = models.IntegerField(default=0)
+    is_dirty = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['snippet', 'hour'], name='codeapp_engagement_snippet_hour_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['snippet'], condition=models.Q(is_dirty=True), name='codeapp_engagement_dirty_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.snippet_id} @ {self.hour:%Y-%m-%d %H:00}"
+
+
+class TrendingScore(models.Model):
+    snippet = models.OneToOneField(CodeSnippet, on_delete=models.CASCADE, related_name='trending')
+    day_score = models.FloatField(default=0)
+    week_score = models.FloatField(default=0)
+    scored_at = models.DateTimeField()
+    last_engaged_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Trending {self.snippet_id}: {self.day_score:.1f} / {self.week_score:.1f}"
+
+
+# ------------------------
+# Code Search Models
+# ------------------------
+class SnippetSearchText(models.Model):
+    snippet = models.OneToOneField(CodeSnippet, on_delete=models.CASCADE, primary_key=True, related_name='search_text')
+    text = models.TextField()
+
+    def __str__(self):
+        return f"Search text for {self.snippet_id}"
+
+
+class CodeTrigram(models.Model):
+    trigram = models.CharField(max_length=3)
+    snippet = models.ForeignKey(CodeSnippet, on_delete=models.CASCADE, related_name='trigrams')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'snippet'], name='codeapp_trigram_snippet_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} → {self.snippet_id}"
@@ -0,0 +1,131 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Notification, UserStats
+
+
+def cache_timeout():
+    return getattr(settings, 'NOTIFICATION_CACHE_TIMEOUT', 300)
+
+
+def dropdown_size():
+    return getattr(settings, 'NOTIFICATION_DROPDOWN_SIZE', 10)
+
+
+def cache_key(user_id):
+    return f'notify:unread:{user_id}'
+
+
+# ------------------------ SENDING -------------------------
+def send(user_ids, message):
+    """
+    Sends the same message to every user in `user_ids`.
+    """
+    return send_each((user_id, message) for user_id in user_ids)
+
+
+def send_each(pairs):
+    """
+    Creates a notification per (user_id, message) pair with one INSERT and
+    bumps each recipient's unread counter, one UPDATE per distinct amount.
+    """
+    notes = [Notification(user_id=user_id, message=message) for user_id, message in pairs]
+    if not notes:
+        return []
+
+    with transaction.atomic():
+        Notification.objects.bulk_create(notes)
+        adjust_unread(Counter(note.user_id for note in notes))
+    return notes
+
+
+# ------------------------ READING -------------------------
+def unread_count(user):
+    """
+    Unread notifications of a user (or user id), from the UserStats counter.
+    """
+    count = UserStats.objects.filter(user_id=getattr(user, 'pk', user)).values_list('unread_count', flat=True).first()
+    return count or 0
+
+
+def unread(user_id):
+    """
+    {'count': .., 'notes': [..]} with the newest unread notifications of a
+    user, for the navbar dropdown. Cached per user until a notification
+    arrives or is read.
+    """
+    key = cache_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        notes = (
+            Notification.objects.filter(user_id=user_id, is_read=False)
+            .order_by('-created_at')
+            .values('id', 'message', 'created_at')[:dropdown_size()]
+        )
+        summary = {'count': unread_count(user_id), 'notes': list(notes)}
+        cache.set(key, summary, cache_timeout())
+    return summary
+
+
+def mark_read(user, ids):
+    """
+    Marks the given notifications of the user as read.
+    """
+    if not ids:
+        return 0
+    return _mark_read(user, Notification.objects.filter(user=user, pk__in=ids))
+
+
+def mark_all_read(user):
+    """
+    Marks every unread notification of the user as read.
+    """
+    return _mark_read(user, Notification.objects.filter(user=user))
+
+
+def _mark_read(user, notes):
+    with transaction.atomic():
+        updated = notes.filter(is_read=False).update(is_read=True)
+        adjust_unread({user.pk: -updated})
+    return updated
+
+
+def forget(notes):
+    """
+    Corrects unread counters for notifications that are about to be deleted.
+    """
+    counts = Counter(n.user_id for n in notes if not n.is_read)
+    adjust_unread({user_id: -amount for user_id, amount in counts.items()})
+
+
+# ------------------------ COUNTERS -------------------------
+def adjust_unread(amounts):
+    """
+    Adds {user_id: amount} to the unread counters, grouping users that get
+    the same amount into a single UPDATE, and drops their cached dropdowns
+    once the transaction commits.
+    """
+    by_amount = defaultdict(list)
+    for user_id, amount in amounts.items():
+        if amount:
+            by_amount[amount].append(user_id)
+    if by_amount:
+        keys = [cache_key(user_id) for user_ids in by_amount.values() for user_id in user_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    for amount, user_ids in by_amount.items():
+        if amount < 0:
+            # Negative deltas go through adjust(), which clamps at zero
+            for user_id in user_ids:
+                UserStats.adjust(user_id, unread_count=amount)
+            continue
+        updated = UserStats.objects.filter(user_id__in=user_ids).update(unread_count=F('unread_count') + amount)
+        if updated < len(user_ids):
+            # Users created before stats rows existed
+            have = set(UserStats.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+            for user_id in set(user_ids) - have:
+                UserStats.adjust(user_id, unread_count=amount)
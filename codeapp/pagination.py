@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import json
+import math
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+COUNT_CACHE_TIMEOUT = 60
+# Cursor integers past a 64-bit column can only come from tampering
+MAX_KEY = 2 ** 63 - 1
+
+
+# ------------------------ CURSORS -------------------------
+def encode_cursor(value, pk):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (value, pk), or None for a missing or tampered cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        return None
+    return (value, pk) if 0 < pk <= MAX_KEY else None
+
+
+# ------------------------ PAGES -------------------------
+class KeysetPage:
+    """
+    One page of a keyset-paginated list. Mirrors the parts of Django's
+    Page that browse.html uses, plus the cursors for the neighbours.
+    """
+
+    def __init__(self, object_list, number, total, per_page, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.total = total
+        self.num_pages = max(1, math.ceil(total / per_page))
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return max(1, self.number - 1)
+
+
+class KeysetPaginator:
+    """
+    Seek pagination on (field DESC, id DESC): every page is an indexed
+    range scan from the cursor, so deep pages cost the same as page 1.
+    """
+
+    def __init__(self, queryset, field, per_page, total):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+        self.total = total
+
+    def parse_value(self, value):
+        if self.field == 'created_at':
+            return parse_datetime(value)
+        value = int(value)
+        if abs(value) > MAX_KEY:
+            raise ValueError(f"cursor value {value} is out of range")
+        return value
+
+    def page(self, after=None, before=None, number=1):
+        qs, backwards, cursor, number = self.seek(after, before, number)
+        return self.build(list(qs[:self.per_page + 1]), backwards, cursor, number)
+
+    async def apage(self, after=None, before=None, number=1):
+        qs, backwards, cursor, number = self.seek(after, before, number)
+        return self.build([row async for row in qs[:self.per_page + 1]], backwards, cursor, number)
+
+    def seek(self, after, before, number):
+        """
+        The ordered queryset starting at the cursor, plus how to read it.
+        """
+        qs, backwards = self.queryset, False
+        cursor = decode_cursor(before) or decode_cursor(after)
+
+        if cursor is not None:
+            value, pk = cursor
+            try:
+                value = self.parse_value(value)
+            except (TypeError, ValueError):
+                value = None
+            if value is None:
+                cursor = None
+
+        if cursor is not None:
+            backwards = bool(decode_cursor(before))
+            if backwards:
+                seek = Q(**{f'{self.field}__gt': value}) | Q(**{self.field: value, 'pk__gt': pk})
+                qs = qs.filter(seek).order_by(self.field, 'pk')
+            else:
+                seek = Q(**{f'{self.field}__lt': value}) | Q(**{self.field: value, 'pk__lt': pk})
+                qs = qs.filter(seek).order_by(f'-{self.field}', '-pk')
+        else:
+            qs = qs.order_by(f'-{self.field}', '-pk')
+            number = 1
+        return qs, backwards, cursor, number
+
+    def build(self, rows, backwards, cursor, number):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        first, last = (rows[0], rows[-1]) if rows else (None, None)
+        if backwards:
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, cursor is not None
+
+        return KeysetPage(
+            rows,
+            number=max(1, number),
+            total=self.total,
+            per_page=self.per_page,
+            next_cursor=encode_cursor(getattr(last, self.field), last.pk) if has_next and last else None,
+            prev_cursor=encode_cursor(getattr(first, self.field), first.pk) if has_prev and first else None,
+        )
+
+
+# ------------------------ COUNTS -------------------------
+def approximate_count(queryset, *key_parts):
+    """
+    COUNT(*) cached for a minute per filter combination. Good enough for
+    a "page N of ~M" indicator without counting on every request.
+    """
+    return cache.get_or_set(count_key(key_parts), queryset.count, COUNT_CACHE_TIMEOUT)
+
+
+async def aapproximate_count(queryset, *key_parts):
+    key = count_key(key_parts)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def count_key(key_parts):
+    digest = hashlib.md5(repr(key_parts).encode()).hexdigest()
+    return f'browse:count:{digest}'
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('codeapp.perf')
+
+# Statements kept per request in the log and the report
+SLOWEST_KEPT = 3
+SQL_PREVIEW = 300
+
+_lock = threading.Lock()
+_recent = None
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def recent():
+    """
+    Per-process ring buffer of the latest request records.
+    """
+    global _recent
+    if _recent is None:
+        _recent = deque(maxlen=setting('PERF_BUFFER_SIZE', 5000))
+    return _recent
+
+
+# ------------------------ RECORDING -------------------------
+class QueryTimer:
+    """
+    Database execute wrapper that times every statement of one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total += elapsed
+            self.statements.append((elapsed, sql))
+
+    def slowest(self):
+        top = sorted(self.statements, key=lambda s: s[0], reverse=True)[:SLOWEST_KEPT]
+        return [{'ms': round(elapsed * 1000, 2), 'sql': sql[:SQL_PREVIEW]} for elapsed, sql in top]
+
+
+class PerfMiddleware:
+    """
+    Records wall time, query count, SQL time and the slowest statements
+    of each request, keyed by URL name. Each record goes to the
+    'codeapp.perf' logger as one JSON line and to the in-process buffer
+    behind /admin/perf/. Sync and async capable, so it doesn't force
+    async views back onto a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not setting('PERF_ENABLED', True):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with self.wrap(timer):
+            response = self.get_response(request)
+        self.finish(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not setting('PERF_ENABLED', True):
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        # Connections are per thread: wrap them in the thread this request's
+        # async ORM calls and sync_to_async work run in
+        stack = await sync_to_async(self.wrap)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.finish(request, response, timer, time.perf_counter() - start)
+        return response
+
+    def wrap(self, timer):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        return stack
+
+    def finish(self, request, response, timer, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        record(
+            view=match.view_name if match else 'unresolved',
+            method=request.method,
+            status=response.status_code,
+            duration_ms=round(elapsed * 1000, 2),
+            queries=timer.count,
+            sql_ms=round(timer.total * 1000, 2),
+            slowest=timer.slowest(),
+        )
+
+
+def record(**entry):
+    entry['at'] = time.time()
+    with _lock:
+        recent().append(entry)
+    logger.info(json.dumps(entry))
+
+    threshold = setting('PERF_SLOW_QUERY_MS', 100)
+    for statement in entry['slowest']:
+        if statement['ms'] >= threshold:
+            logger.warning(json.dumps({'slow_query': statement, 'view': entry['view']}))
+
+
+class PerfLogHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that creates the log directory when it first opens
+    the file, rather than when settings are imported.
+    """
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+# ------------------------ REPORT -------------------------
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summary():
+    """
+    Per-view aggregates over the buffered requests, slowest p95 first.
+    """
+    with _lock:
+        entries = list(recent())
+
+    by_view = defaultdict(list)
+    for entry in entries:
+        by_view[entry['view']].append(entry)
+
+    rows = []
+    for view, hits in by_view.items():
+        durations = sorted(h['duration_ms'] for h in hits)
+        slowest = sorted(
+            (s for h in hits for s in h['slowest']),
+            key=lambda s: s['ms'], reverse=True,
+        )
+        rows.append({
+            'view': view,
+            'requests': len(hits),
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'p99': percentile(durations, 99),
+            'avg_queries': round(sum(h['queries'] for h in hits) / len(hits), 1),
+            'max_queries': max(h['queries'] for h in hits),
+            'avg_sql_ms': round(sum(h['sql_ms'] for h in hits) / len(hits), 2),
+            'slowest': slowest[:SLOWEST_KEPT],
+        })
+    rows.sort(key=lambda r: r['p95'], reverse=True)
+    return rows
@@ -0,0 +1,126 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Apps whose reads may be served by a replica. Sessions and auth stay on
+# the primary so a fresh login or sign-up is never "lost" to replica lag.
+REPLICA_APPS = {'codeapp'}
+
+PIN_COOKIE = 'db_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    """
+    Per-request routing flags. Mutable, so flags set in a thread that got a
+    copy of the context (sync_to_async) are seen by the middleware.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('codeapp_db_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def use_replica():
+    """
+    Only requests that haven't written read from replicas; management
+    commands and jobs outside a request always use the primary.
+    """
+    state = _state.get()
+    return state is not None and not state.pinned
+
+
+# ------------------------ ROUTER -------------------------
+class ReplicaRouter:
+    """
+    Reads of codeapp models during a request go to a random replica
+    (DATABASE_REPLICAS); writes go to the primary and pin the rest of the
+    request there, so it reads its own writes. Only the primary is
+    migrated; replicas follow it.
+    """
+
+    def db_for_read(self, model, **hints):
+        choices = replicas()
+        if not choices or not use_replica() or model._meta.app_label not in REPLICA_APPS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(choices)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # All aliases hold the same data
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# ------------------------ MIDDLEWARE -------------------------
+class PrimaryPinningMiddleware:
+    """
+    Starts each request with fresh routing state. Unsafe methods, and
+    clients that wrote within the last REPLICA_PIN_SECONDS (the GET after
+    an upload's redirect), read from the primary; a request that wrote
+    sets that pin cookie.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context into its thread, and the state
+        # object is shared, so writes made there still pin the request
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        return RoutingState(
+            pinned=request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES,
+        )
+
+    def finish(self, state, response):
+        if state.wrote and replicas():
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
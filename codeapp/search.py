@@ -0,0 +1,167 @@
+import math
+import re
+
+from django.conf import settings
+from django.db import connection, OperationalError
+from django.db.models import Q, Case, When, IntegerField
+from django.utils.module_loading import import_string
+
+from .models import CodeSnippet
+from .algorithms.similarity import extract_code
+from .algorithms.tokenizer import code_tokens
+
+FTS_TABLE = 'codeapp_snippet_fts'
+
+# bm25 column weights: title, description, language, body
+FTS_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+# How much popularity lifts an equally relevant match
+POPULARITY_BOOST = 0.1
+
+# Most results one search returns: blending in popularity reorders every
+# hit, so they are ranked together rather than fetched a page at a time
+SEARCH_LIMIT = 1000
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def snippet_body(snippet, raw=None):
+    """
+    Identifier-aware tokens of the code, so word search finds "csv" in read_csv.
+    """
+    if raw is None:
+        raw = extract_code(snippet)
+    return " ".join(code_tokens(raw, snippet.language))
+
+
+# ------------------------ BACKENDS -------------------------
+class BasicSearchBackend:
+    """
+    Fallback for databases without a full-text index: LIKE over title and
+    description, no ranking beyond recency. Indexing is a no-op.
+    """
+
+    def index(self, snippet, body):
+        pass
+
+    def remove(self, snippet_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit):
+        words = WORD_RE.findall(query)
+        if not words:
+            return []
+        q = Q()
+        for word in words:
+            q &= Q(title__icontains=word) | Q(description__icontains=word)
+        ids = CodeSnippet.objects.filter(q, is_deleted=False).order_by('-created_at').values_list('pk', flat=True)
+        return [(pk, 1.0) for pk in ids[:limit]]
+
+
+class SQLiteFTSBackend(BasicSearchBackend):
+    """
+    SQLite FTS5 table keyed by snippet id (rowid), ranked with bm25.
+    The table is created by migration 0016 when FTS5 is available.
+    """
+
+    def index(self, snippet, body):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [snippet.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, language, body) VALUES (%s, %s, %s, %s, %s)",
+                [snippet.pk, snippet.title, snippet.description, snippet.language, body],
+            )
+
+    def remove(self, snippet_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [snippet_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, query, limit):
+        match = fts_query(query)
+        if not match:
+            return []
+        weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+                [match, limit],
+            )
+            # bm25 is lower-is-better; flip it so higher means more relevant
+            return [(pk, -rank) for pk, rank in cursor.fetchall()]
+
+
+def fts_query(query):
+    """
+    Turns user input into an FTS5 expression: every word must match,
+    as a prefix, so "read cs" finds "read_csv". Quoting keeps FTS
+    operators in the input from being interpreted.
+    """
+    return " ".join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = BasicSearchBackend()
+    return _backend
+
+
+# ------------------------ INDEX MAINTENANCE -------------------------
+def index_snippet(snippet, raw=None):
+    get_backend().index(snippet, snippet_body(snippet, raw))
+
+
+def remove_snippet(snippet_id):
+    get_backend().remove(snippet_id)
+
+
+# ------------------------ QUERY -------------------------
+def search_snippets(query, limit=SEARCH_LIMIT):
+    """
+    Returns up to `limit` snippet ids, best first: text relevance blended
+    with the stored popularity_score.
+    """
+    try:
+        hits = get_backend().search(query, limit)
+    except OperationalError:
+        hits = BasicSearchBackend().search(query, limit)
+    if not hits:
+        return []
+
+    popularity = dict(
+        CodeSnippet.objects.filter(pk__in=[pk for pk, _ in hits], is_deleted=False)
+        .values_list('pk', 'popularity_score')
+    )
+    ranked = sorted(
+        ((relevance * (1 + POPULARITY_BOOST * math.log1p(popularity[pk])), pk)
+         for pk, relevance in hits if pk in popularity),
+        reverse=True,
+    )
+    return [pk for _, pk in ranked]
+
+
+def in_rank_order(queryset, ids):
+    """
+    Restricts a queryset to `ids` and orders it the same way.
+    """
+    if not ids:
+        return queryset.none()
+    ordering = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(ordering)
@@ -1,7 +1,22 @@
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import UserStats
+from collections import Counter
+
+from .models import UserStats, CodeSnippet, Blob, CONTENT_FIELDS
+from . import lsh, search, codesearch, home_cache, sqlite
+from .counters import counters_flushed
+
+# Fields that change what the similarity and search indexes see
+INDEXED_FIELDS = CONTENT_FIELDS | {'is_deleted', 'title', 'description', 'language'}
+
+# WAL, busy timeout etc. on every new SQLite connection
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            sqlite.configure(cursor, sqlite.connection_pragmas(cursor))
 
 # Create stats when a user is first created
 @receiver(post_save, sender=User)
@@ -13,3 +28,79 @@ def create_user_stats(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_stats(sender, instance, **kwargs):
     UserStats.objects.get_or_create(user=instance)
+
+# Keep the MinHash/LSH, search and code search indexes in sync with snippet content and soft delete
+@receiver(post_save, sender=CodeSnippet)
+def sync_snippet_indexes(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields and not INDEXED_FIELDS.intersection(update_fields):
+        return
+
+    fp = instance.__dict__.pop('_fingerprint', None)
+    if instance.is_deleted:
+        lsh.drop_snippet(instance)
+        search.remove_snippet(instance.pk)
+        return
+
+    if fp is not None:
+        lsh.index_snippet(instance, fp['tokens'])
+        codesearch.index_snippet(instance, fp['raw'])
+    else:
+        lsh.ensure_indexed(instance)
+    search.index_snippet(instance, fp['raw'] if fp else None)
+
+@receiver(post_delete, sender=CodeSnippet)
+def remove_from_search(sender, instance, **kwargs):
+    search.remove_snippet(instance.pk)
+
+# Hard deletes drop their reference to the stored file (soft deletes keep it)
+@receiver(post_delete, sender=CodeSnippet)
+def release_snippet_blob(sender, instance, **kwargs):
+    if instance.file:
+        Blob.release(instance.file.name)
+
+# Cached home page sections depend on snippets and their counters
+@receiver(post_save, sender=CodeSnippet)
+@receiver(post_delete, sender=CodeSnippet)
+def invalidate_home_sections(sender, **kwargs):
+    home_cache.invalidate()
+
+@receiver(counters_flushed)
+def invalidate_counter_sections(sender, **kwargs):
+    home_cache.invalidate(home_cache.FEATURED, home_cache.CONTRIBUTORS)
+
+# Contributor leaderboard (UserStats) follows snippet create/delete and
+# download flushes. Soft delete/restore adjust it in CodeSnippet itself.
+@receiver(post_save, sender=CodeSnippet)
+def count_new_snippet(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    if instance.is_deleted:
+        UserStats.adjust(instance.author_id, deleted_count=1)
+    else:
+        UserStats.adjust(instance.author_id, snippet_count=1)
+
+@receiver(post_delete, sender=CodeSnippet)
+def uncount_deleted_snippet(sender, instance, **kwargs):
+    if instance.is_deleted:
+        UserStats.adjust(instance.author_id, deleted_count=-1)
+    else:
+        UserStats.adjust(
+            instance.author_id,
+            snippet_count=-1,
+            download_count=-instance.downloads,
+            report_count=-instance.reports_count,
+        )
+
+@receiver(counters_flushed)
+def count_flushed_downloads(sender, batch, **kwargs):
+    downloads = {pk: counts['downloads'] for pk, counts in batch.items() if counts['downloads']}
+    if not downloads:
+        return
+    per_author = Counter()
+    live = CodeSnippet.objects.filter(pk__in=downloads, is_deleted=False).values_list('pk', 'author_id')
+    for pk, author_id in live:
+        per_author[author_id] += downloads[pk]
+    for author_id, amount in per_author.items():
+        UserStats.adjust(author_id, download_count=amount)
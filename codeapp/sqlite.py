@@ -0,0 +1,47 @@
+from django.conf import settings
+
+# Applied to every new SQLite connection (see signals.tune_sqlite):
+# - WAL lets readers run alongside the single writer instead of blocking it
+# - synchronous=NORMAL is durable in WAL mode except for the last commits
+#   on power loss, and skips an fsync per transaction
+# - mmap_size serves reads from the page cache without read() copies
+# - busy_timeout makes a writer wait for the lock instead of failing
+#   straight away with "database is locked"
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+
+def pragmas():
+    """
+    PRAGMAS with SQLITE_PRAGMAS from settings layered on top; a value of
+    None drops that pragma.
+    """
+    merged = {**PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+    return {name: value for name, value in merged.items() if value is not None}
+
+
+def connection_pragmas(cursor):
+    """
+    pragmas() for a new connection. journal_mode is kept in the file header,
+    so it waits for a database that has been written to: setting it on an
+    empty one would write out the file for commands that only look
+    (makemigrations --check). The next connection after migrate applies it.
+    """
+    values = pragmas()
+    cursor.execute('PRAGMA page_count')
+    if cursor.fetchone()[0] == 0:
+        values.pop('journal_mode', None)
+    return values
+
+
+def configure(cursor, values=None):
+    """
+    Runs the PRAGMA statements on a DB-API cursor (Django's or sqlite3's).
+    """
+    for name, value in (pragmas() if values is None else values).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,225 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils.deconstruct import deconstructible
+
+from . import compression
+
+BLOB_PREFIX = 'blobs'
+
+READ_BLOCK = 64 * 1024
+
+
+def blob_name(digest):
+    """
+    Sharded path of a blob: blobs/ab/cd/abcd1234...
+    """
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+def digest_of(name):
+    """
+    The sha256 a blob name was derived from, or None for legacy paths.
+    """
+    parts = name.split('/') if name else []
+    if len(parts) == 4 and parts[0] == BLOB_PREFIX and len(parts[3]) == 64:
+        return parts[3]
+    return None
+
+
+def hash_content(content):
+    sha = hashlib.sha256()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct file once, under the sha256 of its bytes.
+    The requested name is ignored: saving identical content again returns
+    the existing blob's name without writing anything. Which rows use a
+    blob is tracked by codeapp.models.Blob.
+
+    With SNIPPET_COMPRESSION on, new blobs are written compressed; opening
+    one gives back the original bytes, and size() reports their length.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(blob_name(hash_content(content)), content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means same bytes: reuse, never rename
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temp file and hard-link it into place, so a concurrent
+        # upload of the same content can't leave a half-written blob.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write_blob(out, content.chunks(), compression.enabled())
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            try:
+                os.link(tmp_path, full_path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(tmp_path)
+        return name
+
+    def _open(self, name, mode='rb'):
+        f = super()._open(name, mode)
+        header = f.read(compression.HEADER.size)
+        if not compression.is_compressed(header):
+            f.seek(0)
+            return f
+
+        _, dict_id, size = compression.HEADER.unpack(header)
+        reader = io.BufferedReader(InflatingReader(f, dict_id, size), READ_BLOCK)
+        inflated = File(reader, name)
+        inflated.size = size
+        return inflated
+
+    def size(self, name):
+        header = self.header(name)
+        if header:
+            return header[2]
+        return super().size(name)
+
+    def header(self, name):
+        """
+        (magic, dictionary id, raw size) of a compressed blob, else None.
+        """
+        with open(self.path(name), 'rb') as f:
+            head = f.read(compression.HEADER.size)
+        if len(head) == compression.HEADER.size and compression.is_compressed(head):
+            return compression.HEADER.unpack(head)
+        return None
+
+    def is_compressed(self, name):
+        return self.header(name) is not None
+
+    def rewrite(self, name, compressed):
+        """
+        Re-stores an existing blob compressed or plain, atomically.
+        """
+        full_path = self.path(name)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix='.rewrite-')
+        try:
+            with os.fdopen(fd, 'wb') as out, self.open(name, 'rb') as f:
+                write_blob(out, f.chunks(), compressed)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class InflatingReader(io.RawIOBase):
+    """
+    The original bytes of a compressed blob, inflated as they are read:
+    one block is held at a time, whatever the file's size. Seeking is
+    lazy; the next read inflates forward to the offset, or starts over
+    from the top if the offset is behind what was already inflated.
+    """
+
+    def __init__(self, f, dict_id, size):
+        self._f = f
+        self._dict_id = dict_id
+        self.size = size
+        self._pos = 0
+        self._restart()
+
+    def _restart(self):
+        self._f.seek(compression.HEADER.size)
+        self._d = compression.decompressor(self._dict_id)
+        self._block = b''      # inflated output not yet consumed...
+        self._block_start = 0  # ...and its offset in the original
+
+    def _inflate(self):
+        # The next block of output, b'' at the end
+        while not self._d.eof:
+            data = self._d.unconsumed_tail or self._f.read(READ_BLOCK)
+            if not data:
+                return self._d.flush()
+            block = self._d.decompress(data, READ_BLOCK)
+            if block:
+                return block
+        return b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._pos < self._block_start:
+            self._restart()
+        while True:
+            skip = self._pos - self._block_start
+            if skip < len(self._block):
+                n = min(len(buffer), len(self._block) - skip)
+                buffer[:n] = self._block[skip:skip + n]
+                self._pos += n
+                return n
+            self._block_start += len(self._block)
+            self._block = self._inflate()
+            if not self._block:
+                return 0
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def write_blob(out, chunks, compressed):
+    if not compressed:
+        for chunk in chunks:
+            out.write(chunk)
+        return
+
+    # Header first with a placeholder size, patched once it's known
+    out.write(compression.HEADER.pack(compression.MAGIC, 0, 0))
+    c = compression.compressor()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        out.write(c.compress(chunk))
+    out.write(c.flush())
+    out.seek(0)
+    out.write(compression.HEADER.pack(compression.MAGIC, 0, size))
+
+
+def snippet_storage():
+    return storages['snippets']
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+
+from . import notify
+from .jobs import task
+from .lsh import find_duplicate
+from .models import CodeSnippet, Report
+
+CHECK_DUPLICATE = 'similarity.check_duplicate'
+
+
+# ------------------------ SIMILARITY -------------------------
+@task(CHECK_DUPLICATE)
+def check_duplicate(snippet_id):
+    snippet = CodeSnippet.objects.filter(pk=snippet_id, is_deleted=False).select_related('author').first()
+    if snippet is None:
+        return {'skipped': True}
+
+    duplicate, score, other = find_duplicate(snippet)
+    if not duplicate:
+        return {'duplicate': False}
+
+    admin_ids = list(User.objects.filter(is_staff=True).values_list('id', flat=True))
+    reason = f"Similarity algorithm flagged duplicate (score {score:.1f}% with snippet '{other.title}')"
+    Report.objects.bulk_create(
+        Report(snippet=snippet, reported_by=snippet.author, reason=reason) for _ in admin_ids
+    )
+
+    admin_message = f"Snippet '{snippet.title}' flagged as duplicate of '{other.title}' (score {score:.1f}%)."
+    notify.send_each([
+        *((admin_id, admin_message) for admin_id in admin_ids),
+        (snippet.author_id, f"Your snippet '{snippet.title}' was flagged as similar to '{other.title}'. Admins will review."),
+    ])
+    return {'duplicate': True, 'score': round(score, 1), 'other_id': other.pk}
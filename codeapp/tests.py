@@ -1,2 +1,1882 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import warnings
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from io import StringIO
 
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from unittest import skipUnless
+
+from django.db import connection, connections, router, transaction, DatabaseError
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse, FileResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, compression, counters, downloads, highlight, jobs, notify, lsh, perf, search, tasks, trending
+from .models import (
+    CodeSnippet, Report, Notification, Job, UserStats, SnippetSignature, SnippetSearchText, CodeTrigram,
+    CompressionDictionary, Blob, EngagementBucket, TrendingScore,
+)
+from .algorithms.popularity import TRENDING_WINDOWS, engagement_points, decay
+from .algorithms.minhash import NUM_PERM, BANDS, ROWS, minhash_signature, band_hashes, estimate_similarity
+from .algorithms.tokenizer import required_literals
+from .codesearch import compile_query, search_code
+from .search import search_snippets
+from .pagination import KeysetPaginator, encode_cursor
+from .routers import PIN_COOKIE, PrimaryPinningMiddleware
+from .storage import blob_name, digest_of, snippet_storage
+from .tasks import CHECK_DUPLICATE
+from .management.commands import compact_notifications
+
+
+# ------------------------ QUERY BUDGETS -------------------------
+class QueryBudgetTests(TestCase):
+    """
+    Each list view runs a fixed number of queries however many rows it
+    shows. If one of these fails, a template probably started following
+    a relation that the view doesn't select_related/prefetch.
+    """
+
+    ROWS = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.others = [User.objects.create_user(f'user{i}', password='pw') for i in range(cls.ROWS)]
+        cls.snippets = [
+            CodeSnippet.objects.create(
+                title=f'Snippet {i}', description='desc', language='python',
+                code=f'value_{i} = {i}\n', author=author,
+            )
+            for i, author in enumerate([cls.user] + cls.others)
+        ]
+        for reporter in cls.others:
+            Report.objects.create(snippet=cls.snippets[0], reported_by=reporter, reason='spam')
+        UserStats.adjust(cls.user.pk, report_count=cls.ROWS)
+        notify.send_each((cls.user.pk, f'Note about {snippet.title}') for snippet in cls.snippets[1:])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        # Don't leave buffered view counts for the atexit flush
+        counters.flush()
+
+    def assertBudget(self, budget, url, data=None):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    # Logged-in budgets include two cold-cache queries for the navbar
+    # notifications (unread counter + newest unread rows)
+    def test_home(self):
+        self.assertBudget(8, reverse('home'))
+
+    def test_home_ignores_search_params(self):
+        # home.html lists no results, so ?q= must not run a search
+        self.assertBudget(8, reverse('home'), {'q': 'value'})
+
+    def test_home_builds_no_upload_form(self):
+        # Templates that render the upload form get the lazy one from
+        # context_processors.upload_form
+        with mock.patch('codeapp.views.CodeSnippetForm') as form:
+            response = self.client.get(reverse('home'))
+        form.assert_not_called()
+        self.assertNotIn('recent_uploads', response.context)
+
+    def test_home_cached(self):
+        self.client.logout()
+        self.client.get(reverse('home'))
+        # Every section comes from the fragment cache
+        self.assertBudget(0, reverse('home'))
+
+    def test_browse(self):
+        # Includes the page-count and language-list queries, cached afterwards
+        response = self.assertBudget(7, reverse('browse'))
+        self.assertContains(response, self.others[-1].username)
+
+    def test_browse_next_page(self):
+        cursor = self.client.get(reverse('browse')).context['snippets'].next_cursor
+        self.assertBudget(3, reverse('browse'), {'after': cursor, 'page': 2})
+
+    def test_browse_search(self):
+        self.assertBudget(8, reverse('browse'), {'search': 'value', 'mode': 'code'})
+
+    def test_browse_search_capped(self):
+        for mode in ('text', 'code'):
+            with self.subTest(mode), mock.patch('codeapp.views.SEARCH_LIMIT', 3):
+                response = self.client.get(reverse('browse'), {'search': 'value', 'mode': mode})
+                self.assertEqual(response.context['snippets'].paginator.count, 3)
+                self.assertContains(response, 'Showing the 3 best matches only')
+
+        response = self.client.get(reverse('browse'), {'search': 'value'})
+        self.assertEqual(response.context['snippets'].paginator.count, self.ROWS + 1)
+        self.assertNotContains(response, 'best matches only')
+
+    def test_detail(self):
+        self.assertBudget(5, reverse('detail', args=[self.snippets[1].pk]))
+
+    def test_profile(self):
+        self.assertBudget(7, reverse('user_profile'))
+
+    def test_dashboard(self):
+        response = self.assertBudget(9, reverse('user_dashboard'))
+        # The newest few listed, all of them counted
+        newest = Report.objects.order_by('-created_at', '-pk')[:5]
+        self.assertEqual(list(response.context['reports']), list(newest))
+        self.assertContains(response, '<h4>Reported Snippets</h4><p>10</p>', html=True)
+
+    def test_notifications_cached(self):
+        url = reverse('detail', args=[self.snippets[1].pk])
+        self.client.get(url)
+        # Unread count and dropdown now come from the per-user cache
+        response = self.assertBudget(3, url)
+        self.assertContains(response, '<span class="notif-badge">10</span>', html=True)
+        self.assertContains(response, 'Note about Snippet 10')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.mark_all_read(self.user)
+        response = self.assertBudget(5, url)
+        self.assertNotContains(response, 'notif-badge')
+        self.assertContains(response, 'No notifications')
+
+
+# ------------------------ QUERY PLANS -------------------------
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN output checked is SQLite's")
+class QueryPlanTests(TestCase):
+    """
+    The hot queries from views.py/admin.py must be answered from an index:
+    no plain table SCAN, and (unless noted) no separate sort step. If one
+    fails, a query changed shape or lost the index in models.py it needs.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        CodeSnippet.objects.create(title='Hello', language='python', code='x = 1\n', author=cls.user)
+
+    def assertIndexed(self, queryset, sorted_by_index=True):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if ' SCAN ' in f' {line} ':
+                self.assertIn('USING', line, f"Full table scan:\n{plan}")
+        if sorted_by_index:
+            self.assertNotIn('TEMP B-TREE', plan, f"Sorted outside an index:\n{plan}")
+
+    def test_home_sections(self):
+        live = CodeSnippet.objects.filter(is_deleted=False)
+        self.assertIndexed(live.order_by('-created_at')[:6])
+        self.assertIndexed(live.filter(language='python').order_by('-created_at')[:6])
+        self.assertIndexed(live.order_by('-popularity_score', '-created_at')[:6])
+
+    def test_browse(self):
+        live = CodeSnippet.objects.filter(is_deleted=False).select_related('author')
+        for field in ('created_at', 'views'):
+            self.assertIndexed(live.order_by(f'-{field}', '-pk')[:9])
+            self.assertIndexed(live.filter(language__in=['python']).order_by(f'-{field}', '-pk')[:9])
+        # Several languages are merged from separate index ranges
+        self.assertIndexed(
+            live.filter(language__in=['python', 'java']).order_by('-created_at', '-pk')[:9],
+            sorted_by_index=False,
+        )
+        self.assertIndexed(live.values_list('language', flat=True).distinct().order_by('language'))
+
+    def test_profile_and_dashboard(self):
+        mine = CodeSnippet.objects.filter(author=self.user, is_deleted=False)
+        self.assertIndexed(mine.order_by('-created_at')[:5])
+        self.assertIndexed(Job.objects.filter(created_by=self.user, task=CHECK_DUPLICATE).order_by('-created_at')[:5])
+        self.assertIndexed(UserStats.objects.filter(user=self.user))
+        # Reports on the user's snippets: walked per snippet, then sorted
+        self.assertIndexed(
+            Report.objects.filter(snippet__author=self.user).select_related('snippet', 'reported_by')
+            .order_by('-created_at'),
+            sorted_by_index=False,
+        )
+
+    def test_notifications(self):
+        notes = Notification.objects.filter(user=self.user)
+        self.assertIndexed(notes.order_by('-created_at', '-pk')[:21])
+        self.assertIndexed(notes.filter(is_read=False).order_by('-created_at', '-pk')[:21])
+
+    def test_admin_report_queue(self):
+        # ReportAdmin.ordering plus the pk tie-breaker the changelist adds
+        self.assertIndexed(Report.objects.order_by('resolved', '-created_at', '-pk')[:100])
+        self.assertIndexed(Report.objects.filter(resolved=False).order_by('resolved', '-created_at', '-pk')[:100])
+
+
+# ------------------------ DATABASE ROUTING -------------------------
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    'replica' mirrors 'default' under test, so these check where queries
+    are sent rather than replication itself. TransactionTestCase: the
+    mirror is a separate connection and can't see uncommitted test data.
+    """
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.snippet = CodeSnippet.objects.create(title='Hello', language='python', code='x = 1\n', author=self.user)
+
+    def tearDown(self):
+        counters.flush()
+
+    def route(self, request, write=False):
+        seen = []
+
+        def view(request):
+            seen.append((router.db_for_read(CodeSnippet), router.db_for_read(User)))
+            if write:
+                CodeSnippet.objects.filter(pk=self.snippet.pk).update(title='Renamed')
+                seen.append((router.db_for_read(CodeSnippet), router.db_for_read(User)))
+            return HttpResponse()
+
+        response = PrimaryPinningMiddleware(view)(request)
+        return seen, response
+
+    def test_reads_use_replica_until_the_request_writes(self):
+        seen, response = self.route(RequestFactory().get('/'), write=True)
+        self.assertEqual(seen, [('replica', 'default'), ('default', 'default')])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_unsafe_methods_and_recent_writers_use_primary(self):
+        seen, _ = self.route(RequestFactory().post('/'))
+        self.assertEqual(seen[0][0], 'default')
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        seen, response = self.route(request)
+        self.assertEqual(seen[0][0], 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_outside_requests_use_primary(self):
+        self.assertEqual(router.db_for_read(CodeSnippet), 'default')
+
+    def test_detail_reads_from_replica(self):
+        response = self.client.get(reverse('detail', args=[self.snippet.pk]))
+        self.assertEqual(response.context['snippet']._state.db, 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_the_follow_up_request(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('report_snippet', args=[self.snippet.pk]), {'reason': 'spam'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = self.client.get(reverse('detail', args=[self.snippet.pk]))
+        self.assertEqual(response.context['snippet']._state.db, 'default')
+
+    def test_only_primary_is_migrated(self):
+        self.assertTrue(router.allow_migrate('default', 'codeapp'))
+        self.assertFalse(router.allow_migrate('replica', 'codeapp'))
+
+    async def test_async_view_writes_pin_the_request(self):
+        async def view(request):
+            await CodeSnippet.objects.filter(pk=self.snippet.pk).aupdate(title='Renamed')
+            return HttpResponse()
+
+        response = await PrimaryPinningMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+# ------------------------ SQLITE -------------------------
+@skipUnless(connection.vendor == 'sqlite', "SQLite connection tuning")
+class SqliteTuningTests(TestCase):
+    """
+    New connections get the pragmas from codeapp/sqlite.py, applied by
+    signals.tune_sqlite, and begin transactions IMMEDIATE.
+    """
+
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'tuned.sqlite3')
+
+    def connect(self):
+        conn = DatabaseWrapper({**connection.settings_dict, 'NAME': self.path}, alias='tuned')
+        self.addCleanup(conn.close)
+        conn.ensure_connection()
+        return conn
+
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        conn = self.connect()
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        conn.close()
+
+        conn = self.connect()
+        self.assertEqual(self.pragma(conn, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(conn, 'synchronous'), 1)   # NORMAL
+        self.assertEqual(self.pragma(conn, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(conn, 'temp_store'), 2)    # MEMORY
+        self.assertEqual(self.pragma(conn, 'mmap_size'), 256 * 1024 * 1024)
+
+    def test_empty_database_left_alone(self):
+        conn = self.connect()
+        self.assertEqual(self.pragma(conn, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(conn, 'journal_mode'), 'delete')
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_transactions_begin_immediate(self):
+        conn = self.connect()
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        self.assertEqual(conn.transaction_mode, 'IMMEDIATE')
+
+        connections['tuned'] = conn
+        self.addCleanup(connections.__delitem__, 'tuned')
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using='tuned'):
+            # Only an IMMEDIATE transaction holds the write lock before writing
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+
+
+# ------------------------ ASYNC VIEWS -------------------------
+class AsyncViewTests(TestCase):
+    """
+    detail, browse and download_code are async; these run them the way
+    an ASGI server would, and downloads under WSGI too.
+    """
+
+    BODY = b'line one\nline two\n' * 1000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.snippet = CodeSnippet(title='Lines', language='text', author=self.user, original_filename='lines.txt')
+        self.snippet.file.save('lines.txt', ContentFile(self.BODY))
+
+    def tearDown(self):
+        counters.flush()
+
+    async def download(self, **headers):
+        response = await self.async_client.get(reverse('download', args=[self.snippet.pk]), headers=headers)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        return response, body
+
+    async def test_download_streams_file(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response, body = await self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.BODY)
+        self.assertEqual(int(response['Content-Length']), len(self.BODY))
+
+        response, body = await self.download(range='bytes=9-16')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'line two')
+        self.assertEqual(counters.pending(self.snippet.pk, 'downloads'), 1)
+
+    def test_wsgi_download_is_a_file_response(self):
+        self.client.force_login(self.user)
+        with warnings.catch_warnings():
+            # "StreamingHttpResponse must consume asynchronous iterators..."
+            warnings.simplefilter('error')
+            response = self.client.get(reverse('download', args=[self.snippet.pk]))
+            self.assertIsInstance(response, FileResponse)
+            self.assertEqual(b''.join(response.streaming_content), self.BODY)
+
+            response = self.client.get(reverse('download', args=[self.snippet.pk]), headers={'range': 'bytes=9-16'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), b'line two')
+
+    async def test_detail_and_browse(self):
+        response = await self.async_client.get(reverse('detail', args=[self.snippet.pk]))
+        self.assertContains(response, 'Lines')
+        self.assertEqual(counters.pending(self.snippet.pk, 'views'), 1)
+
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('browse'))
+        self.assertContains(response, 'Lines')
+
+
+class DownloadTests(TestCase):
+    """
+    Validators, conditional requests and byte ranges of download_code.
+    """
+
+    CODE = 'print("hello")\n' * 10
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.snippet = CodeSnippet.objects.create(title='Hello', language='python', author=self.user, code=self.CODE)
+        self.client.force_login(self.user)
+        self.addCleanup(counters.flush)
+
+    def get(self, snippet=None, **headers):
+        response = self.client.get(reverse('download', args=[(snippet or self.snippet).pk]), headers=headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_parse_range(self):
+        self.assertEqual(downloads.parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(downloads.parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(downloads.parse_range('bytes=95-200', 100), (95, 99))
+        self.assertEqual(downloads.parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(downloads.parse_range('bytes=-500', 100), (0, 99))
+        self.assertIsNone(downloads.parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(downloads.parse_range('items=0-1', 100))
+        self.assertIs(downloads.parse_range('bytes=100-', 100), False)
+        self.assertIs(downloads.parse_range('bytes=-0', 100), False)
+        self.assertIs(downloads.parse_range('bytes=-5', 0), False)
+        self.assertIs(downloads.parse_range('bytes=0-', 0), False)
+
+    def test_not_modified(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.CODE.encode())
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(etag, f'"{hashlib.sha256(body).hexdigest()}"')
+
+        response, _ = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response, _ = self.get(if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 304)
+        # 304s aren't downloads
+        self.assertEqual(counters.pending(self.snippet.pk, 'downloads'), 1)
+
+    def test_ranges(self):
+        response, body = self.get(range='bytes=-6')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'llo")\n')
+        self.assertEqual(response['Content-Range'], f'bytes {len(self.CODE) - 6}-{len(self.CODE) - 1}/{len(self.CODE)}')
+
+        response, body = self.get(range='bytes=-1000')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.CODE.encode())
+
+        response, _ = self.get(range=f'bytes={len(self.CODE)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.CODE)}')
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(range='bytes=0-4', if_range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'print')
+
+        # The client's copy is outdated: send the whole current body
+        response, body = self.get(range='bytes=0-4', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.CODE.encode())
+
+    def test_empty_file_suffix_range(self):
+        empty = CodeSnippet(title='Empty', language='text', author=self.user, original_filename='empty.txt')
+        empty.file.save('empty.txt', ContentFile(b''))
+        response, _ = self.get(empty, range='bytes=-5')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_etag_matches_served_bytes(self):
+        both = CodeSnippet(title='Both', language='python', author=self.user, code=self.CODE,
+                           original_filename='other.py')
+        both.file.save('other.py', ContentFile(b'print("something else")\n'))
+        response, body = self.get(both)
+        self.assertEqual(body, self.CODE.encode())
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(body).hexdigest()}"')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="Both.txt"')
+
+
+# ------------------------ TRENDING -------------------------
+class TrendingTests(TestCase):
+    """
+    Incremental trending scores must equal scoring every bucket from
+    scratch, however the recomputes interleave with new engagement.
+    """
+
+    START = datetime(2026, 3, 2, 9, tzinfo=dt_timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.snippet = CodeSnippet.objects.create(title='Hot', language='python', author=cls.user, code='x = 1\n')
+
+    def at(self, hours):
+        return self.START + timedelta(hours=hours)
+
+    def from_scratch(self, now):
+        scores = {}
+        for window, (_, half_life) in TRENDING_WINDOWS.items():
+            scores[window] = sum(
+                decay(engagement_points(b.views, b.downloads, b.reports),
+                      trending.hours_between(b.hour + timedelta(minutes=30), now), half_life)
+                for b in EngagementBucket.objects.filter(snippet=self.snippet)
+            )
+        return scores
+
+    def assertMatchesScratch(self, now):
+        score = TrendingScore.objects.get(snippet=self.snippet)
+        expected = self.from_scratch(now)
+        elapsed = trending.hours_between(score.scored_at, now)
+        for window, (_, half_life) in TRENDING_WINDOWS.items():
+            stored = decay(getattr(score, f'{window}_score'), elapsed, half_life)
+            self.assertAlmostEqual(stored, expected[window], places=6, msg=f'{window} at {now}')
+
+    def test_incremental_matches_from_scratch(self):
+        steps = [
+            # (hour offset of the engagement, views, downloads, reports, recompute at)
+            (0.2, 5, 1, 0, 0.25),
+            (0.5, 3, 0, 0, 0.75),    # same bucket again
+            (1.1, 10, 2, 0, 1.15),   # recomputed before the bucket's midpoint
+            (1.4, 2, 1, 0, 4.0),
+            (5.0, 0, 0, 30, 5.6),    # reported below zero...
+            (6.0, 1, 0, 10, 7.0),
+            (30.0, 1, 0, 0, 30.9),
+            (31.0, 20, 4, 0, 31.5),  # ...and back above it
+            (32.0, 4, 4, 1, 80.0),
+        ]
+        went_negative = False
+        for when, views, downloads, reports, recompute in steps:
+            trending.record_engagement(self.snippet.pk, views=views, downloads=downloads, reports=reports,
+                                       when=self.at(when))
+            self.assertEqual(trending.recompute_trending(now=self.at(recompute)), 1)
+            self.assertMatchesScratch(self.at(recompute))
+            self.assertFalse(EngagementBucket.objects.filter(is_dirty=True).exists())
+            if TrendingScore.objects.get(snippet=self.snippet).day_score < 0:
+                went_negative = True
+                self.assertEqual(trending.trending_snippets('day', now=self.at(recompute)), [])
+        self.assertTrue(went_negative)
+        self.assertEqual(trending.recompute_trending(now=self.at(81)), 0)
+        self.assertMatchesScratch(self.at(100))
+
+    def test_engagement_during_scoring_stays_dirty(self):
+        trending.record_engagement(self.snippet.pk, views=4, when=self.at(0))
+        snapshot = list(EngagementBucket.objects.filter(is_dirty=True))
+        # More engagement lands after the scorer read the bucket
+        trending.record_engagement(self.snippet.pk, views=3, downloads=1, when=self.at(0.5))
+
+        with transaction.atomic():
+            trending.apply_buckets(self.snippet.pk, snapshot, self.at(1))
+        bucket = EngagementBucket.objects.get()
+        self.assertTrue(bucket.is_dirty)
+        self.assertEqual(bucket.applied_points, engagement_points(4, 0, 0))
+
+        self.assertEqual(trending.recompute_trending(now=self.at(2)), 1)
+        bucket.refresh_from_db()
+        self.assertFalse(bucket.is_dirty)
+        self.assertEqual(bucket.applied_points, engagement_points(7, 1, 0))
+        self.assertMatchesScratch(self.at(2))
+
+    def test_trending_snippets(self):
+        trending.record_engagement(self.snippet.pk, views=2, when=self.at(0))
+        trending.recompute_trending(now=self.at(1))
+        self.assertEqual(trending.trending_snippets('day', now=self.at(2)), [self.snippet])
+        self.assertEqual(trending.trending_snippets('day', now=self.at(30)), [])
+        self.assertEqual(trending.trending_snippets('week', now=self.at(30)), [self.snippet])
+
+
+# ------------------------ JOBS -------------------------
+class JobTests(TestCase):
+    """
+    The database job queue: claiming, retries with backoff, stale
+    requeueing, and the similarity check task.
+    """
+
+    def setUp(self):
+        self.calls = []
+        self.enterContext(mock.patch.dict(jobs.TASKS, {
+            'test.ok': lambda **payload: self.calls.append(payload) or {'ok': True},
+            'test.fail': self.fail_task,
+        }))
+
+    def fail_task(self, **payload):
+        raise ValueError('broken')
+
+    def test_claim_jobs(self):
+        now = timezone.now()
+        first, second, third = (
+            jobs.enqueue('test.ok', {'n': n}) for n in range(3)
+        )
+        Job.objects.filter(pk=first.pk).update(run_after=now - timedelta(minutes=1))
+        later = jobs.enqueue('test.ok', {'n': 'later'})
+        Job.objects.filter(pk=later.pk).update(run_after=now + timedelta(hours=1))
+
+        claimed = jobs.claim_jobs(limit=2)
+        self.assertEqual([job.pk for job in claimed], [first.pk, second.pk])
+        self.assertEqual({(job.status, job.attempts) for job in claimed}, {(Job.STATUS_RUNNING, 1)})
+        self.assertEqual([job.pk for job in jobs.claim_jobs()], [third.pk])
+        self.assertEqual(jobs.claim_jobs(), [])
+
+        self.assertEqual(jobs.run_pending(), 0)
+        jobs.run_job(claimed[0])
+        claimed[0].refresh_from_db()
+        self.assertEqual((claimed[0].status, claimed[0].result), (Job.STATUS_DONE, {'ok': True}))
+        self.assertEqual(self.calls, [{'n': 0}])
+
+    def test_retry_backoff_then_fail(self):
+        job = jobs.enqueue('test.fail', max_attempts=2)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_PENDING, 1))
+        self.assertIn('ValueError: broken', job.last_error)
+        self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), 2, delta=1)
+        self.assertEqual(jobs.run_pending(), 0)   # not due yet
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('codeapp.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 2))
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_unknown_task_fails(self):
+        job = jobs.enqueue('test.missing', max_attempts=1)
+        with self.assertLogs('codeapp.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn("Unknown task 'test.missing'", job.last_error)
+
+    def test_requeue_stale(self):
+        crashed = jobs.enqueue('test.ok')
+        busy = jobs.enqueue('test.ok')
+        jobs.claim_jobs()
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Job.objects.filter(pk=crashed.pk).update(updated_at=an_hour_ago)
+
+        self.assertEqual(jobs.requeue_stale(timedelta(minutes=5)), 1)
+        crashed.refresh_from_db()
+        self.assertEqual(crashed.status, Job.STATUS_PENDING)
+        # A fresh timestamp: the requeue is not itself stale
+        self.assertGreater(crashed.updated_at, an_hour_ago + timedelta(minutes=55))
+        self.assertEqual(Job.objects.get(pk=busy.pk).status, Job.STATUS_RUNNING)
+
+        self.assertEqual([job.pk for job in jobs.claim_jobs()], [crashed.pk])
+        self.assertEqual(Job.objects.get(pk=crashed.pk).attempts, 2)
+
+    def test_requeue_stale_fails_last_attempt(self):
+        last = jobs.enqueue('test.ok', max_attempts=1)
+        retried = jobs.enqueue('test.ok', max_attempts=2)
+        jobs.claim_jobs()
+        Job.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertLogs('codeapp.jobs', 'ERROR'):
+            self.assertEqual(jobs.requeue_stale(timedelta(minutes=5)), 2)
+        last.refresh_from_db()
+        self.assertEqual((last.status, last.attempts), (Job.STATUS_FAILED, 1))
+        self.assertIn('Worker stopped', last.last_error)
+        self.assertEqual(Job.objects.get(pk=retried.pk).status, Job.STATUS_PENDING)
+        # Never claimed again
+        self.assertEqual([job.pk for job in jobs.claim_jobs()], [retried.pk])
+        self.assertEqual(jobs.requeue_stale(timedelta(minutes=5)), 0)
+
+    def test_run_job_id_is_a_fresh_claim(self):
+        job = jobs.enqueue('test.probe')
+        Job.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        requeued = []
+        with mock.patch.dict(jobs.TASKS, {'test.probe': lambda: requeued.append(jobs.requeue_stale(timedelta(minutes=5)))}):
+            jobs.run_job_id(job.pk)
+        # While it ran, the job did not look abandoned
+        self.assertEqual(requeued, [0])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.STATUS_DONE)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.enqueue('test.ok', {'n': 1})
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{'n': 1}])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.STATUS_DONE)
+
+    def test_check_duplicate(self):
+        admins = [User.objects.create_user(f'admin{i}', password='pw', is_staff=True) for i in range(2)]
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        code = 'def total(items):\n    return sum(item.price for item in items)\n'
+        original = CodeSnippet.objects.create(title='Original', language='python', author=alice, code=code)
+        copy = CodeSnippet.objects.create(title='Copy', language='python', author=bob, code=code)
+
+        result = tasks.check_duplicate(copy.pk)
+        self.assertEqual(result, {'duplicate': True, 'score': 100.0, 'other_id': original.pk})
+        reports = Report.objects.filter(snippet=copy)
+        self.assertEqual(reports.count(), len(admins))
+        self.assertIn("with snippet 'Original'", reports.first().reason)
+        for admin in admins:
+            self.assertEqual(Notification.objects.filter(user=admin).count(), 1)
+            self.assertEqual(notify.unread_count(admin), 1)
+        self.assertIn('flagged as similar', Notification.objects.get(user=bob).message)
+
+        other = CodeSnippet.objects.create(title='Other', language='c', author=bob, code='int main(void) { return 1; }\n')
+        self.assertEqual(tasks.check_duplicate(other.pk), {'duplicate': False})
+        copy.soft_delete()
+        self.assertEqual(tasks.check_duplicate(copy.pk), {'skipped': True})
+        self.assertEqual(Report.objects.count(), len(admins))
+
+
+# ------------------------ PERFORMANCE -------------------------
+class PerfTests(TestCase):
+    """
+    PerfMiddleware's per-request records and the /admin/perf/ report.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        cls.snippet = CodeSnippet.objects.create(title='Timed', language='python', author=cls.user, code='x = 1\n')
+
+    def setUp(self):
+        perf.recent().clear()
+        self.addCleanup(perf.recent().clear)
+        self.addCleanup(counters.flush)
+
+    def entry(self, **fields):
+        base = {'view': 'v', 'method': 'GET', 'status': 200, 'duration_ms': 1.0,
+                'queries': 0, 'sql_ms': 0.0, 'slowest': []}
+        return {**base, **fields}
+
+    def test_records_each_request(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('detail', args=[self.snippet.pk]))
+        queries = len(ctx)
+        self.client.get('/no/such/page/')
+
+        detail, missing = perf.recent()
+        self.assertEqual((detail['view'], detail['method'], detail['status']), ('detail', 'GET', 200))
+        self.assertEqual(detail['queries'], queries)
+        self.assertLessEqual(len(detail['slowest']), perf.SLOWEST_KEPT)
+        self.assertGreaterEqual(detail['duration_ms'], detail['sql_ms'])
+        self.assertEqual((missing['view'], missing['status']), ('unresolved', 404))
+
+    @override_settings(PERF_SLOW_QUERY_MS=0)
+    def test_slow_queries_logged(self):
+        with self.assertLogs('codeapp.perf', 'WARNING') as logs:
+            self.client.get(reverse('detail', args=[self.snippet.pk]))
+        self.assertIn('"slow_query"', logs.output[0])
+
+    @override_settings(PERF_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(len(perf.recent()), 0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([perf.percentile(values, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual([perf.percentile([1, 2, 3, 4], p) for p in (25, 50, 51, 95)], [1, 2, 3, 4])
+        self.assertEqual(perf.percentile([7], 99), 7)
+        self.assertEqual(perf.percentile([], 50), 0)
+
+    def test_summary(self):
+        for ms in range(1, 21):
+            perf.recent().append(self.entry(view='fast', duration_ms=ms, queries=ms % 3))
+        perf.recent().append(self.entry(view='slow', duration_ms=500, queries=9, sql_ms=40.0,
+                                        slowest=[{'ms': 40.0, 'sql': 'SELECT 1'}]))
+        slow, fast = perf.summary()
+        self.assertEqual((slow['view'], slow['requests'], slow['p95'], slow['max_queries']), ('slow', 1, 500, 9))
+        self.assertEqual(slow['slowest'], [{'ms': 40.0, 'sql': 'SELECT 1'}])
+        self.assertEqual((fast['requests'], fast['p50'], fast['p95'], fast['p99']), (20, 10, 19, 20))
+        self.assertEqual(fast['avg_queries'], round(sum(ms % 3 for ms in range(1, 21)) / 20, 1))
+
+    def test_report_is_staff_only(self):
+        url = reverse('perf_report')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse('detail', args=[self.snippet.pk]))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<td>detail</td>', html=True)
+
+    def test_log_directory_created_on_first_record(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'logs', 'perf.log')
+        handler = perf.PerfLogHandler(path, delay=True)
+        self.addCleanup(handler.close)
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+        handler.emit(logging.makeLogRecord({'msg': '{"view": "detail"}'}))
+        handler.flush()
+        with open(path) as f:
+            self.assertEqual(f.read(), '{"view": "detail"}\n')
+
+
+# ------------------------ HIGHLIGHTING -------------------------
+@override_settings(DETAIL_CHUNK_LINES=3)
+class HighlightTests(TestCase):
+    """
+    Chunked, cached rendering of long code on the detail page.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.addCleanup(counters.flush)
+
+    def lines(self, count):
+        return ''.join(f'line_{n} = {n}\n' for n in range(1, count + 1))
+
+    def pasted(self, count, **fields):
+        return CodeSnippet.objects.create(title='Lines', language='python', author=self.user,
+                                          code=self.lines(count), **fields)
+
+    def assertChunk(self, chunk, first_line, numbers, has_more, size=3):
+        self.assertEqual((chunk['first_line'], chunk['has_more']), (first_line, has_more))
+        self.assertEqual(chunk['next'], (first_line - 1) // size + 1 if has_more else None)
+        self.assertEqual(re.findall(r'line_(\d+)', chunk['html']), [str(n) for n in numbers])
+
+    def test_chunk_boundaries(self):
+        uploaded = CodeSnippet(title='Lines', language='python', author=self.user)
+        uploaded.file.save('lines.py', ContentFile(self.lines(7).replace('\n', '\r\n').encode()))
+        for snippet in (self.pasted(7), uploaded):
+            with self.subTest(file=bool(snippet.file)):
+                self.assertChunk(highlight.render_chunk(snippet, 0), 1, [1, 2, 3], True)
+                self.assertChunk(highlight.render_chunk(snippet, 1), 4, [4, 5, 6], True)
+                self.assertChunk(highlight.render_chunk(snippet, 2), 7, [7], False)
+                self.assertEqual(highlight.render_chunk(snippet, 3)['html'], '')
+
+        # Exactly two chunks' worth: the second is the last
+        exact = self.pasted(6)
+        self.assertChunk(highlight.render_chunk(exact, 1), 4, [4, 5, 6], False)
+
+    def test_chunk_view(self):
+        snippet = self.pasted(4)
+        response = self.client.get(reverse('snippet_code_chunk', args=[snippet.pk, 1]))
+        self.assertChunk(response.json(), 4, [4], False)
+        self.assertEqual(self.client.get(reverse('snippet_code_chunk', args=[snippet.pk, 2])).status_code, 404)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('detail', args=[snippet.pk]))
+        self.assertContains(response, 'id="showMore"')
+
+    def test_copy_counts_no_download(self):
+        snippet = self.pasted(7)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('detail', args=[snippet.pk]))
+        # Copy loads the remaining chunks, as Show more does, never the download
+        self.assertContains(response, '<button id="copyBtn" class="btn btn-outline-purple">Copy Code</button>', html=True)
+        index = response.context['chunk']['next']
+        while index is not None:
+            index = self.client.get(reverse('snippet_code_chunk', args=[snippet.pk, index])).json()['next']
+        self.assertEqual(counters.pending(snippet.pk, 'downloads'), 0)
+        counters.flush()
+        snippet.refresh_from_db()
+        self.assertEqual((snippet.views, snippet.downloads), (1, 0))
+
+    def test_render_cache_key(self):
+        first, copy = self.pasted(5), self.pasted(5)
+        with mock.patch('codeapp.highlight.to_html', wraps=highlight.to_html) as to_html:
+            highlight.render_chunk(first, 0)
+            highlight.render_chunk(copy, 0)
+            # Keyed by content, not snippet: identical code renders once
+            self.assertEqual(to_html.call_count, 1)
+            key = f'highlight:{highlight.RENDER_VERSION}:{first.content_hash}:python:3:0'
+            self.assertEqual(cache.get(key), highlight.render_chunk(first, 0))
+
+            copy.language = 'c'
+            copy.save()
+            highlight.render_chunk(copy, 0)
+            self.assertEqual(to_html.call_count, 2)
+
+            first.code = self.lines(5).replace('line_1 ', 'changed_1 ')
+            first.save(update_fields=['code'])
+            self.assertIn('changed_1', highlight.render_chunk(first, 0)['html'])
+            self.assertEqual(to_html.call_count, 3)
+
+            with override_settings(DETAIL_CHUNK_LINES=2):
+                self.assertChunk(highlight.render_chunk(first, 1), 3, [3, 4], True, size=2)
+            self.assertEqual(to_html.call_count, 4)
+
+
+# ------------------------ FINGERPRINTS -------------------------
+class FingerprintTests(TestCase):
+    """
+    When save() recomputes the fingerprint, and backfill_fingerprints
+    reindexing everything the save path would.
+    """
+
+    CODE = 'def parse_header(line):\n    return line.split(":", 1)\n'
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.snippet = CodeSnippet.objects.create(title='Header', language='python', author=self.user, code=self.CODE)
+
+    def stored_hash(self):
+        return CodeSnippet.objects.values_list('content_hash', flat=True).get(pk=self.snippet.pk)
+
+    def test_created_snippets_are_fingerprinted(self):
+        self.assertFalse(self.snippet.fingerprint_is_stale)
+        self.assertEqual(self.stored_hash(), hashlib.sha256(self.CODE.encode()).hexdigest())
+        self.assertGreater(self.snippet.token_count, 0)
+
+    def test_when_save_recomputes(self):
+        with mock.patch.object(CodeSnippet, 'refresh_fingerprint', autospec=True,
+                               side_effect=CodeSnippet.refresh_fingerprint) as refresh:
+            snippet = CodeSnippet.objects.get(pk=self.snippet.pk)
+            snippet.title = 'Renamed'
+            snippet.save()
+            snippet.save(update_fields=['title'])
+            self.assertEqual(refresh.call_count, 0)
+
+            # A plain save() of edited code refingerprints and reindexes
+            snippet.code = 'def split_pairs(text):\n    return text.split(",")\n'
+            snippet.save()
+            self.assertEqual(refresh.call_count, 1)
+            self.assertEqual(self.stored_hash(), hashlib.sha256(snippet.code.encode()).hexdigest())
+            self.assertEqual(search_code('split_pairs'), [snippet.pk])
+            self.assertEqual(search_code('parse_header'), [])
+            snippet.save()
+            self.assertEqual(refresh.call_count, 1)
+
+            # So does saving the content through update_fields
+            snippet = CodeSnippet.objects.get(pk=self.snippet.pk)
+            snippet.code = self.CODE
+            snippet.save(update_fields=['code'])
+            self.assertEqual(refresh.call_count, 2)
+            self.assertEqual(self.stored_hash(), hashlib.sha256(self.CODE.encode()).hexdigest())
+
+            # Code search text depends on the language
+            snippet = CodeSnippet.objects.get(pk=self.snippet.pk)
+            snippet.language = 'c'
+            snippet.save()
+            self.assertEqual(refresh.call_count, 3)
+
+            # Replacing the code with a file
+            snippet = CodeSnippet.objects.get(pk=self.snippet.pk)
+            snippet.code = ''
+            snippet.file = SimpleUploadedFile('join.py', b'def join_pairs(pairs):\n    return ",".join(pairs)\n')
+            with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+                snippet.save()
+            self.assertEqual(refresh.call_count, 4)
+            self.assertEqual(search_code('join_pairs'), [snippet.pk])
+
+            # A stale version refingerprints even when nothing changed
+            snippet.fingerprint_version = 0
+            snippet.save()
+            self.assertEqual(refresh.call_count, 5)
+            self.assertFalse(CodeSnippet.objects.get(pk=self.snippet.pk).fingerprint_is_stale)
+
+    @override_settings(SNIPPET_COMPRESSION=True)
+    def test_compressed_code_unchanged(self):
+        compression._active.clear()
+        self.addCleanup(compression._active.clear)
+        code = self.CODE * 5
+        CodeSnippet.objects.filter(pk=self.snippet.pk).update(code=None, code_z=compression.compress(code.encode()))
+        snippet = CodeSnippet.objects.get(pk=self.snippet.pk)
+        self.assertEqual(snippet.code, code)   # decompressed on access
+        self.assertFalse(snippet.content_changed())
+        snippet.code = code + '# more\n'
+        self.assertTrue(snippet.content_changed())
+
+    def test_backfill_reindexes_everything(self):
+        gone = CodeSnippet.objects.create(title='Gone', language='python', author=self.user, code='y = 2\n')
+        gone.soft_delete()
+        CodeSnippet.objects.update(fingerprint_version=0, content_hash='')
+        SnippetSignature.objects.all().delete()
+        SnippetSearchText.objects.all().delete()
+        CodeTrigram.objects.all().delete()
+        search.remove_snippet(self.snippet.pk)
+        self.assertEqual(search_code('parse_header'), [])
+        self.assertEqual(search_snippets('parse'), [])
+
+        out = StringIO()
+        call_command('backfill_fingerprints', stdout=out)
+        self.assertIn('Fingerprinted 2 snippets', out.getvalue())
+        self.assertEqual(self.stored_hash(), hashlib.sha256(self.CODE.encode()).hexdigest())
+        self.assertTrue(SnippetSignature.objects.filter(snippet=self.snippet).exists())
+        self.assertEqual(search_code('parse_header'), [self.snippet.pk])
+        self.assertEqual(search_snippets('parse'), [self.snippet.pk])
+        # Soft-deleted snippets get a fingerprint but stay out of the indexes
+        self.assertFalse(CodeSnippet.objects.get(pk=gone.pk).fingerprint_is_stale)
+        self.assertFalse(SnippetSearchText.objects.filter(snippet=gone).exists())
+
+
+# ------------------------ IMPORT / EXPORT -------------------------
+class ImportExportTests(TestCase):
+    """
+    import_snippets bypasses save() and the post_save signals, so imported
+    rows are checked against what those produced for the originals.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        CodeSnippet.objects.create(title='Reader', language='python', author=self.alice,
+                                   code='def read_csv(path):\n    return open(path).read()  # naive\n')
+        CodeSnippet.objects.create(title='Loop', language='c', author=self.alice,
+                                   code='for (int i = 0; i < n; i++) { total += i; }\n')
+        upload = CodeSnippet(title='Widget', language='javascript', author=self.bob)
+        upload.file.save('widget.js', ContentFile(b'function parseJsonBody(req) { return JSON.parse(req.body); }\n'))
+        CodeSnippet.objects.create(title='Gone', language='python', author=self.bob, code='x = 1\n').soft_delete()
+
+    def export(self, name):
+        path = os.path.join(self.media, name)
+        call_command('export_snippets', path, stdout=StringIO())
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_snippets', path, *args, stdout=out)
+        return out.getvalue()
+
+    def gc(self):
+        out = StringIO()
+        call_command('gc_blobs', '--grace', '0', stdout=out)
+        return out.getvalue()
+
+    def indexed(self, snippet):
+        return (
+            snippet.title, snippet.author_id, snippet.language, snippet.created_at,
+            snippet.content_hash, snippet.token_digest, snippet.token_count, snippet.original_filename,
+            SnippetSignature.objects.get(snippet=snippet).minhash,
+            SnippetSearchText.objects.get(snippet=snippet).text,
+            set(CodeTrigram.objects.filter(snippet=snippet).values_list('trigram', flat=True)),
+            sorted(snippet.lsh_buckets.values_list('band', 'bucket')),
+        )
+
+    def test_round_trip(self):
+        live = CodeSnippet.objects.filter(is_deleted=False).order_by('pk')
+        expected = [self.indexed(snippet) for snippet in live]
+
+        for name in ('snippets.jsonl.gz', 'snippets.tar.gz'):
+            with self.subTest(name):
+                path = self.export(name)
+                CodeSnippet.objects.all().delete()
+                self.assertIn('Imported 3 snippets', self.run_import(path, '--workers', '1'))
+                self.assertEqual(UserStats.objects.get(user=self.alice).snippet_count, 2)
+                self.assertEqual(UserStats.objects.get(user=self.bob).snippet_count, 1)
+                widget = live.get(title='Widget')
+                with widget.file.open('rb') as f:
+                    self.assertIn(b'parseJsonBody', f.read())
+
+    def test_duplicates_in_a_pool(self):
+        path = self.export('snippets.jsonl')
+        output = self.run_import(path, '--workers', '2', '--skip-duplicates')
+        self.assertIn('Imported 0 snippets', output)
+        self.assertIn('3 duplicates skipped', output)
+
+        self.run_import(path, '--workers', '2', '--check-similarity')
+        copy = CodeSnippet.objects.filter(title='Reader').latest('pk')
+        duplicate, score, _ = lsh.find_duplicate(copy)
+        self.assertTrue(duplicate)
+        self.assertEqual(score, 100.0)
+        self.assertEqual(Job.objects.filter(task=CHECK_DUPLICATE).count(), 3)
+
+    def test_unknown_authors(self):
+        path = self.export('snippets.jsonl')
+        User.objects.filter(username='bob').update(username='robert')
+        self.assertIn('1 skipped without an author', self.run_import(path, '--workers', '1'))
+        self.run_import(path, '--workers', '1', '--author', 'alice')
+        self.assertEqual(CodeSnippet.objects.filter(title='Widget', author=self.alice).count(), 1)
+
+    def test_unknown_languages(self):
+        path = os.path.join(self.media, 'languages.jsonl')
+        with archive.writer(path) as write:
+            for language in ('python', 'cobol', '', None):
+                write({'title': f'In {language}', 'language': language, 'author': 'alice',
+                       'filename': '', 'content': b'x = 1\n'})
+        self.assertIn('3 skipped with an unknown language', self.run_import(path, '--workers', '1'))
+        self.assertEqual(CodeSnippet.objects.filter(title__startswith='In ').count(), 1)
+
+    def test_failed_batch_leaves_collectable_blobs(self):
+        content = b'int main(void) { return 0; }\n'
+        path = os.path.join(self.media, 'files.jsonl')
+        with archive.writer(path) as write:
+            write({'title': 'Main', 'language': 'c', 'author': 'alice', 'filename': 'main.c', 'content': content})
+        with mock.patch.object(UserStats, 'adjust', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                self.run_import(path, '--workers', '1')
+        self.assertFalse(CodeSnippet.objects.filter(title='Main').exists())
+
+        name = blob_name(hashlib.sha256(content).hexdigest())
+        self.assertTrue(snippet_storage().exists(name))
+        self.assertEqual(Blob.objects.get(pk=digest_of(name)).refcount, 0)
+        self.assertIn('Deleted 1 unused blobs', self.gc())
+        self.assertFalse(snippet_storage().exists(name))
+
+        self.run_import(path, '--workers', '1')
+        self.assertEqual(Blob.objects.get(pk=digest_of(name)).refcount, 1)
+
+
+# ------------------------ COMPRESSION -------------------------
+@override_settings(SNIPPET_COMPRESSION=True)
+class CompressionTests(TestCase):
+    """
+    Compressed code and blobs read back as the original text and bytes.
+    """
+
+    CODE = 'import os\nimport sys\n\n\ndef main():\n    print(os.getcwd(), sys.argv)\n' * 4
+    BODY = b''.join(b'%06d the quick brown fox\n' % i for i in range(20000))
+
+    def setUp(self):
+        # A fresh blob store per test: identical uploads would share a blob
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.user = User.objects.create_user('alice', password='pw')
+        compression._active.clear()
+        self.addCleanup(compression._active.clear)
+
+    def upload(self, body):
+        snippet = CodeSnippet(title='Big', language='text', author=self.user, original_filename='big.txt')
+        snippet.file.save('big.txt', ContentFile(body))
+        return snippet
+
+    def stored(self, snippet):
+        return CodeSnippet.objects.values_list('code', 'code_z').get(pk=snippet.pk)
+
+    def test_text_field_round_trip(self):
+        plain = CodeSnippet.objects.create(title='Plain', language='python', author=self.user, code=self.CODE)
+        code, payload = self.stored(plain)
+        self.assertIsNone(code)
+        self.assertEqual(compression.HEADER.unpack_from(bytes(payload))[1], 0)
+
+        zdict = CompressionDictionary.objects.create(
+            language='python', data=compression.train_dictionary([self.CODE, self.CODE]),
+        )
+        compression._active.clear()
+        primed = CodeSnippet.objects.create(title='Primed', language='python', author=self.user, code=self.CODE)
+        code, primed_payload = self.stored(primed)
+        self.assertIsNone(code)
+        self.assertEqual(compression.HEADER.unpack_from(bytes(primed_payload))[1], zdict.pk)
+        self.assertLess(len(primed_payload), len(payload))
+
+        compression._by_id.clear()
+        for snippet in (plain, primed):
+            self.assertEqual(CodeSnippet.objects.get(pk=snippet.pk).code, self.CODE)
+
+        tiny = CodeSnippet.objects.create(title='Tiny', language='text', author=self.user, code='x\n')
+        self.assertEqual(self.stored(tiny), ('x\n', None))
+
+    def test_blob_reads_stream(self):
+        snippet = self.upload(self.BODY)
+        storage = snippet_storage()
+        name = snippet.file.name
+        self.assertTrue(storage.is_compressed(name))
+        self.assertLess(os.path.getsize(storage.path(name)), len(self.BODY) // 4)
+        self.assertEqual(storage.size(name), len(self.BODY))
+
+        with storage.open(name) as f:
+            f.seek(-25, os.SEEK_END)
+            self.assertEqual(f.read(), self.BODY[-25:])
+            f.seek(100)   # behind what was inflated: starts over
+            self.assertEqual(f.read(10), self.BODY[100:110])
+        with storage.open(name) as f:
+            self.assertEqual(b''.join(f.chunks()), self.BODY)
+
+        self.assertEqual(highlight.read_lines(snippet, 15000, 2), (['015000 the quick brown fox', '015001 the quick brown fox'], True))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('download', args=[snippet.pk]), headers={'range': 'bytes=300000-300009'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.BODY[300000:300010])
+        counters.flush()
+
+    def test_rewrite(self):
+        snippet = self.upload(self.BODY)
+        storage = snippet_storage()
+        name = snippet.file.name
+
+        storage.rewrite(name, compressed=False)
+        self.assertFalse(storage.is_compressed(name))
+        with open(storage.path(name), 'rb') as f:
+            self.assertEqual(f.read(), self.BODY)
+
+        storage.rewrite(name, compressed=True)
+        self.assertTrue(storage.is_compressed(name))
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), self.BODY)
+
+    def test_compress_snippets_command(self):
+        with override_settings(SNIPPET_COMPRESSION=False):
+            pasted = [
+                CodeSnippet.objects.create(title=f'Script {n}', language='python', author=self.user, code=self.CODE)
+                for n in range(2)
+            ]
+            name = self.upload(self.BODY).file.name
+        storage = snippet_storage()
+        self.assertFalse(storage.is_compressed(name))
+
+        out = StringIO()
+        call_command('compress_snippets', '--train', stdout=out)
+        self.assertIn('Trained python dictionary', out.getvalue())
+        self.assertIn('Compressed code of 2 snippets', out.getvalue())
+        self.assertIn('Compressed 1 stored files', out.getvalue())
+        zdict = CompressionDictionary.objects.get(language='python')
+        for snippet in pasted:
+            code, payload = self.stored(snippet)
+            self.assertIsNone(code)
+            self.assertEqual(compression.HEADER.unpack_from(bytes(payload))[1], zdict.pk)
+            self.assertEqual(CodeSnippet.objects.get(pk=snippet.pk).code, self.CODE)
+        self.assertTrue(storage.is_compressed(name))
+
+        call_command('compress_snippets', '--decompress', stdout=StringIO())
+        for snippet in pasted:
+            self.assertEqual(self.stored(snippet), (self.CODE, None))
+        self.assertFalse(storage.is_compressed(name))
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), self.BODY)
+
+
+class BlobRefcountTests(TestCase):
+    """
+    Blob.refcount follows the snippet rows using each stored file, and
+    gc_blobs repairs and collects from it.
+    """
+
+    BODY = b'def shared():\n    return 42\n'
+
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def upload(self, body, filename='shared.py', title='Shared'):
+        snippet = CodeSnippet(title=title, language='python', author=self.user)
+        snippet.file.save(filename, ContentFile(body))
+        return snippet
+
+    def refcount(self, body):
+        return Blob.objects.get(pk=hashlib.sha256(body).hexdigest()).refcount
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_blobs', '--grace', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload(self.BODY, 'a.py')
+        second = self.upload(self.BODY, 'b.py')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self.refcount(self.BODY), 2)
+        blob_dir = os.path.dirname(snippet_storage().path(first.file.name))
+        self.assertEqual(os.listdir(blob_dir), [hashlib.sha256(self.BODY).hexdigest()])
+
+    def test_replace_file_in_admin(self):
+        snippet = self.upload(self.BODY)
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        url = reverse('admin:codeapp_codesnippet_change', args=[snippet.pk])
+        form = self.client.get(url).context['adminform'].form
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'file'}
+        data['author'] = self.user.pk
+        data['file'] = SimpleUploadedFile('new.py', b'def replaced():\n    return 0\n')
+
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.original_filename, 'new.py')
+        self.assertEqual(self.refcount(self.BODY), 0)
+        self.assertEqual(self.refcount(b'def replaced():\n    return 0\n'), 1)
+
+        self.assertIn('Deleted 1 unused blobs', self.gc())
+        with snippet.file.open('rb') as f:
+            self.assertEqual(f.read(), b'def replaced():\n    return 0\n')
+
+    def test_soft_and_hard_delete(self):
+        kept = self.upload(self.BODY, title='Kept')
+        gone = self.upload(self.BODY, title='Gone')
+        name = gone.file.name
+
+        gone.soft_delete()
+        self.assertEqual(self.refcount(self.BODY), 2)
+        gone.delete()
+        self.assertEqual(self.refcount(self.BODY), 1)
+        self.assertIn('Deleted 0 unused blobs', self.gc())
+
+        kept.delete()
+        self.assertEqual(self.refcount(self.BODY), 0)
+        self.assertIn(f'Deleted 1 unused blobs ({len(self.BODY)} bytes)', self.gc())
+        self.assertFalse(snippet_storage().exists(name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_recount(self):
+        snippet = self.upload(self.BODY)
+        Blob.objects.update(refcount=0)
+        self.assertIn('Fixed 1 reference counts', self.gc('--recount'))
+        self.assertEqual(self.refcount(self.BODY), 1)
+        self.assertTrue(snippet_storage().exists(snippet.file.name))
+
+        Blob.objects.all().delete()
+        self.gc('--recount')
+        self.assertEqual(self.refcount(self.BODY), 1)
+        self.assertEqual(Blob.objects.get().size, len(self.BODY))
+
+    def test_adopt(self):
+        snippet = CodeSnippet.objects.create(title='Legacy', language='python', author=self.user, code='x = 1\n')
+        legacy = os.path.join(self.media, 'snippets', 'old.py')
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, 'wb') as f:
+            f.write(self.BODY)
+        CodeSnippet.objects.filter(pk=snippet.pk).update(file='snippets/old.py', code='')
+
+        self.assertIn('Adopted 1 legacy uploads', self.gc('--adopt'))
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.file.name, blob_name(hashlib.sha256(self.BODY).hexdigest()))
+        self.assertEqual(snippet.original_filename, 'old.py')
+        self.assertEqual(self.refcount(self.BODY), 1)
+        self.assertFalse(os.path.exists(legacy))
+        with snippet.file.open('rb') as f:
+            self.assertEqual(f.read(), self.BODY)
+
+
+# ------------------------ CODE SEARCH -------------------------
+class CodeSearchTests(TestCase):
+    """
+    Regex search narrows candidates by the literals every match must
+    contain; a wrong literal silently drops matching snippets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user = User.objects.create_user('alice', password='pw')
+        cls.plain = CodeSnippet.objects.create(title='Plain', language='python', author=user, code='bar = load_value()\n')
+        cls.prefixed = CodeSnippet.objects.create(title='Prefixed', language='python', author=user, code='foobar = 2\n')
+        cls.caps = CodeSnippet.objects.create(title='Caps', language='c', author=user, code='int MaxValue = 10;\n')
+
+    def test_required_literals(self):
+        cases = {
+            'read_csv': ['read_csv'],
+            r'def\s+main': ['def', 'main'],
+            '(abc)?def': ['def'],
+            'ab|cd': [],
+            '(?P<name>abc)': ['abc'],
+            '(?:hello)world': ['hello', 'world'],
+            '(?i)select': ['select'],
+            '(?P=name)xyz': ['xyz'],
+            '(?#note)abc': ['abc'],
+            '(?!foo)bar': [],
+            'foo(?=bar)': [],
+            '(?<=def )name': [],
+            '(?<!x)abc': [],
+        }
+        for pattern, literals in cases.items():
+            with self.subTest(pattern):
+                self.assertEqual(required_literals(pattern), literals)
+
+    def test_compile_query(self):
+        matcher, literals = compile_query('  load_value ')
+        self.assertEqual(literals, ['load_value'])
+        self.assertTrue(matcher.flags & re.IGNORECASE)
+        # Smart case: capitals make it case-sensitive
+        matcher, _ = compile_query('MaxValue')
+        self.assertFalse(matcher.flags & re.IGNORECASE)
+        self.assertEqual(compile_query('ab'), (re.compile('ab', re.IGNORECASE), []))
+        with self.assertRaises(re.error):
+            compile_query('(unclosed', regex=True)
+
+    def test_search_code(self):
+        self.assertEqual(search_code('bar'), [self.prefixed.pk, self.plain.pk])
+        self.assertEqual(search_code('MaxValue'), [self.caps.pk])
+        self.assertEqual(search_code('maxvalue'), [self.caps.pk])
+        self.assertEqual(search_code('MAXVALUE'), [])
+        self.assertEqual(search_code('bar', languages=['c']), [])
+        self.assertEqual(search_code(r'^bar\b', regex=True), [self.plain.pk])
+
+    def test_search_code_extension_groups(self):
+        self.assertEqual(search_code('(?!foo)bar', regex=True), [self.prefixed.pk, self.plain.pk])
+        self.assertEqual(search_code('(?<!foo)bar', regex=True), [self.plain.pk])
+        self.assertEqual(search_code('(?P<name>load)_value', regex=True), [self.plain.pk])
+        self.assertEqual(search_code('(?i)maxvalue', regex=True), [self.caps.pk])
+
+    def test_pathological_regex_rejected(self):
+        # Each would backtrack for ages on a long run of a's without the b
+        for pattern in ('(a+)+b', r'(\w*)*b', '(a|aa)+b', '((ab)*c)+', 'x(a+){2,}b', 'a' * 201):
+            with self.subTest(pattern=pattern[:20]), self.assertRaises(re.error):
+                search_code(pattern, regex=True)
+        for pattern in ('(foo)+bar', '(a+)?b', r'\(a+\)+', '[(a+)]+', 'a' * 200):
+            with self.subTest(pattern=pattern[:20]):
+                compile_query(pattern, regex=True)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('browse'), {'search': '(a+)+b', 'mode': 'regex'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Invalid regular expression')
+        self.assertEqual(len(response.context['snippets']), 0)
+
+    def test_regex_candidates_capped(self):
+        with mock.patch('codeapp.codesearch.MAX_REGEX_CANDIDATES', 1):
+            self.assertEqual(search_code('bar', regex=True), [self.prefixed.pk])
+        self.assertEqual(search_code('bar', regex=True), [self.prefixed.pk, self.plain.pk])
+
+
+# ------------------------ SIMILARITY INDEX -------------------------
+class SimilarityIndexTests(TestCase):
+    """
+    MinHash signatures, LSH banding and find_duplicate.
+    """
+
+    TOKENS = [f'tok{i}' for i in range(40)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def snippet(self, tokens, title='Snippet'):
+        return CodeSnippet.objects.create(title=title, language='python', author=self.user, code=' '.join(tokens) + '\n')
+
+    def pair(self, shared, only_each):
+        """
+        Token sets with Jaccard similarity shared / (shared + 2 * only_each).
+        """
+        common = [f'c{i}' for i in range(shared)]
+        return common + [f'a{i}' for i in range(only_each)], common + [f'b{i}' for i in range(only_each)]
+
+    def test_signature(self):
+        signature = minhash_signature(self.TOKENS)
+        self.assertEqual(len(signature), NUM_PERM)
+        self.assertEqual(minhash_signature(list(reversed(self.TOKENS)) + ['tok0']), signature)
+        self.assertEqual(minhash_signature([]), [])
+        self.assertEqual(estimate_similarity(signature, signature), 100)
+        self.assertLess(estimate_similarity(signature, minhash_signature(['other', 'tokens'])), 10)
+        self.assertEqual(estimate_similarity(signature, []), 0)
+
+    def test_banding(self):
+        signature = minhash_signature(self.TOKENS)
+        buckets = list(band_hashes(signature))
+        self.assertEqual([band for band, _ in buckets], list(range(BANDS)))
+        # Only the first BANDS * ROWS values are banded
+        tail = signature[:BANDS * ROWS] + [0] * (NUM_PERM - BANDS * ROWS)
+        self.assertEqual(list(band_hashes(tail)), buckets)
+        self.assertEqual(list(band_hashes(signature[:-1])), [])
+
+    def test_candidate_rates(self):
+        def collisions(shared, only_each, pairs=40):
+            hits = 0
+            for n in range(pairs):
+                a, b = self.pair(shared, only_each)
+                a, b = [f'{t}_{n}' for t in a], [f'{t}_{n}' for t in b]
+                hits += bool(set(band_hashes(minhash_signature(a))) & set(band_hashes(minhash_signature(b))))
+            return hits
+
+        # ~1.4% expected at 30%, ~99.9% at 85%
+        self.assertLessEqual(collisions(30, 35), 4)
+        self.assertGreaterEqual(collisions(85, 7), 38)
+
+    def test_find_duplicate_threshold(self):
+        original = self.snippet(self.TOKENS, 'Original')
+        near = self.snippet(self.TOKENS[:-2] + ['new1', 'new2'], 'Near')
+        unrelated = self.snippet([f'x{i}' for i in range(40)], 'Unrelated')
+
+        duplicate, score, other = lsh.find_duplicate(near)
+        self.assertTrue(duplicate)
+        self.assertGreaterEqual(score, 70)
+        self.assertEqual(other, original)
+        self.assertEqual(lsh.find_duplicate(unrelated), (False, 0, None))
+        # A stricter threshold than the estimate rejects it
+        self.assertFalse(lsh.find_duplicate(near, threshold=99)[0])
+
+    def test_exact_copy_is_100(self):
+        original = self.snippet(self.TOKENS)
+        copy = self.snippet(self.TOKENS)
+        self.assertEqual(lsh.find_duplicate(copy), (True, 100.0, original))
+
+    def test_soft_delete_and_restore(self):
+        original = self.snippet(self.TOKENS, 'Original')
+        near = self.snippet(self.TOKENS[:-2] + ['new1', 'new2'], 'Near')
+        buckets = sorted(original.lsh_buckets.values_list('band', 'bucket'))
+        self.assertEqual(len(buckets), BANDS)
+
+        original.soft_delete()
+        self.assertFalse(original.lsh_buckets.exists())
+        self.assertTrue(SnippetSignature.objects.filter(snippet=original).exists())
+        self.assertFalse(lsh.find_duplicate(near)[0])
+
+        original.restore()
+        self.assertEqual(sorted(original.lsh_buckets.values_list('band', 'bucket')), buckets)
+        self.assertEqual(lsh.find_duplicate(near)[2], original)
+
+
+# ------------------------ COUNTERS -------------------------
+class CounterTests(TestCase):
+    """
+    Buffered view/download counters and their flush.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.a, cls.b, cls.c = (
+            CodeSnippet.objects.create(title=t, language='python', author=cls.user, code=f'{t} = 1\n')
+            for t in ('a', 'b', 'c')
+        )
+
+    def setUp(self):
+        counters.flush()
+
+    def tearDown(self):
+        counters.flush()
+
+    def counts(self, snippet):
+        snippet.refresh_from_db(fields=['views', 'downloads'])
+        return snippet.views, snippet.downloads
+
+    def test_flush_groups_f_updates(self):
+        counters.incr(self.a.pk, 'views')
+        counters.incr(self.b.pk, 'views')
+        counters.incr(self.c.pk, 'views', 2)
+        counters.incr(self.c.pk, 'downloads')
+        self.assertEqual(counters.pending(self.c.pk, 'views'), 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(counters.flush(), 3)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "codeapp_codesnippet"')]
+        # One UPDATE per distinct (views, downloads) increment
+        self.assertEqual(len(updates), 2)
+        self.assertEqual([self.counts(s) for s in (self.a, self.b, self.c)], [(1, 0), (1, 0), (2, 1)])
+        self.assertEqual(counters.pending(self.c.pk, 'views'), 0)
+        self.assertEqual(UserStats.objects.get(user=self.user).download_count, 1)
+
+    def test_failed_flush_keeps_increments(self):
+        counters.incr(self.a.pk, 'views')
+        with mock.patch('codeapp.counters.record_engagement', side_effect=DatabaseError('down')):
+            with self.assertLogs('codeapp.counters', 'ERROR'):
+                self.assertEqual(counters.flush(), 0)
+        self.assertEqual(self.counts(self.a), (0, 0))
+        self.assertEqual(counters.pending(self.a.pk, 'views'), 1)
+
+        counters.incr(self.a.pk, 'views')
+        counters.flush()
+        self.assertEqual(self.counts(self.a), (2, 0))
+
+    def test_counters_flushed_signal(self):
+        batches = []
+
+        def receiver(sender, batch, **kwargs):
+            batches.append(batch)
+
+        counters.counters_flushed.connect(receiver)
+        self.addCleanup(counters.counters_flushed.disconnect, receiver)
+        counters.incr(self.a.pk, 'downloads', 3)
+        counters.flush()
+        counters.flush()   # nothing pending, no signal
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0][self.a.pk]['downloads'], 3)
+
+    @override_settings(COUNTER_FLUSH_THRESHOLD=2)
+    def test_threshold_flushes(self):
+        counters.incr(self.a.pk, 'views')
+        self.assertEqual(self.counts(self.a), (0, 0))
+        counters.incr(self.b.pk, 'views')
+        self.assertEqual(self.counts(self.a), (1, 0))
+
+    @override_settings(COUNTER_FLUSH_INTERVAL=0.01)
+    def test_periodic_flush(self):
+        flushed = threading.Event()
+        with mock.patch('codeapp.counters.flush', side_effect=lambda: flushed.set()):
+            counters.start_flusher()
+            try:
+                self.assertTrue(flushed.wait(5))
+            finally:
+                counters.stop_flusher()
+
+
+# ------------------------ PAGINATION -------------------------
+class KeysetPaginationTests(TestCase):
+    """
+    KeysetPaginator walks both sort keys in both directions, ties included.
+    """
+
+    PER_PAGE = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        now = timezone.now()
+        for i in range(23):
+            snippet = CodeSnippet.objects.create(title=f's{i}', language='python', author=cls.user, code=f's{i} = 1\n')
+            # Three snippets per views value, two per timestamp
+            CodeSnippet.objects.filter(pk=snippet.pk).update(views=i // 3, created_at=now - timedelta(hours=i // 2))
+
+    def paginator(self, field):
+        snippets = CodeSnippet.objects.filter(is_deleted=False)
+        return KeysetPaginator(snippets, field, self.PER_PAGE, snippets.count())
+
+    def expected(self, field):
+        return list(CodeSnippet.objects.order_by(f'-{field}', '-pk').values_list('pk', flat=True))
+
+    def test_walk_forward_and_back(self):
+        for field in ('created_at', 'views'):
+            with self.subTest(field=field):
+                paginator = self.paginator(field)
+                pages, page = [], paginator.page()
+                while True:
+                    pages.append([s.pk for s in page])
+                    if not page.has_next():
+                        break
+                    page = paginator.page(after=page.next_cursor, number=page.next_page_number())
+                self.assertEqual([len(p) for p in pages], [5, 5, 5, 5, 3])
+                self.assertEqual(sum(pages, []), self.expected(field))
+                self.assertEqual(page.number, 5)
+
+                back = []
+                while page.has_previous():
+                    page = paginator.page(before=page.prev_cursor, number=page.previous_page_number())
+                    back.append([s.pk for s in page])
+                self.assertEqual(back, pages[-2::-1])
+                self.assertEqual(page.number, 1)
+
+    def test_bad_cursor_is_page_one(self):
+        garbage = [
+            '!!!', 'bm90IGpzb24', encode_cursor('yesterday', 1), encode_cursor([1], 1), encode_cursor(None, 1),
+            encode_cursor(5, 'x'), encode_cursor(10 ** 30, 1), encode_cursor(5, 10 ** 30),
+            base64.urlsafe_b64encode(b'{"a": 1, "b": 2}').decode(), base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        for field in ('created_at', 'views'):
+            first = self.expected(field)[:self.PER_PAGE]
+            for cursor in garbage:
+                for param in ('after', 'before'):
+                    with self.subTest(field=field, cursor=cursor, param=param):
+                        page = self.paginator(field).page(**{param: cursor}, number=4)
+                        self.assertEqual([s.pk for s in page], first)
+                        self.assertEqual(page.number, 1)
+                        self.assertFalse(page.has_previous())
+
+    def test_browse_sorted_by_views(self):
+        self.client.force_login(self.user)
+        url = reverse('browse')
+        seen, params = [], {'sort': 'views'}
+        while True:
+            page = self.client.get(url, params).context['snippets']
+            seen += [s.pk for s in page]
+            if not page.has_next():
+                break
+            params = {'sort': 'views', 'after': page.next_cursor, 'page': page.next_page_number()}
+        self.assertEqual(seen, self.expected('views'))
+
+        response = self.client.get(url, {'sort': 'views', 'after': 'garbage', 'page': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['snippets'].number, 1)
+
+
+# ------------------------ NOTIFICATIONS -------------------------
+class NotificationTests(TestCase):
+    """
+    The keyset-paged inbox and compact_notifications.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.now = timezone.now()
+
+    def send(self, count, is_read=False, age=timedelta(0), ties=1):
+        """
+        `count` notifications, `ties` of them per created_at, newest last.
+        """
+        notes = notify.send_each((self.user.pk, f'note {i}') for i in range(count))
+        for i, note in enumerate(notes):
+            created = self.now - age - timedelta(minutes=(count - i) // ties)
+            Notification.objects.filter(pk=note.pk).update(created_at=created, is_read=is_read)
+        if is_read:
+            notify.adjust_unread({self.user.pk: -count})
+        return [note.pk for note in notes]
+
+    def inbox(self, **params):
+        response = self.client.get(reverse('notifications'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['notes']
+
+    def test_inbox_pages_and_marks_only_visible(self):
+        ids = self.send(45, ties=3)
+        expected = list(Notification.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.client.force_login(self.user)
+
+        pages, page = [], self.inbox()
+        while True:
+            pages.append([note.pk for note in page])
+            # Shown as they were, and only what was shown is now read
+            self.assertTrue(all(not note.is_read for note in page))
+            self.assertEqual(Notification.objects.filter(is_read=False).count(), 45 - sum(map(len, pages)))
+            self.assertEqual(UserStats.objects.get(user=self.user).unread_count, 45 - sum(map(len, pages)))
+            if not page.has_next():
+                break
+            page = self.inbox(after=page.next_cursor, page=page.next_page_number())
+        self.assertEqual([len(p) for p in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(sorted(expected), sorted(ids))
+
+        back = self.inbox(before=page.prev_cursor, page=page.previous_page_number())
+        self.assertEqual([note.pk for note in back], pages[1])
+        self.assertTrue(back.has_next())
+
+    def test_unread_filter_pages(self):
+        self.send(5, is_read=True)
+        unread = self.send(3)
+        self.client.force_login(self.user)
+        page = self.inbox(show='unread')
+        self.assertEqual(sorted(note.pk for note in page), sorted(unread))
+        self.assertFalse(page.has_next())
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def compact(self, *args):
+        out = StringIO()
+        call_command('compact_notifications', *args, stdout=out)
+        return out.getvalue()
+
+    def test_compact_expires_and_caps_read_only(self):
+        old_read = self.send(3, is_read=True, age=timedelta(days=40))
+        old_unread = self.send(2, age=timedelta(days=40))
+        recent_read = self.send(5, is_read=True)
+
+        self.assertIn('Would remove 3 expired and 3 over-limit', self.compact('--days=30', '--keep=2', '--dry-run'))
+        self.assertEqual(Notification.objects.count(), 10)
+
+        archive = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'notes.jsonl.gz')
+        out = self.compact('--days=30', '--keep=2', '--batch-size=2', f'--archive={archive}')
+        self.assertIn('Removed 3 expired and 3 over-limit', out)
+        # The newest two read ones and every unread one survive
+        self.assertEqual(
+            sorted(Notification.objects.values_list('pk', flat=True)),
+            sorted(old_unread + recent_read[-2:]),
+        )
+        with gzip.open(archive, 'rt', encoding='utf-8') as f:
+            archived = [json.loads(line)['id'] for line in f]
+        self.assertEqual(sorted(archived), sorted(old_read + recent_read[:3]))
+
+    def test_compact_archives_only_deleted_rows(self):
+        ids = self.send(3, is_read=True)
+        rows = list(Notification.objects.filter(pk__in=ids).order_by('pk').values(*compact_notifications.FIELDS))
+        # Flipped back to unread after the batch was read
+        Notification.objects.filter(pk=ids[0]).update(is_read=False)
+
+        command = compact_notifications.Command()
+        command.archive = StringIO()
+        self.assertEqual(command.remove(rows), 2)
+        archived = [json.loads(line)['id'] for line in command.archive.getvalue().splitlines()]
+        self.assertEqual(archived, ids[1:])
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), ids[:1])
+
+
+# ------------------------ CONTRIBUTOR STATS -------------------------
+class ContributorStatsTests(TestCase):
+    """
+    The incremental UserStats updates agree with rebuild_contributor_stats.
+    """
+
+    FIELDS = ('snippet_count', 'deleted_count', 'download_count', 'report_count')
+
+    def setUp(self):
+        counters.flush()
+        self.addCleanup(counters.flush)
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+
+    def create(self, title, author=None, **kwargs):
+        return CodeSnippet.objects.create(
+            title=title, language='python', author=author or self.alice, code=f'{title} = 1\n', **kwargs,
+        )
+
+    def stats(self):
+        return {
+            row['user']: tuple(row[f] for f in self.FIELDS)
+            for row in UserStats.objects.values('user', *self.FIELDS)
+        }
+
+    def assertMatchesRebuild(self, expected=None):
+        incremental = self.stats()
+        out = StringIO()
+        call_command('rebuild_contributor_stats', batch_size=1, stdout=out)
+        self.assertIn(f'Rebuilt stats for {User.objects.count()} users.', out.getvalue())
+        self.assertEqual(incremental, self.stats())
+        if expected is not None:
+            self.assertEqual(incremental[self.alice.pk], expected)
+
+    def report(self, snippet):
+        self.client.force_login(self.bob)
+        self.client.post(reverse('report_snippet', args=[snippet.pk]), {'reason': 'spam'})
+
+    def test_create_delete_restore_and_flush(self):
+        first, second = self.create('first'), self.create('second')
+        self.create('other', author=self.bob)
+        self.create('hidden', is_deleted=True)
+        self.assertMatchesRebuild((2, 1, 0, 0))
+
+        counters.incr(first.pk, 'downloads', 3)
+        counters.incr(second.pk, 'downloads')
+        counters.flush()
+        self.report(first)
+        self.assertMatchesRebuild((2, 1, 4, 1))
+
+        first.refresh_from_db()
+        first.soft_delete()
+        self.assertMatchesRebuild((1, 2, 1, 0))
+        # Downloads of a deleted snippet stay off the leaderboard
+        counters.incr(first.pk, 'downloads')
+        counters.flush()
+        self.assertMatchesRebuild((1, 2, 1, 0))
+
+        first.refresh_from_db()
+        first.restore()
+        self.assertMatchesRebuild((2, 1, 5, 1))
+
+        first.delete()
+        second.refresh_from_db()
+        second.soft_delete()
+        second.delete()
+        self.assertMatchesRebuild((0, 1, 0, 0))
+
+    def test_rebuild_repairs_drift(self):
+        self.create('first')
+        UserStats.objects.filter(user=self.alice).update(snippet_count=7, report_count=3)
+        call_command('rebuild_contributor_stats', stdout=StringIO())
+        self.assertEqual(self.stats()[self.alice.pk], (1, 0, 0, 0))
+
+    def test_admin_toggles_is_deleted(self):
+        snippet = self.create('first')
+        counters.incr(snippet.pk, 'downloads', 2)
+        counters.flush()
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        url = reverse('admin:codeapp_codesnippet_change', args=[snippet.pk])
+
+        def post(**changes):
+            form = self.client.get(url).context['adminform'].form
+            data = {name: value for name, value in form.initial.items() if value is not None and name != 'file'}
+            data['author'] = self.alice.pk
+            data.update(changes)
+            if not data.get('is_deleted'):
+                data.pop('is_deleted', None)
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+
+        post(is_deleted='on', title='renamed')
+        snippet.refresh_from_db()
+        self.assertEqual((snippet.title, snippet.is_deleted), ('renamed', True))
+        self.assertIsNotNone(snippet.deleted_at)
+        self.assertMatchesRebuild((0, 1, 0, 0))
+
+        post(is_deleted=False)
+        snippet.refresh_from_db()
+        self.assertFalse(snippet.is_deleted)
+        self.assertMatchesRebuild((1, 0, 2, 0))
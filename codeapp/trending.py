@@ -0,0 +1,133 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import home_cache
+from .models import CodeSnippet, EngagementBucket, TrendingScore
+from .algorithms.popularity import TRENDING_WINDOWS, engagement_points, decay
+
+
+def hours_between(earlier, later):
+    return (later - earlier).total_seconds() / 3600
+
+
+def bucket_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+# ------------------------ RECORDING -------------------------
+def record_engagement(snippet_id, views=0, downloads=0, reports=0, when=None):
+    """
+    Adds engagement to the snippet's bucket for the current hour.
+    """
+    hour = bucket_hour(when or timezone.now())
+    changes = {
+        'views': F('views') + views,
+        'downloads': F('downloads') + downloads,
+        'reports': F('reports') + reports,
+        'is_dirty': True,
+    }
+
+    bucket = EngagementBucket.objects.filter(snippet_id=snippet_id, hour=hour)
+    if bucket.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            EngagementBucket.objects.create(
+                snippet_id=snippet_id, hour=hour,
+                views=views, downloads=downloads, reports=reports,
+            )
+    except IntegrityError:
+        # Another request created this hour's bucket first
+        bucket.update(**changes)
+
+
+# ------------------------ SCORING -------------------------
+def recompute_trending(now=None):
+    """
+    Folds dirty buckets into each snippet's decayed scores.
+    Only snippets with new engagement are touched; returns how many.
+    """
+    now = now or timezone.now()
+    dirty = EngagementBucket.objects.filter(is_dirty=True).order_by('snippet_id', 'hour')
+
+    updated = 0
+    for snippet_id, buckets in groupby(dirty.iterator(), key=lambda b: b.snippet_id):
+        with transaction.atomic():
+            apply_buckets(snippet_id, list(buckets), now)
+        updated += 1
+
+    if updated:
+        home_cache.invalidate(home_cache.TRENDING)
+    return updated
+
+
+def apply_buckets(snippet_id, buckets, now):
+    score = TrendingScore.objects.select_for_update().filter(snippet_id=snippet_id).first()
+    if score is None:
+        score = TrendingScore(snippet_id=snippet_id, scored_at=now, last_engaged_at=buckets[-1].hour)
+
+    # Bring the stored scores forward to now, then add the new points,
+    # each decayed from the middle of the hour they happened in.
+    elapsed = hours_between(score.scored_at, now)
+    day_score = decay(score.day_score, elapsed, TRENDING_WINDOWS['day'][1])
+    week_score = decay(score.week_score, elapsed, TRENDING_WINDOWS['week'][1])
+
+    for bucket in buckets:
+        points = engagement_points(bucket.views, bucket.downloads, bucket.reports)
+        delta = points - bucket.applied_points
+        age = hours_between(bucket.hour + timedelta(minutes=30), now)
+        day_score += decay(delta, age, TRENDING_WINDOWS['day'][1])
+        week_score += decay(delta, age, TRENDING_WINDOWS['week'][1])
+
+        # Stay dirty if more engagement arrived while we were scoring
+        cleaned = EngagementBucket.objects.filter(
+            pk=bucket.pk, views=bucket.views, downloads=bucket.downloads, reports=bucket.reports,
+        ).update(applied_points=points, is_dirty=False)
+        if not cleaned:
+            EngagementBucket.objects.filter(pk=bucket.pk).update(applied_points=points)
+
+    # Unclamped: reports can take a score below zero, and clamping here
+    # would lose them from every later step (trending_snippets skips <= 0)
+    score.day_score = day_score
+    score.week_score = week_score
+    score.scored_at = now
+    score.last_engaged_at = max(score.last_engaged_at, buckets[-1].hour)
+    score.save()
+
+
+def prune_buckets(keep_hours=TRENDING_WINDOWS['week'][0], now=None):
+    """
+    Deletes applied buckets that are older than the longest window.
+    """
+    cutoff = (now or timezone.now()) - timedelta(hours=keep_hours)
+    deleted, _ = EngagementBucket.objects.filter(hour__lt=cutoff, is_dirty=False).delete()
+    return deleted
+
+
+# ------------------------ LISTS -------------------------
+def trending_snippets(window='day', limit=6, now=None):
+    """
+    Snippets with engagement inside the window, ranked by decayed score.
+    """
+    now = now or timezone.now()
+    window_hours, half_life = TRENDING_WINDOWS[window]
+    field = f'{window}_score'
+
+    rows = TrendingScore.objects.filter(
+        last_engaged_at__gte=now - timedelta(hours=window_hours),
+        snippet__is_deleted=False,
+    ).values_list('snippet_id', field, 'scored_at')
+
+    ranked = sorted(
+        ((decay(value, hours_between(scored_at, now), half_life), snippet_id)
+         for snippet_id, value, scored_at in rows),
+        reverse=True,
+    )
+    top_ids = [snippet_id for value, snippet_id in ranked[:limit] if value > 0]
+
+    snippets = CodeSnippet.objects.in_bulk(top_ids)
+    return [snippets[pk] for pk in top_ids if pk in snippets]
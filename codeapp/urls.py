@@ -8,6 +8,7 @@ urlpatterns = [
     # Browse + Detail
     path('browse/', views.browse, name='browse'),
     path('snippet/<int:pk>/', views.detail, name='detail'),
+    path('snippet/<int:pk>/code/<int:index>/', views.snippet_code_chunk, name='snippet_code_chunk'),
     path('snippet/<int:pk>/report/', views.report_snippet, name='report_snippet'),  # ✅ added
     path('snippet/<int:pk>/delete/', views.delete_snippet, name='delete_snippet'),
 
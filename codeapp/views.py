@@ -1,14 +1,20 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import re
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import HttpResponse, FileResponse
+from django.http import HttpResponse, JsonResponse, Http404
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Sum
+from django.db.models import F, Count, Sum
 from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from django.contrib.admin.views.decorators import staff_member_required
 
-from .models import CodeSnippet, Report, Notification, UserStats
+from .models import CodeSnippet, Report, Notification, UserStats, ContributorStats, Job
 from .forms import (
     CodeSnippetForm,
     RegisterForm,
@@ -18,73 +24,122 @@ from .forms import (
 )
 
 # ------------------------ ALGORITHMS -------------------------
-from .algorithms.popularity import rank_snippets, calculate_popularity
-from .algorithms.similarity import is_duplicate
+from .jobs import enqueue
+from .trending import record_engagement, trending_snippets
+from . import counters, home_cache, perf, highlight, downloads, notify
+from .search import SEARCH_LIMIT, search_snippets, in_rank_order
+from .codesearch import search_code
+from .pagination import KeysetPaginator, approximate_count, aapproximate_count
+from .tasks import CHECK_DUPLICATE
+
+
+async def arender(request, template_name, context):
+    """
+    render() for async views. request.auser() (used by login_required) and
+    request.user cache separately, so the user is shared before the sync
+    context processors would load it a second time.
+    """
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
 
 # ------------------------ HOME -------------------------
 def home(request):
-    q = request.GET.get('q', '')
-    language = request.GET.get('language', '')
-
-    snippets = CodeSnippet.objects.filter(is_deleted=False).order_by('-created_at')
-    if q:
-        snippets = snippets.filter(title__icontains=q)
-    if language:
-        snippets = snippets.filter(language=language)
-
-    all_snippets = list(CodeSnippet.objects.filter(is_deleted=False))
-    featured_snippets = rank_snippets(all_snippets)[:6]
+    # Sections below are lazy: they only hit the database when home.html
+    # misses its {% cache %} fragment (see home_cache for invalidation).
+    # popularity_score is a stored, indexed column (see algorithms.popularity)
+    featured_snippets = CodeSnippet.objects.filter(is_deleted=False).order_by('-popularity_score', '-created_at')[:6]
 
-    recent_uploads = CodeSnippet.objects.order_by('-created_at')[:6]
+    trending_today = SimpleLazyObject(lambda: trending_snippets('day', limit=6))
+    trending_week = SimpleLazyObject(lambda: trending_snippets('week', limit=6))
 
-    contributors = User.objects.annotate(
-        snippet_count=Count('codesnippets'),
-        download_count=Sum('codesnippets__downloads'),
-        report_count=Sum('codesnippets__reports_count')
-    ).order_by('-snippet_count', '-download_count')[:6]
-
-    form = CodeSnippetForm()
+    # Materialized leaderboard (UserStats), maintained incrementally
+    contributors = ContributorStats.objects.top(6)
 
     return render(request, 'codeapp/home.html', {
-        'snippets': snippets,
-        'q': q,
-        'language': language,
         'featured_snippets': featured_snippets,
-        'recent_uploads': recent_uploads,
+        'trending_today': trending_today,
+        'trending_week': trending_week,
         'contributors': contributors,
-        'form': form,
+        'home_cache_timeout': home_cache.timeout(),
     })
 
 
 # ------------------------ BROWSE -------------------------
+BROWSE_PAGE_SIZE = 8
+INBOX_PAGE_SIZE = 20
+PROFILE_NOTIFICATIONS = 5
+DASHBOARD_REPORTS = 5
+
+# Async (like detail and downloads): under ASGI a request waiting on the
+# database or disk holds a coroutine rather than a worker thread.
 @login_required
-def browse(request):
+async def browse(request):
     search_query = request.GET.get('search', '')
     selected_languages = request.GET.getlist('language')
-    sort_by = request.GET.get('sort', 'newest')
+    search_mode = request.GET.get('mode', 'text')
+    sort_by = request.GET.get('sort') or ('relevance' if search_query else 'newest')
+
+    snippets = CodeSnippet.objects.filter(is_deleted=False).select_related('author')
+    if selected_languages:
+        snippets = snippets.filter(language__in=selected_languages)
 
-    snippets = CodeSnippet.objects.filter(is_deleted=False)
+    if search_query and search_mode in ('code', 'regex'):
+        # Substring/regex search over code, narrowed by the trigram index
+        try:
+            ids = await sync_to_async(search_code)(
+                search_query, regex=search_mode == 'regex', languages=selected_languages, limit=SEARCH_LIMIT + 1,
+            )
+        except re.error as e:
+            messages.error(request, f"Invalid regular expression: {e}")
+            ids = []
+    elif search_query:
+        # Full-text search over title, description, language and code
+        ids = await sync_to_async(search_snippets)(search_query, SEARCH_LIMIT + 1)
 
     if search_query:
-        snippets = snippets.filter(title__icontains=search_query)
+        if len(ids) > SEARCH_LIMIT:
+            ids = ids[:SEARCH_LIMIT]
+            messages.info(request, f"Showing the {SEARCH_LIMIT} best matches only; refine the search to see the rest.")
+        snippets = in_rank_order(snippets, ids)
 
-    if selected_languages:
-        snippets = snippets.filter(language__in=selected_languages)
+    sort_field = 'views' if sort_by == 'views' else 'created_at'
 
-    if sort_by == 'views':
-        snippets = snippets.order_by('-views')
+    if search_query:
+        # Search results are capped (SEARCH_LIMIT ids), so plain paging is fine
+        if sort_by != 'relevance':
+            snippets = snippets.order_by(f'-{sort_field}', '-pk')
+        paginator = Paginator(snippets, BROWSE_PAGE_SIZE)
+        page_obj = await sync_to_async(paginator.get_page)(request.GET.get('page'))
+        page_obj.next_cursor = page_obj.prev_cursor = None
+        page_count, approximate = paginator.num_pages, False
     else:
-        snippets = snippets.order_by('-created_at')
-
-    paginator = Paginator(snippets, 8)  # 8 snippets per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        # Keyset pagination on (created_at|views, id), served by the
+        # partial indexes on CodeSnippet; the total is a cached estimate.
+        total = await aapproximate_count(snippets, 'browse', sorted(selected_languages))
+        paginator = KeysetPaginator(snippets, sort_field, BROWSE_PAGE_SIZE, total)
+        try:
+            page_number = int(request.GET.get('page', 1))
+        except ValueError:
+            page_number = 1
+        page_obj = await paginator.apage(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            number=page_number,
+        )
+        page_count, approximate = page_obj.num_pages, True
 
-    languages = CodeSnippet.objects.values_list('language', flat=True).distinct()
+    languages = await cache.aget('browse:languages')
+    if languages is None:
+        live = CodeSnippet.objects.filter(is_deleted=False)
+        languages = [lang async for lang in live.values_list('language', flat=True).distinct().order_by('language')]
+        await cache.aset('browse:languages', languages, 300)
 
-    return render(request, 'codeapp/browse.html', {
+    return await arender(request, 'codeapp/browse.html', {
         'snippets': page_obj,
+        'page_count': page_count,
+        'approximate_count': approximate,
         'search_query': search_query,
+        'search_mode': search_mode,
         'languages': languages,
         'selected_languages': selected_languages,
         'sort_by': sort_by,
@@ -92,31 +147,35 @@ def browse(request):
 
 
 # ------------------------ SNIPPET DETAIL -------------------------
-def detail(request, pk):
-    snippet = get_object_or_404(CodeSnippet, pk=pk, is_deleted=False)
-    snippet.views += 1
-    snippet.save(update_fields=['views'])
+async def detail(request, pk):
+    snippet = await aget_object_or_404(CodeSnippet.objects.select_related('author'), pk=pk, is_deleted=False)
+    # Buffered write-behind counter; show the count including unflushed hits
+    await counters.aincr(snippet.pk, 'views')
+    snippet.views += counters.pending(snippet.pk, 'views')
+
+    # Server-side highlighted, cached per content hash; the rest of a
+    # long file is fetched chunk by chunk from snippet_code_chunk.
+    # Reading the file and highlighting happen off the event loop.
+    chunk = await sync_to_async(highlight.render_chunk)(snippet, 0)
 
-    file_content = None
-    if snippet.file:
-        try:
-            with open(snippet.file.path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-        except Exception as e:
-            file_content = f"Error reading file: {e}"
-
-    if not file_content:
-        file_content = snippet.code
-        
     report_form = ReportForm(request.POST or None)
 
-    return render(request, "codeapp/detail.html", {
+    return await arender(request, "codeapp/detail.html", {
         "snippet": snippet,
-        "file_content": file_content,
+        "chunk": chunk,
+        "highlight_css": highlight.style_css(),
         "report_form": report_form,
     })
 
 
+async def snippet_code_chunk(request, pk, index):
+    snippet = await aget_object_or_404(CodeSnippet, pk=pk, is_deleted=False)
+    chunk = await sync_to_async(highlight.render_chunk)(snippet, index)
+    if index and not chunk['html']:
+        raise Http404("No more code.")
+    return JsonResponse(chunk)
+
+
 # ------------------------ REPORT SNIPPET -------------------------
 @login_required
 def report_snippet(request, pk):
@@ -129,18 +188,16 @@ def report_snippet(request, pk):
             report.reported_by = request.user
             report.resolved = False
             report.save()
+            CodeSnippet.objects.filter(pk=snippet.pk).update(reports_count=F('reports_count') + 1)
+            UserStats.adjust(snippet.author_id, report_count=1)
+            record_engagement(snippet.pk, reports=1)
 
-            Notification.objects.create(
-                user=snippet.author,
-                message=f"Your snippet '{snippet.title}' has been reported. Reason: {report.reason}"
-            )
-
-            admins = User.objects.filter(is_staff=True).exclude(id=snippet.author.id)
-            for admin in admins:
-                Notification.objects.create(
-                    user=admin,
-                    message=f"Snippet '{snippet.title}' was reported by {request.user.username}. Reason: {report.reason}"
-                )
+            admin_ids = User.objects.filter(is_staff=True).exclude(id=snippet.author_id).values_list('id', flat=True)
+            admin_message = f"Snippet '{snippet.title}' was reported by {request.user.username}. Reason: {report.reason}"
+            notify.send_each([
+                (snippet.author_id, f"Your snippet '{snippet.title}' has been reported. Reason: {report.reason}"),
+                *((admin_id, admin_message) for admin_id in admin_ids),
+            ])
 
             messages.success(request, "Snippet reported successfully.")
             return redirect("detail", pk=pk)
@@ -166,23 +223,14 @@ def upload_code(request):
             else:
                 snippet.save()
 
-                # ✅ Similarity check (same extension/language only)
-                all_snippets = CodeSnippet.objects.filter(is_deleted=False).exclude(id=snippet.id)
-                duplicate, score, other = is_duplicate(snippet, all_snippets)
-
-                if duplicate:
-                    admins = User.objects.filter(is_staff=True)
-                    for admin in admins:
-                        Report.objects.create(
-                            snippet=snippet,
-                            reported_by=request.user,
-                            reason=f"Similarity algorithm flagged duplicate (score {score:.1f}% with snippet '{other.title}')"
-                        )
-                        Notification.objects.create(
-                            user=admin,
-                            message=f"Snippet '{snippet.title}' flagged as duplicate of '{other.title}' (score {score:.1f}%)."
-                        )
-                    messages.warning(request, "Your snippet was flagged as similar. Admins will review.")
+                # ✅ Similarity check runs in the background (manage.py run_jobs)
+                enqueue(
+                    CHECK_DUPLICATE,
+                    {'snippet_id': snippet.id},
+                    user=request.user,
+                    label=f"Similarity check for '{snippet.title}'",
+                )
+                messages.info(request, "Snippet uploaded. A similarity check will run shortly.")
 
                 return redirect('home')
     else:
@@ -191,17 +239,22 @@ def upload_code(request):
 
 
 @login_required
-def download_code(request, pk):
-    snippet = get_object_or_404(CodeSnippet, pk=pk, is_deleted=False)
-    if snippet.file:
-        return FileResponse(open(snippet.file.path, 'rb'),
-                            as_attachment=True,
-                            filename=snippet.file.name.split('/')[-1])
-    elif snippet.code:
-        response = HttpResponse(snippet.code, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="{snippet.title}.txt"'
-        return response
-    return HttpResponse("No downloadable content available.")
+async def download_code(request, pk):
+    snippet = await aget_object_or_404(CodeSnippet, pk=pk, is_deleted=False)
+    # Pasted code wins over a file, as in downloads.code_body()
+    if await sync_to_async(lambda: snippet.code)():
+        filename = f"{snippet.title}.txt"
+    elif snippet.file:
+        filename = snippet.original_filename or snippet.file.name.split('/')[-1]
+    else:
+        return HttpResponse("No downloadable content available.")
+
+    # Conditional (ETag/304), ranged and optionally offloaded to the web
+    # server; file bodies stream from worker-thread reads
+    response, counted = await downloads.aserve(request, snippet, filename)
+    if counted:
+        await counters.aincr(snippet.pk, 'downloads')
+    return response
 
 
 # ------------------------ AUTH -------------------------
@@ -241,8 +294,9 @@ def logout_view(request):
 def user_profile(request):
     snippets = CodeSnippet.objects.filter(author=request.user, is_deleted=False)
     recent_snippets = snippets.order_by('-created_at')[:5]
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    unread_count = notifications.filter(is_read=False).count()
+    # Just the newest few; the inbox pages through the rest
+    notifications = Notification.objects.filter(user=request.user).order_by('-created_at', '-pk')[:PROFILE_NOTIFICATIONS]
+    unread_count = notify.unread(request.user.pk)['count']
 
     return render(request, 'codeapp/profile.html', {
         'snippets': snippets,
@@ -255,29 +309,33 @@ def user_profile(request):
 @login_required
 def user_dashboard(request):
     snippets = CodeSnippet.objects.filter(author=request.user, is_deleted=False)
-    reports = Report.objects.filter(snippet__author=request.user).order_by('-created_at')
+    # The latest few; the total is UserStats.report_count
+    reports = (
+        Report.objects.filter(snippet__author=request.user, snippet__is_deleted=False)
+        .select_related('snippet', 'reported_by')
+        .order_by('-created_at', '-pk')[:DASHBOARD_REPORTS]
+    )
     stats, _ = UserStats.objects.get_or_create(user=request.user)
+    jobs = Job.objects.filter(created_by=request.user, task=CHECK_DUPLICATE).order_by('-created_at')[:5]
 
-    total_views = sum(s.views for s in snippets)
-    total_downloads = sum(s.downloads for s in snippets)
+    # One aggregate query instead of loading every snippet
+    totals = snippets.aggregate(count=Count('id'), views=Sum('views'), downloads=Sum('downloads'))
+    total_views = totals['views'] or 0
+    total_downloads = totals['downloads'] or 0
 
     # ✅ Popularity algorithm
-    top_snippet = None
-    top_score = 0
-    if snippets:
-        ranked = rank_snippets(list(snippets))
-        if ranked:
-            top_snippet = ranked[0]
-            top_score = calculate_popularity(top_snippet)
+    top_snippet = snippets.order_by('-popularity_score', '-created_at').first()
+    top_score = top_snippet.popularity_score if top_snippet else 0
 
     return render(request, 'codeapp/dashboard.html', {
-        'snippets': snippets,
+        'snippet_count': totals['count'],
         'reports': reports,
         'stats': stats,
         'total_views': total_views,
         'total_downloads': total_downloads,
         'top_snippet': top_snippet,
         'top_score': top_score,
+        'jobs': jobs,
     })
 
 
@@ -320,8 +378,7 @@ def change_password_dashboard(request):
 @login_required
 def delete_snippet(request, pk):
     snippet = get_object_or_404(CodeSnippet, pk=pk, author=request.user)
-    snippet.is_deleted = True   # soft delete
-    snippet.save(update_fields=["is_deleted"])
+    snippet.soft_delete()
     messages.success(request, f"Snippet '{snippet.title}' deleted successfully.")
     return redirect("user_profile")   # redirect back to profile
 
@@ -340,15 +397,51 @@ def delete_account(request):
 # ------------------------ NOTIFICATIONS -------------------------
 @login_required
 def user_notifications(request):
-    # Mark unread notifications as read when visiting the notifications page
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
-    notes = Notification.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'codeapp/notifications.html', {'notes': notes})
+    show_unread = request.GET.get('show') == 'unread'
+    unread_count = notify.unread(request.user.pk)['count']
+
+    # Keyset pages on (created_at, id), served by the inbox indexes
+    notes = Notification.objects.filter(user=request.user)
+    if show_unread:
+        notes = notes.filter(is_read=False)
+        total = unread_count
+    else:
+        total = approximate_count(notes, 'inbox', request.user.pk)
+    try:
+        page_number = int(request.GET.get('page', 1))
+    except ValueError:
+        page_number = 1
+    page_obj = KeysetPaginator(notes, 'created_at', INBOX_PAGE_SIZE, total).page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        number=page_number,
+    )
+
+    # Only what's on screen counts as read (still shown as unread this time)
+    notify.mark_read(request.user, [note.pk for note in page_obj if not note.is_read])
+
+    return render(request, 'codeapp/notifications.html', {
+        'notes': page_obj,
+        'show_unread': show_unread,
+        'unread_count': unread_count,
+    })
 
 
 @login_required
 def mark_all_read(request):
     if request.method == "POST":
-        Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        notify.mark_all_read(request.user)
         messages.success(request, "All notifications marked as read.")
     return redirect('user_profile')
+
+
+# ------------------------ PERFORMANCE -------------------------
+@staff_member_required
+def perf_report(request):
+    rows = perf.summary()
+    return render(request, 'admin/perf.html', {
+        'title': 'Request performance',
+        'rows': rows,
+        'buffered': sum(r['requests'] for r in rows),
+        'slow_query_ms': perf.setting('PERF_SLOW_QUERY_MS', 100),
+    })
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'codeapp.perf.PerfMiddleware',
+    'codeapp.routers.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,12 +81,62 @@ WSGI_APPLICATION = 'codeshare.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DB_ENGINE=postgres switches to PostgreSQL (POSTGRES_DB, POSTGRES_USER,
+# POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT), with read replicas
+# listed in POSTGRES_REPLICA_HOSTS as "host[:port],...". Otherwise SQLite:
+#
+# SQLite tuned for concurrent use: connections are kept for CONN_MAX_AGE
+# seconds (checked before reuse), transactions take the write lock up front
+# so they wait on busy_timeout instead of failing mid-way, and every
+# connection gets the PRAGMAs in codeapp/sqlite.py (WAL, synchronous=NORMAL,
+# mmap, busy_timeout), which SQLITE_PRAGMAS can override. A second file
+# stands in for a replica; set SQLITE_REPLICA=1 to read from it, and
+# refresh it with `python manage.py sync_replica`.
+#
+# Replicas are mirrors of 'default' under test, so tests see one database.
+if os.environ.get('DB_ENGINE') == 'postgres':
+    POSTGRES = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'codeshare'),
+        'USER': os.environ.get('POSTGRES_USER', 'codeshare'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    DATABASES = {'default': POSTGRES}
+    for i, address in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+        host, _, port = address.strip().partition(':')
+        DATABASES[f'replica{i}'] = {
+            **POSTGRES,
+            'HOST': host,
+            'PORT': port or POSTGRES['PORT'],
+            'TEST': {'MIRROR': 'default'},
+        }
+    DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+else:
+    SQLITE = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
-}
+    DATABASES = {
+        'default': {**SQLITE, 'NAME': BASE_DIR / 'db.sqlite3'},
+        'replica': {**SQLITE, 'NAME': BASE_DIR / 'db-replica.sqlite3', 'TEST': {'MIRROR': 'default'}},
+    }
+    DATABASE_REPLICAS = ['replica'] if os.environ.get('SQLITE_REPLICA') == '1' else []
+
+SQLITE_PRAGMAS = {}
+
+# Reads of codeapp models go to a random replica; writes, and every query
+# in a request after a write or within REPLICA_PIN_SECONDS of one by the
+# same client (read-your-writes across the redirect), go to 'default'.
+DATABASE_ROUTERS = ['codeapp.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
 
 
 # Password validation
@@ -118,19 +172,118 @@ USE_TZ = True
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
-import os
 STATIC_URL  = '/static/'
 STATICFILES_DIRS=[os.path.join(BASE_DIR,'codeapp','static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL='/media/'
 MEDIA_ROOT= os.path.join(BASE_DIR,'media')
 
+# Uploaded snippet files are content addressed (MEDIA_ROOT/blobs/ab/cd/<sha256>)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'snippets': {
+        'BACKEND': 'codeapp.storage.ContentAddressedStorage',
+    },
+}
+
+# Opt-in: store pasted code and uploaded files compressed (zlib, with a
+# per-language preset dictionary for code). Existing data is converted
+# by `manage.py compress_snippets --train`; reads decompress lazily.
+SNIPPET_COMPRESSION = False
+
 LOGIN_URL = '/login/'
 LOGOUT_REDIRECT_URL = '/'
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024
 
+# Cache (per-process memory by default; point at Redis/Memcached in production)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'codeshare',
+    }
+}
+
+# Seconds the cached home page sections live before being rebuilt, on top
+# of the explicit invalidation on snippet changes and counter flushes.
+HOME_CACHE_TIMEOUT = 300
+
+# The navbar's unread notifications are cached per user (dropped whenever
+# one arrives or is read); the dropdown lists the newest few.
+NOTIFICATION_CACHE_TIMEOUT = 300
+NOTIFICATION_DROPDOWN_SIZE = 10
+
+# Retention for `python manage.py compact_notifications` (run it daily):
+# read notifications older than NOTIFICATION_RETENTION_DAYS, and each
+# user's read ones beyond the newest NOTIFICATION_KEEP_READ, are removed.
+# Unread notifications are kept.
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_KEEP_READ = 500
+
+# Background jobs are drained by `python manage.py run_jobs`.
+# Set JOBS_EAGER to run them in-process right after the request commits instead.
+JOBS_EAGER = False
+
+# View/download counters are buffered in memory and flushed as batched
+# F() updates every COUNTER_FLUSH_INTERVAL seconds by a background thread
+# in each web process (and on the next hit once due), or sooner once
+# COUNTER_FLUSH_THRESHOLD snippets have pending increments.
+COUNTER_FLUSH_INTERVAL = 10
+COUNTER_FLUSH_THRESHOLD = 500
+
+# Snippet pages show code highlighted server side (Pygments, if installed)
+# DETAIL_CHUNK_LINES lines at a time; each chunk is cached per content hash.
+DETAIL_CHUNK_LINES = 400
+HIGHLIGHT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Downloads: set DOWNLOAD_OFFLOAD to 'x-sendfile' (Apache/lighttpd) or
+# 'x-accel' (nginx) to let the web server send uploaded files. For nginx,
+# map DOWNLOAD_ACCEL_PREFIX to MEDIA_ROOT in an `internal` location.
+DOWNLOAD_OFFLOAD = None
+DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+# Per-request timing (wall time, query count, SQL time) by URL name.
+# Records go to logs/perf.log and to an in-process buffer of the last
+# PERF_BUFFER_SIZE requests that /admin/perf/ aggregates.
+PERF_ENABLED = True
+PERF_BUFFER_SIZE = 5000
+PERF_SLOW_QUERY_MS = 100
+
+# The directory is created with the file, on the first record. The test
+# runner discards the records instead of appending them to logs/perf.log.
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+TESTING = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'perf_file': {
+            'class': 'codeapp.perf.PerfLogHandler',
+            'filename': os.path.join(LOG_DIR, 'perf.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'codeapp.perf': {
+            'handlers': ['null' if TESTING else 'perf_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
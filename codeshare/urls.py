@@ -18,8 +18,10 @@ from django.contrib import admin
 from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static
+from codeapp.views import perf_report
 
 urlpatterns = [
+    path('admin/perf/', perf_report, name='perf_report'),  # before the admin catch-all
     path('admin/', admin.site.urls),
     path('',include('codeapp.urls'))
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'codeshare.settings')
 
 application = get_wsgi_application()
+
+# Write buffered view/download counts every COUNTER_FLUSH_INTERVAL seconds
+from codeapp import counters  # noqa: E402
+
+counters.start_flusher()